@@ -25,7 +25,9 @@
 coincident triggers.
 """
 
+import os
 import numpy
+import h5py
 import logging
 import copy
 import time as timemod
@@ -41,7 +43,7 @@ from .eventmgr_cython import coincbuffer_numgreater
 from .eventmgr_cython import timecoincidence_constructidxs
 from .eventmgr_cython import timecoincidence_constructfold
 from .eventmgr_cython import timecoincidence_getslideint
-from .eventmgr_cython import timecoincidence_findidxlen
+from .eventmgr_cython import timecoincidence_findrange
 from .eventmgr_cython import timecluster_cython
 
 logger = logging.getLogger('pycbc.events.coinc')
@@ -183,7 +185,28 @@ def timeslide_durations(start1, start2, end1, end2, timeslide_offsets):
     return numpy.array(durations)
 
 
-def time_coincidence(t1, t2, window, slide_step=0):
+def time_sort_order(times):
+    """Return the indices that sort the given times, avoiding to sort them
+    if they are already in increasing order, as is the case for the triggers
+    of each template in files merged with `pycbc_coinc_mergetrigs
+    --sort-by-time`.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Array of times
+
+    Returns
+    -------
+    order : numpy.ndarray
+        Array of indices into times
+    """
+    if len(times) < 2 or (times[1:] >= times[:-1]).all():
+        return numpy.arange(len(times))
+    return times.argsort()
+
+
+def time_coincidence(t1, t2, window, slide_step=0, nthreads=1):
     """ Find coincidences by time window
 
     Parameters
@@ -197,6 +220,9 @@ def time_coincidence(t1, t2, window, slide_step=0):
     slide_step : float (default 0)
         If calculating background coincidences, the interval between background
         slides, arbitrary units (usually s)
+    nthreads : int (default 1)
+        Number of threads between which the time-sorted triggers of the first
+        detector are split when searching for coincidences
 
     Returns
     -------
@@ -218,8 +244,8 @@ def time_coincidence(t1, t2, window, slide_step=0):
         fold1 = t1
         fold2 = t2
 
-    sort1 = fold1.argsort()
-    sort2 = fold2.argsort()
+    sort1 = time_sort_order(fold1)
+    sort2 = time_sort_order(fold2)
     fold1 = fold1[sort1]
     fold2 = fold2[sort2]
 
@@ -228,18 +254,27 @@ def time_coincidence(t1, t2, window, slide_step=0):
         fold2 = numpy.concatenate([fold2 - slide_step, fold2,
                                    fold2 + slide_step])
 
-    left = fold2.searchsorted(fold1 - window)
-    right = fold2.searchsorted(fold1 + window)
+    if nthreads > 1:
+        left = numpy.zeros(len(fold1), dtype=numpy.int64)
+        right = numpy.zeros(len(fold1), dtype=numpy.int64)
+        timecoincidence_findrange(left, right, fold1, fold2, window, nthreads)
+    else:
+        left = fold2.searchsorted(fold1 - window)
+        right = fold2.searchsorted(fold1 + window)
 
-    lenidx = timecoincidence_findidxlen(left, right, len(left))
+    # Position of the coincidences of each trigger in the output arrays
+    counts = right - left
+    offsets = numpy.cumsum(counts) - counts
+    lenidx = counts.sum()
     idx1 = numpy.zeros(lenidx, dtype=numpy.uint32)
     idx2 = numpy.zeros(lenidx, dtype=numpy.uint32)
     timecoincidence_constructidxs(idx1, idx2, sort1, sort2, left, right,
-                                  len(left), len(sort2))
+                                  offsets, nthreads)
 
     slide = numpy.zeros(lenidx, dtype=numpy.int32)
     if slide_step:
-        timecoincidence_getslideint(slide, t1, t2, idx1, idx2, slide_step)
+        timecoincidence_getslideint(slide, t1, t2, idx1, idx2, slide_step,
+                                    nthreads)
     else:
         slide = numpy.zeros(len(idx1))
 
@@ -247,7 +282,7 @@ def time_coincidence(t1, t2, window, slide_step=0):
 
 
 def time_multi_coincidence(times, slide_step=0, slop=.003,
-                           pivot='H1', fixed='L1'):
+                           pivot='H1', fixed='L1', nthreads=1):
     """ Find multi detector coincidences.
 
     Parameters
@@ -264,6 +299,8 @@ def time_multi_coincidence(times, slide_step=0, slop=.003,
         The other ifo used in first stage coincidence, subsequently used as a
         time reference for additional ifos. All other ifos are not time shifted
         relative to this ifo
+    nthreads: int
+        Number of threads used for the first stage coincidence
 
     Returns
     -------
@@ -283,7 +320,8 @@ def time_multi_coincidence(times, slide_step=0, slop=.003,
     # Find coincs between the 'pivot' and 'fixed' detectors as in 2-ifo case
     pivot_id, fix_id, slide = time_coincidence(times[pivot], times[fixed],
                                                win(pivot, fixed),
-                                               slide_step=slide_step)
+                                               slide_step=slide_step,
+                                               nthreads=nthreads)
 
     # Additional detectors do not slide independently of the 'fixed' one
     # Each trigger in an additional detector must be concident with both
@@ -303,7 +341,7 @@ def time_multi_coincidence(times, slide_step=0, slop=.003,
         # otime is extra ifo time in original trigger order
         otime = times[ifo1]
         # tsort gives ordering from original order to time sorted order
-        tsort = otime.argsort()
+        tsort = time_sort_order(otime)
         time1 = otime[tsort]
 
         # Find coincidences between dependent ifo triggers and existing coincs
@@ -355,7 +393,8 @@ def time_multi_coincidence(times, slide_step=0, slop=.003,
     return ids, slide
 
 
-def cluster_coincs(stat, time1, time2, timeslide_id, slide, window, **kwargs):
+def cluster_coincs(stat, time1, time2, timeslide_id, slide, window,
+                   chunk_size=None, **kwargs):
     """Cluster coincident events for each timeslide separately, across
     templates, based on the ranking statistic
 
@@ -373,6 +412,10 @@ def cluster_coincs(stat, time1, time2, timeslide_id, slide, window, **kwargs):
         length of the timeslides offset interval
     window: float
         length to cluster over
+    chunk_size: int, optional
+        If given, cluster the timeslides in chunks of roughly this many
+        coincidences at a time to bound the memory used. The result is the
+        same as clustering all coincidences at once.
 
     Returns
     -------
@@ -390,19 +433,15 @@ def cluster_coincs(stat, time1, time2, timeslide_id, slide, window, **kwargs):
     else:
         time = 0.5 * (time2 + time1)
 
-    tslide = timeslide_id.astype(numpy.longdouble)
-    time = time.astype(numpy.longdouble)
-
-    span = (time.max() - time.min()) + window * 10
-    time = time + span * tslide
     logger.info('Clustering events over %s s window', window)
-    cidx = cluster_over_time(stat, time, window, **kwargs)
+    cidx = cluster_over_slides(stat, time, timeslide_id, window,
+                               chunk_size=chunk_size, **kwargs)
     logger.info('%d triggers remaining', len(cidx))
     return cidx
 
 
 def cluster_coincs_multiifo(stat, time_coincs, timeslide_id, slide, window,
-                            **kwargs):
+                            chunk_size=None, **kwargs):
     """Cluster coincident events for each timeslide separately, across
     templates, based on the ranking statistic
 
@@ -418,26 +457,31 @@ def cluster_coincs_multiifo(stat, time_coincs, timeslide_id, slide, window,
         length of the timeslides offset interval
     window: float
         duration of clustering window in seconds
+    chunk_size: int, optional
+        If given, cluster the timeslides in chunks of roughly this many
+        coincidences at a time to bound the memory used. The result is the
+        same as clustering all coincidences at once.
 
     Returns
     -------
     cindex: numpy.ndarray
         The set of indices corresponding to the surviving coincidences
     """
-    time_coinc_zip = list(zip(*time_coincs))
-    if len(time_coinc_zip) == 0:
+    time_coincs = [numpy.asarray(tc) for tc in time_coincs]
+    if len(time_coincs) == 0 or len(time_coincs[0]) == 0:
         logger.info('No coincident triggers.')
         return numpy.array([])
 
-    time_avg_num = []
-    #find number of ifos and mean time over participating ifos for each coinc
-    for tc in time_coinc_zip:
-        time_avg_num.append(mean_if_greater_than_zero(tc))
-
-    time_avg, num_ifos = zip(*time_avg_num)
-
-    time_avg = numpy.array(time_avg)
-    num_ifos = numpy.array(num_ifos)
+    # find number of ifos and mean time over participating ifos for each
+    # coinc, in the same way as mean_if_greater_than_zero
+    num_ifos = numpy.zeros(len(time_coincs[0]), dtype=int)
+    time_sum = numpy.zeros(len(time_coincs[0]))
+    for tc in time_coincs:
+        above_zero = tc > 0
+        num_ifos += above_zero
+        time_sum += numpy.where(above_zero, tc, 0)
+    time_avg = time_sum / num_ifos
+    del time_sum
 
     # shift all but the pivot ifo by (num_ifos-1) * timeslide_id * slide
     # this leads to a mean coinc time located around pivot time
@@ -445,18 +489,73 @@ def cluster_coincs_multiifo(stat, time_coincs, timeslide_id, slide, window,
         nifos_minusone = (num_ifos - numpy.ones_like(num_ifos))
         time_avg = time_avg + (nifos_minusone * timeslide_id * slide)/num_ifos
 
-    tslide = timeslide_id.astype(numpy.longdouble)
-    time_avg = time_avg.astype(numpy.longdouble)
-
-    span = (time_avg.max() - time_avg.min()) + window * 10
-    time_avg = time_avg + span * tslide
     logger.info('Clustering events over %s s window', window)
-    cidx = cluster_over_time(stat, time_avg, window, **kwargs)
+    cidx = cluster_over_slides(stat, time_avg, timeslide_id, window,
+                               chunk_size=chunk_size, **kwargs)
     logger.info('%d triggers remaining', len(cidx))
 
     return cidx
 
 
+def cluster_over_slides(stat, time, timeslide_id, window, chunk_size=None,
+                        **kwargs):
+    """Cluster coincident events over time for each timeslide separately
+
+    The timeslides are separated by offsetting the time of each event by a
+    multiple of its timeslide id that is larger than the span of the times.
+
+    Parameters
+    ----------
+    stat: numpy.ndarray
+        vector of ranking values to maximize
+    time: numpy.ndarray
+        time of each event to use for clustering
+    timeslide_id: numpy.ndarray
+        vector that determines the timeslide offset
+    window: float
+        length to cluster over
+    chunk_size: int, optional
+        If given, cluster whole timeslides in chunks of at least this many
+        events, and pass the chunk size on to cluster_over_time so that a
+        single large timeslide is also split. The events of each chunk are
+        offset in the same way as when clustering all events at once, so
+        the result is the same.
+
+    Returns
+    -------
+    cindex: numpy.ndarray
+        The set of indices corresponding to the surviving coincidences.
+    """
+    span = (numpy.longdouble(time.max()) - numpy.longdouble(time.min())) \
+        + window * 10
+
+    if chunk_size is None:
+        tslide = timeslide_id.astype(numpy.longdouble)
+        time = time.astype(numpy.longdouble) + span * tslide
+        return cluster_over_time(stat, time, window, **kwargs)
+
+    # Order the events by timeslide, this is the order of the offset times
+    slide_order = timeslide_id.argsort(kind='stable')
+    slide_starts = numpy.flatnonzero(numpy.diff(timeslide_id[slide_order]))
+    slide_starts += 1
+
+    cidx = []
+    start = 0
+    while start < len(slide_order):
+        # Take whole timeslides until there are at least chunk_size events
+        end = numpy.searchsorted(slide_starts, start + chunk_size)
+        end = slide_starts[end] if end < len(slide_starts) \
+            else len(slide_order)
+        idx = slide_order[start:end]
+        tslide = timeslide_id[idx].astype(numpy.longdouble)
+        ctime = time[idx].astype(numpy.longdouble) + span * tslide
+        cid = cluster_over_time(stat[idx], ctime, window,
+                                chunk_size=chunk_size, **kwargs)
+        cidx.append(idx[cid])
+        start = end
+    return numpy.concatenate(cidx)
+
+
 def mean_if_greater_than_zero(vals):
     """ Calculate mean over numerical values, ignoring values less than zero.
     E.g. used for mean time over coincident triggers when timestamps are set
@@ -481,7 +580,7 @@ def mean_if_greater_than_zero(vals):
 
 
 def cluster_over_time(stat, time, window, method='python',
-                      argmax=numpy.argmax):
+                      argmax=numpy.argmax, chunk_size=None):
     """Cluster generalized transient events over time via maximum stat over a
     symmetric sliding window
 
@@ -498,24 +597,57 @@ def cluster_over_time(stat, time, window, method='python',
         the pure python version.
     argmax: function
         the function used to calculate the maximum value
+    chunk_size: int, optional
+        If given, cluster the time sorted events in chunks of this many
+        events, each extended by a window at either edge so that events
+        near the edges are compared with all of their neighbours. Only the
+        sorting of the times is done for all events at once.
 
     Returns
     -------
     cindex: numpy.ndarray
         The set of indices corresponding to the surviving coincidences.
     """
-
-    indices = []
     time_sorting = time.argsort()
-    stat = stat[time_sorting]
-    time = time[time_sorting]
 
+    logger.debug('%d triggers before clustering', len(time))
+
+    if chunk_size is None or chunk_size >= len(time):
+        indices = _cluster_sorted(stat[time_sorting], time[time_sorting],
+                                  window, method, argmax)
+        logger.debug('%d triggers remaining', len(indices))
+        return time_sorting[indices]
+
+    cidx = []
+    for start in range(0, len(time), chunk_size):
+        end = min(start + chunk_size, len(time))
+        # Extend the chunk by the clustering window on either side
+        lower = numpy.searchsorted(time, time[time_sorting[start]] - window,
+                                   sorter=time_sorting)
+        upper = numpy.searchsorted(time, time[time_sorting[end - 1]] + window,
+                                   sorter=time_sorting)
+        sorting = time_sorting[lower:upper]
+        indices = _cluster_sorted(stat[sorting], time[sorting], window,
+                                  method, argmax) + lower
+        # Only keep events in the chunk, the others are decided by the
+        # neighbouring chunks
+        indices = indices[(indices >= start) & (indices < end)]
+        cidx.append(time_sorting[indices])
+    cidx = numpy.concatenate(cidx)
+
+    logger.debug('%d triggers remaining', len(cidx))
+    return cidx
+
+
+def _cluster_sorted(stat, time, window, method, argmax):
+    """Cluster events over time, where the events are sorted by time.
+    See cluster_over_time for the parameters, returns the indices of the
+    surviving events.
+    """
     left = time.searchsorted(time - window)
     right = time.searchsorted(time + window)
     indices = numpy.zeros(len(left), dtype=numpy.uint32)
 
-    logger.debug('%d triggers before clustering', len(time))
-
     if method == 'cython':
         j = timecluster_cython(indices, left, right, stat, len(left))
     elif method == 'python':
@@ -552,14 +684,19 @@ def cluster_over_time(stat, time, window, method='python',
     else:
         raise ValueError(f'Do not recognize method {method}')
 
-    indices = indices[:j]
-
-    logger.debug('%d triggers remaining', len(indices))
-    return time_sorting[indices]
+    return indices[:j]
 
 
 class MultiRingBuffer(object):
-    """Dynamic size n-dimensional ring buffer that can expire elements."""
+    """Dynamic size n-dimensional ring buffer that can expire elements.
+
+    The elements of all the rings are kept in a single array in the order in
+    which they were added, together with the index of their ring and the time
+    at which they were added. As all the rings expire at the same time, the
+    expired elements are always at the start of the array. The elements of
+    each ring are located through an index which is updated the first time a
+    ring is accessed after adding elements.
+    """
 
     def __init__(self, num_rings, max_time, dtype, min_buffer_size=16,
                  buffer_increment=8, resize_invalid_fraction=0.4):
@@ -574,57 +711,81 @@ class MultiRingBuffer(object):
         dtype: numpy.dtype
             The type of each element in the ring buffer.
         min_buffer_size: int (optional: default=16)
-            All ring buffers will be initialized to this length. If a buffer is
-            made larger it will no smaller than this value. Buffers may become
-            smaller than this length at any given time as triggers are expired.
+            The internal storage is initialized to hold this many elements
+            per ring, and is never made smaller than that.
         buffer_increment: int (optional: default=8)
-            When increasing ring buffers, add this many points. Be careful if
-            changing this and min_buffer_size from default values, it is
-            possible to get stuck in a mode where the buffers are always being
-            resized.
+            When the internal storage is full, it is increased by this many
+            elements per ring.
         resize_invalid_fraction: float (optional:default=0.4)
-            If this fraction of any buffer contains unused data points then
-            resize it to contain only valid points. As with the previous two
-            options, be careful changing default values, it is
-            possible to get stuck in a mode where the buffers are always being
-            resized.
+            When the internal storage is full and less than this fraction of
+            it would be free after removing the expired elements, it is
+            increased. Conversely, it is decreased if the valid elements fill
+            less than this fraction of it.
         """
+        self.num_rings = num_rings
         self.max_time = max_time
-        self.buffer = []
-        self.buffer_expire = []
-        self.valid_ends = []
-        self.valid_starts = []
         self.min_buffer_size = min_buffer_size
         self.buffer_increment = buffer_increment
         self.resize_invalid_fraction = resize_invalid_fraction
-        for _ in range(num_rings):
-            self.buffer.append(numpy.zeros(self.min_buffer_size, dtype=dtype))
-            self.buffer_expire.append(numpy.zeros(self.min_buffer_size,
-                                                  dtype=int))
-            self.valid_ends.append(0)
-            self.valid_starts.append(0)
+
+        size = self.min_buffer_size * num_rings
+        self.buffer = numpy.zeros(size, dtype=dtype)
+        self.buffer_expire = numpy.zeros(size, dtype=numpy.int32)
+        self.buffer_ring = numpy.zeros(size, dtype=numpy.int32)
+        # Elements between start and end are valid, unless they are older
+        # than max_time
+        self.start = 0
+        self.end = 0
         self.time = 0
 
+        # Position of the elements of each ring in the storage, sorted by
+        # ring and then by time, number of elements and offset of each ring
+        # in this array, and the state of the storage when it was computed
+        self._order = None
+        self._counts = None
+        self._offsets = None
+        self._index_start = 0
+        self._index_end = 0
+        self._index_time = 0
+
     @property
     def filled_time(self):
         return min(self.time, self.max_time)
 
     def num_elements(self):
-        count = 0
-        for idx, a in enumerate(self.buffer):
-            vals = self.valid_starts[idx]
-            vale = self.valid_ends[idx]
-            count += len(a[vals:vale])
-        return count
+        self.expire_elements()
+        return self.end - self.start
 
     @property
     def nbytes(self):
-        return sum([a.nbytes for a in self.buffer])
+        return (self.buffer.nbytes + self.buffer_expire.nbytes
+                + self.buffer_ring.nbytes)
 
     def discard_last(self, indices):
         """Discard the triggers added in the latest update"""
-        for i in indices:
-            self.valid_ends[i] -= 1
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        if len(indices) == 0:
+            return
+
+        # The latest triggers are at the end of the storage. For each ring,
+        # remove as many of them as the ring appears in `indices`.
+        tail = self.start + numpy.searchsorted(
+            self.buffer_expire[self.start:self.end], self.time - 1
+        )
+        rings = self.buffer_ring[tail:self.end]
+        ring_ids, counts = numpy.unique(indices, return_counts=True)
+        pos = numpy.searchsorted(ring_ids, rings).clip(0, len(ring_ids) - 1)
+        num_discard = numpy.where(ring_ids[pos] == rings, counts[pos], 0)
+        # Position of each element counted from the last one of its ring
+        from_end = _occurrence(rings[::-1])[::-1]
+        keep = numpy.flatnonzero(from_end >= num_discard) + tail
+
+        new_end = tail + len(keep)
+        self.buffer[tail:new_end] = self.buffer[keep]
+        self.buffer_expire[tail:new_end] = self.buffer_expire[keep]
+        self.buffer_ring[tail:new_end] = self.buffer_ring[keep]
+        self.end = new_end
+        self._order = None
 
     def advance_time(self):
         """Advance the internal time increment by 1, expiring any triggers
@@ -635,83 +796,139 @@ class MultiRingBuffer(object):
     def add(self, indices, values):
         """Add triggers in 'values' to the buffers indicated by the indices
         """
-        for i, v in zip(indices, values):
-            # Expand ring buffer size if needed
-            if self.valid_ends[i] == len(self.buffer[i]):
-                # First clear out any old triggers before resizing
-                self.update_valid_start(i)
-                self.check_expired_triggers(i)
-
-                # Then increase arrays by buffer_increment
-                self.buffer[i] = numpy.resize(
-                    self.buffer[i],
-                    max(
-                        len(self.buffer[i]) + self.buffer_increment,
-                        self.min_buffer_size
-                    )
-                )
-                self.buffer_expire[i] = numpy.resize(
-                    self.buffer_expire[i],
-                    max(
-                        len(self.buffer[i]) + self.buffer_increment,
-                        self.min_buffer_size
-                    )
-                )
-            curr_pos = self.valid_ends[i]
-            self.buffer[i][curr_pos] = v
-            self.buffer_expire[i][curr_pos] = self.time
-            self.valid_ends[i] = self.valid_ends[i] + 1
+        num = len(indices)
+        if self.end + num > len(self.buffer):
+            self.resize(num)
+
+        new = slice(self.end, self.end + num)
+        self.buffer[new] = values
+        self.buffer_expire[new] = self.time
+        self.buffer_ring[new] = indices
+        self.end += num
         self.advance_time()
 
-    def valid_slice(self, buffer_index):
-        """Return the valid slice for this buffer index"""
-        ret_slice = slice(
-            self.valid_starts[buffer_index],
-            self.valid_ends[buffer_index]
+    def expire_elements(self):
+        """Move the start of the valid elements past the expired ones"""
+        self.start += numpy.searchsorted(
+            self.buffer_expire[self.start:self.end],
+            self.time - self.max_time
         )
-        return ret_slice
+
+    def resize(self, num):
+        """Remove the expired elements from the internal storage and resize
+        it, if needed, so that it can hold `num` more elements.
+        """
+        self.expire_elements()
+        num_valid = self.end - self.start
+        needed = num_valid + num
+        size = len(self.buffer)
+        increment = self.buffer_increment * self.num_rings
+        if needed > (1 - self.resize_invalid_fraction) * size:
+            size = needed + increment
+        elif needed + increment < self.resize_invalid_fraction * size:
+            size = max(needed + increment,
+                       self.min_buffer_size * self.num_rings)
+
+        valid = slice(self.start, self.end)
+        if size == len(self.buffer):
+            self.buffer[:num_valid] = self.buffer[valid]
+            self.buffer_expire[:num_valid] = self.buffer_expire[valid]
+            self.buffer_ring[:num_valid] = self.buffer_ring[valid]
+        else:
+            for name in ['buffer', 'buffer_expire', 'buffer_ring']:
+                old = getattr(self, name)
+                new = numpy.zeros(size, dtype=old.dtype)
+                new[:num_valid] = old[valid]
+                setattr(self, name, new)
+        self.start = 0
+        self.end = num_valid
+        self._order = None
+
+    def _update_index(self):
+        """Locate the valid elements of each ring in the internal storage.
+
+        If the index is available from a previous update, the expired
+        elements are removed from it and the elements added since then are
+        inserted at the end of their ring, avoiding to sort all the elements
+        again.
+        """
+        self.expire_elements()
+        if self._order is None:
+            rings = self.buffer_ring[self.start:self.end]
+            self._order = numpy.argsort(rings, kind='stable') + self.start
+            self._counts = numpy.bincount(rings, minlength=self.num_rings)
+        else:
+            expired = self.buffer_ring[self._index_start:self.start]
+            self._counts -= numpy.bincount(expired, minlength=self.num_rings)
+            order = self._order[self._order >= self.start]
+
+            new = numpy.arange(self._index_end, self.end)
+            new_rings = self.buffer_ring[new]
+            sort = numpy.argsort(new_rings, kind='stable')
+            ring_ends = numpy.cumsum(self._counts)
+            self._order = numpy.insert(order, ring_ends[new_rings[sort]],
+                                       new[sort])
+            self._counts += numpy.bincount(new_rings,
+                                           minlength=self.num_rings)
+
+        self._offsets = numpy.zeros(self.num_rings + 1, dtype=numpy.int64)
+        numpy.cumsum(self._counts, out=self._offsets[1:])
+        self._index_start = self.start
+        self._index_end = self.end
+        self._index_time = self.time
+
+    def _ring_elements(self, buffer_index):
+        """Return the position of the valid elements of a given ring"""
+        if self._order is None or self._index_time != self.time:
+            self._update_index()
+        return self._order[self._offsets[buffer_index]:
+                           self._offsets[buffer_index + 1]]
 
     def expire_vector(self, buffer_index):
         """Return the expiration vector of a given ring buffer """
-        return self.buffer_expire[buffer_index][self.valid_slice(buffer_index)]
-
-    def update_valid_start(self, buffer_index):
-        """Update the valid_start for the given buffer index"""
-        expired = self.time - self.max_time
-        exp = self.buffer_expire[buffer_index]
-        j = self.valid_starts[buffer_index]
-        while j < self.valid_ends[buffer_index]:
-            # Everything before this j must be expired
-            if exp[j] >= expired:
-                break
-            j += 1
-        self.valid_starts[buffer_index] = j
-
-    def check_expired_triggers(self, buffer_index):
-        """Check if we should free memory for this buffer index.
-
-        Check what fraction of triggers are expired in the specified buffer
-        and if it is more than the allowed fraction (set by
-        self.resize_invalid_fraction) resize the array to remove them.
-        """
-        val_start = self.valid_starts[buffer_index]
-        val_end = self.valid_ends[buffer_index]
-        buf_len = len(self.buffer[buffer_index])
-        invalid_limit = self.resize_invalid_fraction * buf_len
-        if (buf_len - val_end) + val_start > invalid_limit:
-            # If self.resize_invalid_fraction of stored triggers are expired
-            # or are not set, free up memory
-            self.buffer_expire[buffer_index] = self.buffer_expire[buffer_index][val_start:val_end].copy()
-            self.buffer[buffer_index] = self.buffer[buffer_index][val_start:val_end].copy()
-            self.valid_ends[buffer_index] -= val_start
-            self.valid_starts[buffer_index] = 0
+        return self.buffer_expire[self._ring_elements(buffer_index)]
 
     def data(self, buffer_index):
         """Return the data vector for a given ring buffer"""
-        self.update_valid_start(buffer_index)
-        self.check_expired_triggers(buffer_index)
+        return self.buffer[self._ring_elements(buffer_index)]
 
-        return self.buffer[buffer_index][self.valid_slice(buffer_index)]
+    def save_state(self, group):
+        """Write the valid elements and the time of the buffer to an HDF
+        group
+        """
+        self.expire_elements()
+        valid = slice(self.start, self.end)
+        group['data'] = self.buffer[valid]
+        group['expire'] = self.buffer_expire[valid]
+        group['ring'] = self.buffer_ring[valid]
+        group.attrs['time'] = self.time
+
+    def restore_state(self, group):
+        """Replace the content of the buffer with the one written to an HDF
+        group by `save_state`
+        """
+        num = len(group['data'])
+        self.start = self.end = 0
+        if num > len(self.buffer):
+            self.resize(num)
+        self.buffer[:num] = group['data'][:]
+        self.buffer_expire[:num] = group['expire'][:]
+        self.buffer_ring[:num] = group['ring'][:]
+        self.end = num
+        self.time = int(group.attrs['time'])
+        self._order = None
+
+
+def _occurrence(values):
+    """Return, for each element of `values`, the number of equal elements
+    which precede it.
+    """
+    order = numpy.argsort(values, kind='stable')
+    ordered = values[order]
+    occurrence = numpy.empty(len(values), dtype=numpy.int64)
+    occurrence[order] = (numpy.arange(len(values))
+                         - numpy.searchsorted(ordered, ordered))
+    return occurrence
 
 
 class CoincExpireBuffer(object):
@@ -828,6 +1045,29 @@ class CoincExpireBuffer(object):
         """Return the array of elements"""
         return self.buffer[:self.index]
 
+    def save_state(self, group):
+        """Write the elements and the timers of the buffer to an HDF group"""
+        group['data'] = self.data
+        for ifo in self.ifos:
+            group['timer/' + ifo] = self.timer[ifo][:self.index]
+            group['timer/' + ifo].attrs['time'] = self.time[ifo]
+
+    def restore_state(self, group):
+        """Replace the content of the buffer with the one written to an HDF
+        group by `save_state`
+        """
+        num = len(group['data'])
+        newlen = len(self.buffer)
+        while num >= newlen:
+            newlen *= 2
+        self.buffer.resize(newlen, refcheck=False)
+        self.buffer[:num] = group['data'][:]
+        for ifo in self.ifos:
+            self.timer[ifo].resize(newlen, refcheck=False)
+            self.timer[ifo][:num] = group['timer/' + ifo][:]
+            self.time[ifo] = int(group['timer/' + ifo].attrs['time'])
+        self.index = num
+
 
 class LiveCoincTimeslideBackgroundEstimator(object):
     """Rolling buffer background estimation."""
@@ -909,10 +1149,6 @@ class LiveCoincTimeslideBackgroundEstimator(object):
 
         self.singles = {}
 
-        # temporary array used in `_find_coincs()` to turn `trig_stat`
-        # into an array much faster than using `numpy.resize()`
-        self.trig_stat_memory = None
-
     @classmethod
     def pick_best_coinc(cls, coinc_results):
         """Choose the best two-ifo coinc by ifar first, then statistic if needed.
@@ -1011,14 +1247,34 @@ class LiveCoincTimeslideBackgroundEstimator(object):
             help="The interval between timeslides in seconds", default=0.1)
         group.add_argument('--ifar-remove-threshold', type=float,
             help="NOT YET IMPLEMENTED", default=100.0)
+        group.add_argument('--background-state-dir',
+            help="Periodically save the state of the background estimation "
+                 "to this directory, and restore it from there on startup")
+        group.add_argument('--background-state-interval', type=float,
+            default=600.,
+            help="Interval in seconds between saves of the background "
+                 "state. Default 600")
+        group.add_argument('--background-state-max-age', type=float,
+            help="Do not restore background states older than this many "
+                 "seconds. By default, states of any age are restored")
 
     @staticmethod
     def verify_args(args, parser):
-        """Verify that psd-var-related options are consistent"""
+        """Verify that psd-var-related options are consistent, and that the
+        background state directory can be written to"""
         if ((hasattr(args, 'psd_variation') and not args.psd_variation)
                 and 'psdvar' in args.sngl_ranking):
             parser.error(f"The single ifo ranking stat {args.sngl_ranking} "
                          "requires --psd-variation.")
+        if getattr(args, 'background_state_dir', None):
+            try:
+                os.makedirs(args.background_state_dir, exist_ok=True)
+            except OSError as err:
+                parser.error("Unable to create --background-state-dir: "
+                             f"{err}")
+            if not os.access(args.background_state_dir, os.W_OK | os.X_OK):
+                parser.error("--background-state-dir "
+                             f"{args.background_state_dir} is not writable")
 
     @property
     def background_time(self):
@@ -1028,16 +1284,109 @@ class LiveCoincTimeslideBackgroundEstimator(object):
             time *= self.singles[ifo].filled_time * self.analysis_block
         return time
 
-    def save_state(self, filename):
-        """Save the current state of the background buffers"""
-        import pickle
-        pickle.dump(self, filename)
+    def save_state(self, filename, gps_time=None):
+        """Save the current state of the background buffers to an HDF file.
 
-    @staticmethod
-    def restore_state(filename):
-        """Restore state of the background buffers from a file"""
-        import pickle
-        return pickle.load(filename)
+        The file is first written under a temporary name and then moved to
+        `filename`, so that an existing state is never left half-written.
+        Failing to write the state, for example as the disk is full, is only
+        logged, so that the analysis continues.
+
+        Parameters
+        ----------
+        filename: str
+            Name of the file to write.
+        gps_time: {float, None}
+            GPS time up to which the data has been analyzed, stored in the
+            file to check the age of the state when restoring it.
+
+        Returns
+        -------
+        saved: bool
+            Whether the state was saved.
+        """
+        dirname, basename = os.path.split(filename)
+        tmp_filename = os.path.join(dirname, '.' + basename + '.tmp')
+        try:
+            with h5py.File(tmp_filename, 'w') as f:
+                f.attrs['ifos'] = self.ifos
+                f.attrs['num_templates'] = self.num_templates
+                f.attrs['analysis_block'] = self.analysis_block
+                f.attrs['timeslide_interval'] = self.timeslide_interval
+                f.attrs['buffer_size'] = self.buffer_size
+                if gps_time is not None:
+                    f.attrs['gps_time'] = float(gps_time)
+                self.coincs.save_state(f.create_group('coincs'))
+                for ifo in self.singles:
+                    self.singles[ifo].save_state(
+                        f.create_group('singles/' + ifo))
+            os.replace(tmp_filename, filename)
+        except OSError as err:
+            logger.warning('Could not save %s background state to %s: %s',
+                           ppdets(self.ifos, "-"), filename, err)
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            return False
+        logger.info('Saved %s background state to %s',
+                    ppdets(self.ifos, "-"), filename)
+        return True
+
+    def restore_state(self, filename, min_gps_time=None):
+        """Restore the state of the background buffers saved by
+        `save_state`.
+
+        Parameters
+        ----------
+        filename: str
+            Name of the file to read.
+        min_gps_time: {float, None}
+            If given, states saved before this GPS time are considered too
+            old and are not restored.
+
+        Returns
+        -------
+        restored: bool
+            True if the state was restored, False if it was too old.
+        """
+        with h5py.File(filename, 'r') as f:
+            config = {
+                'ifos': list(self.ifos),
+                'num_templates': self.num_templates,
+                'analysis_block': self.analysis_block,
+                'timeslide_interval': self.timeslide_interval,
+                'buffer_size': self.buffer_size
+            }
+            for key, value in config.items():
+                saved = f.attrs[key]
+                if key == 'ifos':
+                    saved = [str(ifo) for ifo in saved]
+                if saved != value:
+                    raise ValueError(f'Cannot restore the background state '
+                                     f'from {filename}: {key} is {saved}, '
+                                     f'expected {value}')
+
+            if min_gps_time is not None and \
+                    f.attrs.get('gps_time', -numpy.inf) < min_gps_time:
+                logger.info('Background state in %s is too old, ignoring it',
+                            filename)
+                return False
+
+            self.coincs.restore_state(f['coincs'])
+            self.singles = {}
+            for ifo in f.get('singles', {}):
+                group = f['singles/' + ifo]
+                self.singles_dtype = group['data'].dtype
+                self.singles[ifo] = MultiRingBuffer(self.num_templates,
+                                                    self.buffer_size,
+                                                    self.singles_dtype)
+                self.singles[ifo].restore_state(group)
+
+        logger.info('Restored %s background state from %s: %d coincs, '
+                    '%.3g s of background', ppdets(self.ifos, "-"), filename,
+                    self.coincs.index, self.background_time)
+        return True
 
     def ifar(self, coinc_stat):
         """Map a given value of the coincident ranking statistic to an inverse
@@ -1201,16 +1550,19 @@ class LiveCoincTimeslideBackgroundEstimator(object):
             mchirps = conv.mchirp_from_mass1_mass2(
                 trigs['mass1'], trigs['mass2']
             )
+            # Find the coincs of each new trigger, keeping track of which
+            # trigger formed them so that all can be ranked at once
+            fixed_idx = []
+            shift_stats = []
+            slides = []
             # Loop over them one trigger at a time
             for i in range(len(trigs['end_time'])):
-                trig_stat = trigs['stat'][i]
                 trig_time = trigs['end_time'][i]
                 template = trigs['template_id'][i]
-                mchirp = mchirps[i]
 
                 # Get current shift_ifo triggers in the same template
-                times = self.singles[shift_ifo].data(template)['end_time']
-                stats = self.singles[shift_ifo].data(template)['stat']
+                data = self.singles[shift_ifo].data(template)
+                times = data['end_time']
 
                 # Perform coincidence. i1 is the list of trigger indices in the
                 # shift_ifo which make coincs, slide is the corresponding slide
@@ -1223,43 +1575,14 @@ class LiveCoincTimeslideBackgroundEstimator(object):
                                  self.time_window,
                                  self.timeslide_interval)
 
-                # Make a copy of the fixed ifo trig_stat for each coinc.
-                # NB for some statistics the "stat" entry holds more than just
-                # a ranking number. E.g. for the phase time consistency test,
-                # it must also contain the phase, time and sensitivity.
-                if self.trig_stat_memory is None:
-                    self.trig_stat_memory = numpy.zeros(
-                        1,
-                        dtype=trig_stat.dtype
-                    )
-                while len(self.trig_stat_memory) < len(i1):
-                    self.trig_stat_memory = numpy.resize(
-                        self.trig_stat_memory,
-                        len(self.trig_stat_memory)*2
-                    )
-                self.trig_stat_memory[:len(i1)] = trig_stat
-
-                # Force data into form needed by stat.py and then compute the
-                # ranking statistic values.
-                sngls_list = [[fixed_ifo, self.trig_stat_memory[:len(i1)]],
-                              [shift_ifo, stats[i1]]]
-
-                c = self.stat_calculator.rank_stat_coinc(
-                    sngls_list,
-                    slide,
-                    self.timeslide_interval,
-                    shift_vec,
-                    time_addition=self.coinc_window_pad,
-                    mchirp=mchirp,
-                    dets=self.dets
-                )
+                fixed_idx.append(numpy.zeros(len(i1), dtype=int) + i)
+                shift_stats.append(data['stat'][i1])
+                slides.append(slide)
 
-                # Store data about new triggers: slide index, stat value and
-                # times.
+                # Store data about new triggers: slide index and times.
                 offsets.append(slide)
-                cstat.append(c)
                 ctimes[shift_ifo].append(times[i1])
-                ctimes[fixed_ifo].append(numpy.zeros(len(c),
+                ctimes[fixed_ifo].append(numpy.zeros(len(i1),
                                          dtype=numpy.float64))
                 ctimes[fixed_ifo][-1].fill(trig_time)
 
@@ -1268,7 +1591,7 @@ class LiveCoincTimeslideBackgroundEstimator(object):
                 single_expire[shift_ifo].append(
                     self.singles[shift_ifo].expire_vector(template)[i1]
                 )
-                single_expire[fixed_ifo].append(numpy.zeros(len(c),
+                single_expire[fixed_ifo].append(numpy.zeros(len(i1),
                                                 dtype=numpy.int32))
                 single_expire[fixed_ifo][-1].fill(
                     self.singles[fixed_ifo].time - 1
@@ -1278,9 +1601,32 @@ class LiveCoincTimeslideBackgroundEstimator(object):
                 # to singles. The trigger was just added so it must be in
                 # the last position: we mark this with -1 so the
                 # slicing picks the right point
-                template_ids.append(numpy.zeros(len(c)) + template)
+                template_ids.append(numpy.zeros(len(i1)) + template)
                 trigger_ids[shift_ifo].append(i1)
-                trigger_ids[fixed_ifo].append(numpy.zeros(len(c)) - 1)
+                trigger_ids[fixed_ifo].append(numpy.zeros(len(i1)) - 1)
+
+            if not fixed_idx:
+                continue
+
+            # Force data into form needed by stat.py and then compute the
+            # ranking statistic values of the coincs of all new triggers.
+            # NB for some statistics the "stat" entry holds more than just
+            # a ranking number. E.g. for the phase time consistency test,
+            # it must also contain the phase, time and sensitivity.
+            fixed_idx = numpy.concatenate(fixed_idx)
+            sngls_list = [[fixed_ifo, trigs['stat'][fixed_idx]],
+                          [shift_ifo, numpy.concatenate(shift_stats)]]
+
+            c = self.stat_calculator.rank_stat_coinc(
+                sngls_list,
+                numpy.concatenate(slides),
+                self.timeslide_interval,
+                shift_vec,
+                time_addition=self.coinc_window_pad,
+                mchirp=mchirps[fixed_idx],
+                dets=self.dets
+            )
+            cstat.append(c)
 
         cstat = numpy.concatenate(cstat)
         template_ids = numpy.concatenate(template_ids).astype(numpy.int32)
@@ -1437,8 +1783,10 @@ class LiveCoincTimeslideBackgroundEstimator(object):
                     "Checking %s statistic for updated files",
                     ppdets(self.ifos, "-"),
                 )
-                with self.stat_calculator_lock:
-                    self.stat_calculator.check_update_files()
+                # The lock is only held while updates are applied
+                self.stat_calculator.check_update_files(
+                    lock=self.stat_calculator_lock
+                )
             # Sleep one second for safety
             timemod.sleep(1)
             # Now include the time it took the check / update the statistic
@@ -1454,11 +1802,13 @@ class LiveCoincTimeslideBackgroundEstimator(object):
 __all__ = [
     "background_bin_from_string",
     "timeslide_durations",
+    "time_sort_order",
     "time_coincidence",
     "time_multi_coincidence",
     "cluster_coincs",
     "cluster_coincs_multiifo",
     "mean_if_greater_than_zero",
+    "cluster_over_slides",
     "cluster_over_time",
     "MultiRingBuffer",
     "CoincExpireBuffer",
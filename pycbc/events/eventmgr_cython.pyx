@@ -1,6 +1,7 @@
 import numpy as np
 cimport numpy as cnp
 from cython import wraparound, boundscheck, cdivision
+from cython.parallel import prange
 from libc.math cimport M_PI, sqrt
 from libc.math cimport round as cround
 
@@ -92,7 +93,7 @@ def logsignalrateinternals_compute2detrate(
     float[:] rate,
     long int[:] rtype,
     float[:] sref,
-    float[:,:,::1] two_det_weights, # This declares a C-contiguous array
+    const float[:,:,::1] two_det_weights, # This declares a C-contiguous array
     float max_penalty,
     float ref_snr,
     int length
@@ -145,18 +146,44 @@ def timecoincidence_constructfold(
 @boundscheck(False)
 @wraparound(False)
 @cdivision(True)
-def timecoincidence_findidxlen(
+def timecoincidence_findrange(
     long int[:] left,
     long int[:] right,
-    int leftlength,
+    double[:] fold1,
+    double[:] fold2,
+    double window,
+    int nthreads
 ):
+    # Equivalent to fold2.searchsorted(fold1 -/+ window), with the elements
+    # of fold1 split between threads
     cdef:
-        int idx, tslength
-
-    tslength = 0
-    for idx in range(leftlength):
-        tslength += right[idx] - left[idx]
-    return tslength
+        long int idx, lo, hi, mid, length1, length2
+        double value
+
+    length1 = fold1.shape[0]
+    length2 = fold2.shape[0]
+
+    for idx in prange(length1, nogil=True, num_threads=nthreads):
+        value = fold1[idx] - window
+        lo = 0
+        hi = length2
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if fold2[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        left[idx] = lo
+
+        value = fold1[idx] + window
+        hi = length2
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if fold2[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        right[idx] = lo
 
 
 @boundscheck(False)
@@ -169,26 +196,22 @@ def timecoincidence_constructidxs(
     long int[:] sort2,
     long int[:] left,
     long int[:] right,
-    int leftlength,
-    int sort2length
+    long int[:] offsets,
+    int nthreads
 ):
+    # offsets[idx] is the position of the first coincidence of the idx'th
+    # element of sort1 in the output arrays, so that threads can fill the
+    # output independently
     cdef:
-        int idx, jdx, count, currlen
+        long int idx, jdx, leftlength, sort2length
 
-    # Construct sort1
-    count = 0
-    for idx in range(leftlength):
-        currlen = right[idx] - left[idx]
-        for jdx in range(currlen):
-            idx1[count] = sort1[idx]
-            count += 1
+    leftlength = left.shape[0]
+    sort2length = sort2.shape[0]
 
-    # Construct sort2
-    count = 0
-    for idx in range(leftlength):
+    for idx in prange(leftlength, nogil=True, num_threads=nthreads):
         for jdx in range(left[idx], right[idx]):
-            idx2[count] = sort2[jdx % sort2length]
-            count += 1
+            idx1[offsets[idx] + jdx - left[idx]] = sort1[idx]
+            idx2[offsets[idx] + jdx - left[idx]] = sort2[jdx % sort2length]
 
 
 @boundscheck(False)
@@ -200,14 +223,16 @@ def timecoincidence_getslideint(
     double[:] t2,
     unsigned int[:] idx1,
     unsigned int[:] idx2,
-    double slide_step
+    double slide_step,
+    int nthreads
 ):
     cdef:
-        int idx, length
+        long int idx, length
+        double diff
 
     length = idx1.shape[0]
 
-    for idx in range(length):
+    for idx in prange(length, nogil=True, num_threads=nthreads):
         diff = (t1[idx1[idx]] - t2[idx2[idx]]) / slide_step
         slide[idx] = <int>(cround(diff))
 
@@ -35,7 +35,139 @@ from pycbc import conversions as conv
 logger = logging.getLogger('pycbc.events.significance')
 
 
-def count_n_louder(bstat, fstat, dec,
+class BackgroundDistribution(object):
+    """ Sorted background statistic values and the cumulative number of
+    louder background events, which can be reused to count louder events
+    for many sets of foreground events.
+
+    Events are kept in the order in which they were given, as in a DictArray,
+    so that removing or selecting events follows the same indexing as the
+    DictArray holding the background. The statistic values are only sorted
+    when the distribution is created.
+
+    Parameters
+    ----------
+    stat: numpy.ndarray
+        Array of the background statistic values
+    dec: numpy.ndarray
+        Array of the decimation factors for the background statistics
+    """
+    def __init__(self, stat, dec):
+        stat = np.asarray(stat)
+        # NaN values are considered larger than floats when sorting, set
+        # them to -inf as in get_n_louder
+        stat = np.where(np.isnan(stat), -np.inf, stat)
+        # Position of each sorted value in the input order
+        self.order = stat.argsort()
+        self.stat = stat[self.order]
+        self.dec = np.asarray(dec)[self.order]
+        self._update_counts()
+
+    def _update_counts(self):
+        # Cumulative number of triggers louder than the trigger in a given
+        # index. We need to subtract the decimation factor, as the cumsum
+        # includes itself in the first sum (it is inclusive of the first
+        # value)
+        self.n_louder = self.dec[::-1].cumsum()[::-1] - self.dec
+
+    def __len__(self):
+        return len(self.stat)
+
+    def count_louder(self, fstat):
+        """ Calculate for each foreground event the number of background
+        events that are louder than it.
+
+        Parameters
+        ----------
+        fstat: numpy.ndarray or scalar
+            Array of the foreground statistic values or single value
+
+        Returns
+        -------
+        fore_n_louder: numpy.ndarray
+            The number of background triggers above each foreground trigger
+        """
+        # Determine how many values are louder than the foreground ones
+        # We need to subtract one from the index, to be consistent with
+        # definition of n_louder, as here we do want to include the
+        # background value at the found index
+        idx = np.searchsorted(self.stat, fstat, side='left') - 1
+
+        # If the foreground are *quieter* than the background or at the same
+        # value then the search sorted algorithm will choose position -1,
+        # which does not exist. We force it back to zero.
+        idx = np.maximum(idx, 0)
+        return self.n_louder[idx]
+
+    def background_count_louder(self):
+        """ Return the number of background events louder than each
+        background event, in the order in which the events are held.
+        """
+        back_n_louder = np.empty_like(self.n_louder)
+        back_n_louder[self.order] = self.n_louder
+        return back_n_louder
+
+    def select(self, idx):
+        """ Keep only the indexed events, in the order given by idx
+
+        Parameters
+        ----------
+        idx: numpy.ndarray
+            Indices of the events to keep, these must be unique
+        """
+        idx = np.asarray(idx, dtype=int)
+        new_pos = np.full(len(self), -1, dtype=int)
+        new_pos[idx] = np.arange(len(idx))
+        new_order = new_pos[self.order]
+        keep = new_order >= 0
+        self.order = new_order[keep]
+        self.stat = self.stat[keep]
+        self.dec = self.dec[keep]
+        self._update_counts()
+
+    def remove(self, idx):
+        """ Remove the indexed events, keeping the order of the others
+
+        Parameters
+        ----------
+        idx: numpy.ndarray or list
+            Indices of the events to remove, repeated indices are allowed
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.array(idx, dtype=int)] = False
+        self.select(np.flatnonzero(keep))
+
+    @classmethod
+    def merge(cls, dists):
+        """ Combine several background distributions, e.g. from different
+        detector combinations, into one
+
+        The events of the new distribution are in the order of the given
+        distributions, one after the other.
+
+        Parameters
+        ----------
+        dists: list of BackgroundDistribution
+
+        Returns
+        -------
+        BackgroundDistribution
+        """
+        merged = cls.__new__(cls)
+        offsets = np.cumsum([0] + [len(d) for d in dists])
+        stat = np.concatenate([d.stat for d in dists])
+        # Each distribution is already sorted, so a stable sort only needs
+        # to merge the sorted runs
+        sort = stat.argsort(kind='stable')
+        merged.stat = stat[sort]
+        merged.dec = np.concatenate([d.dec for d in dists])[sort]
+        merged.order = np.concatenate([d.order + off for d, off
+                                       in zip(dists, offsets)])[sort]
+        merged._update_counts()
+        return merged
+
+
+def count_n_louder(bstat, fstat, dec, background=None,
                    **kwargs):  # pylint:disable=unused-argument
     """ Calculate for each foreground event the number of background events
     that are louder than it.
@@ -48,6 +180,9 @@ def count_n_louder(bstat, fstat, dec,
         Array of the foreground statistic values or single value
     dec: numpy.ndarray
         Array of the decimation factors for the background statistics
+    background: BackgroundDistribution, optional
+        A distribution already made from the background statistic values and
+        decimation factors, which is used instead of sorting them again
 
     Returns
     -------
@@ -58,34 +193,11 @@ def count_n_louder(bstat, fstat, dec,
     {} : (empty) dictionary
         Ensure we return the same tuple of objects as n_louder_from_fit()
     """
-    sort = bstat.argsort()
-    bstat = copy.deepcopy(bstat)[sort]
-    dec = copy.deepcopy(dec)[sort]
-
-    # calculate cumulative number of triggers louder than the trigger in
-    # a given index. We need to subtract the decimation factor, as the cumsum
-    # includes itself in the first sum (it is inclusive of the first value)
-    n_louder = dec[::-1].cumsum()[::-1] - dec
-
-    # Determine how many values are louder than the foreground ones
-    # We need to subtract one from the index, to be consistent with definition
-    # of n_louder, as here we do want to include the background value at the
-    # found index
-    idx = np.searchsorted(bstat, fstat, side='left') - 1
-
-    # If the foreground are *quieter* than the background or at the same value
-    # then the search sorted algorithm will choose position -1, which does not
-    # exist. We force it back to zero.
-    if isinstance(idx, np.ndarray):  # Case where our input is an array
-        idx[idx < 0] = 0
-    else:  # Case where our input is just a scalar value
-        if idx < 0:
-            idx = 0
-
-    fore_n_louder = n_louder[idx]
-
-    unsort = sort.argsort()
-    back_cum_num = n_louder[unsort]
+    if background is None:
+        background = BackgroundDistribution(bstat, dec)
+
+    fore_n_louder = background.count_louder(fstat)
+    back_cum_num = background.background_count_louder()
 
     # Empty dictionary to match the return from n_louder_from_fit
     return back_cum_num, fore_n_louder, {}
@@ -393,8 +393,10 @@ class LiveSingle(object):
                 logger.info(
                     "Checking %s statistic for updated files", self.ifo
                 )
-                with self.stat_calculator_lock:
-                    self.stat_calculator.check_update_files()
+                # The lock is only held while updates are applied
+                self.stat_calculator.check_update_files(
+                    lock=self.stat_calculator_lock
+                )
             # Sleep one second for safety
             time.sleep(1)
             # Now use the time it took the check / update the statistic
@@ -25,7 +25,9 @@
 This module contains functions for calculating coincident ranking statistic
 values.
 """
+import os
 import logging
+import contextlib
 from hashlib import sha1
 from datetime import datetime as dt
 import numpy
@@ -48,6 +50,286 @@ _allowed_statistic_features = [
 ]
 
 
+# Signal histograms already read by this process, keyed by the phasetd_newsnr
+# file they were read from. Each holds the hash of the file contents, so that
+# the histogram of a file which has since been replaced is dropped.
+_signal_hists = {}
+
+# Increment if the format of the compiled signal histogram files changes
+_SIGNAL_HIST_CACHE_VERSION = 1
+
+
+def pack_hist_bins(bins, bin_min, bin_range):
+    """
+    Combine the bin indices of each histogram dimension into a single key
+
+    The keys sort in the same order as the bin index tuples, so a sorted
+    array of keys can be searched with numpy.searchsorted.
+
+    Parameters
+    ----------
+    bins: list of numpy.ndarray
+        The bin index along each dimension of the histogram
+    bin_min: numpy.ndarray
+        The smallest bin index of each dimension
+    bin_range: numpy.ndarray
+        The number of bins along each dimension
+
+    Returns
+    -------
+    keys: numpy.ndarray
+        The int64 key of each set of bin indices
+    """
+    keys = numpy.zeros(len(bins[0]), dtype=numpy.int64)
+    for b, bmin, brange in zip(bins, bin_min, bin_range):
+        keys *= brange
+        keys += b
+        keys -= bmin
+    return keys
+
+
+def read_signal_hist(filename, two_det):
+    """
+    Read a phasetd_newsnr file and prepare the histogram for lookups
+
+    Parameters
+    ----------
+    filename: str
+        The phasetd_newsnr signal histogram file
+    two_det: bool
+        If True, expand the histogram for each reference ifo into a dense
+        array indexed by the bins. Otherwise, bins are looked up by their
+        key from `pack_hist_bins`.
+
+    Returns
+    -------
+    hist: dict
+        The histogram bin widths, the normalized weights and the lookup
+        tables for each reference ifo
+    """
+    hist = {}
+    weights = {}
+    param = {}
+    with h5py.File(filename, "r") as histfile:
+        hist_ifos = histfile.attrs["ifos"]
+
+        # Patch for pre-hdf5=3.0 histogram files
+        try:
+            logger.info("Decoding hist ifos ..")
+            hist_ifos = [i.decode("UTF-8") for i in hist_ifos]
+        except (UnicodeDecodeError, AttributeError):
+            pass
+        hist["ifos"] = list(hist_ifos)
+
+        # Histogram bin attributes
+        for attr in ["twidth", "pwidth", "swidth", "srbmin", "srbmax",
+                     "sensitivity_ratios"]:
+            hist[attr] = histfile.attrs[attr]
+
+        for ifo in hist_ifos:
+            weights[ifo] = histfile[ifo]["weights"][:]
+            param[ifo] = histfile[ifo]["param_bin"][:]
+
+    n_ifos = len(hist_ifos)
+    bin_volume = (hist["twidth"] * hist["pwidth"] * hist["swidth"]) \
+        ** (n_ifos - 1)
+    hist["hist_max"] = -1. * numpy.inf
+
+    for key in ["weights", "bin_keys", "bin_min", "bin_range",
+                "two_det_weights"]:
+        hist[key] = {}
+
+    # Read histogram for each ifo, to use if that ifo has smallest SNR in
+    # the coinc
+    for ifo in hist_ifos:
+        if param[ifo].dtype == numpy.int8:
+            # Older style histogram file, with one column per bin dimension
+            bins = [param[ifo][:, i].astype(numpy.int64)
+                    for i in range(param[ifo].shape[1])]
+        else:
+            bins = [param[ifo][name].astype(numpy.int64)
+                    for name in param[ifo].dtype.names]
+
+        # renormalise to PDF
+        norm_weights = weights[ifo] / (weights[ifo].sum() * bin_volume)
+        norm_weights = norm_weights.astype(numpy.float32)
+
+        # Max_penalty is a small number to assigned to any bins without
+        # histogram entries. All histograms in a given file have the same
+        # min entry by design, so use the min of the last one read in.
+        hist["max_penalty"] = norm_weights.min()
+        hist["hist_max"] = max(hist["hist_max"], norm_weights.max())
+
+        if two_det:
+            # The density of signals is computed as a function of 3 binned
+            # parameters: time difference (t), phase difference (p) and
+            # SNR ratio (s). These are computed for each combination of
+            # detectors, so for detectors 6 differences are needed. However
+            # many combinations of these parameters are highly unlikely and
+            # no instances of these combinations occurred when generating
+            # the statistic files. Rather than storing a bunch of 0s, these
+            # values are just not stored at all. This reduces the size of
+            # the statistic file, but means we have to identify the correct
+            # value to read for every trigger. For 2 detectors we can
+            # expand the weights lookup table here, basically adding in all
+            # the "0" values. This makes looking up a value in the
+            # "weights" table a O(N) rather than O(NlogN) operation. It
+            # sacrifices RAM to do this, so is a good tradeoff for 2
+            # detectors, but not for 3!
+            sizes = [2 * (abs(b).max() + 1) for b in bins]
+            two_det_weights = numpy.zeros(sizes, dtype=norm_weights.dtype)
+            two_det_weights += hist["max_penalty"]
+            idx = tuple(b + size // 2 for b, size in zip(bins, sizes))
+            two_det_weights[idx] = norm_weights
+            hist["two_det_weights"][ifo] = two_det_weights
+        else:
+            # Look up bins by a single integer key rather than comparing
+            # the tuples of bin indices
+            bin_min = numpy.array([b.min() for b in bins])
+            bin_range = numpy.array([b.max() for b in bins]) - bin_min + 1
+            if numpy.prod(bin_range.astype(float)) >= 2. ** 63:
+                raise ValueError(
+                    "The bins of the signal histogram %s span too large a "
+                    "range to be looked up by key" % filename
+                )
+            bin_keys = pack_hist_bins(bins, bin_min, bin_range)
+            lsort = bin_keys.argsort()
+            hist["bin_keys"][ifo] = bin_keys[lsort]
+            hist["bin_min"][ifo] = bin_min
+            hist["bin_range"][ifo] = bin_range
+            norm_weights = norm_weights[lsort]
+
+        hist["weights"][ifo] = norm_weights
+
+    return hist
+
+
+def write_signal_hist_cache(hist, filename):
+    """
+    Write a prepared signal histogram in a form that can be memory mapped
+
+    Parameters
+    ----------
+    hist: dict
+        The histogram, as returned by `read_signal_hist`
+    filename: str
+        The file to write. It is written under a temporary name and moved
+        into place, so readers never see a partially written file.
+    """
+    dirname, basename = os.path.split(filename)
+    tmp_filename = os.path.join(
+        dirname, '.%s.%d.tmp' % (basename, os.getpid())
+    )
+    with h5py.File(tmp_filename, 'w') as f:
+        for key, value in hist.items():
+            if isinstance(value, dict):
+                for ifo, data in value.items():
+                    # Contiguous, uncompressed datasets can be mapped
+                    f.create_dataset('%s/%s' % (ifo, key), data=data)
+            else:
+                f.attrs[key] = value
+        f.attrs['version'] = _SIGNAL_HIST_CACHE_VERSION
+    os.replace(tmp_filename, filename)
+
+
+def load_signal_hist_cache(filename):
+    """
+    Load a signal histogram written by `write_signal_hist_cache`
+
+    The lookup tables are memory mapped, so their pages are shared between
+    all processes on a machine using the same file.
+
+    Parameters
+    ----------
+    filename: str
+        The compiled signal histogram file
+
+    Returns
+    -------
+    hist: dict
+        The histogram, in the same format as returned by `read_signal_hist`
+    """
+    hist = {}
+    with h5py.File(filename, 'r') as f:
+        for key, value in f.attrs.items():
+            if key != 'version':
+                hist[key] = value
+        hist['ifos'] = [i.decode() if hasattr(i, 'decode') else str(i)
+                        for i in hist['ifos']]
+        for key in ["weights", "bin_keys", "bin_min", "bin_range",
+                    "two_det_weights"]:
+            hist[key] = {}
+        for ifo in f:
+            for key, dset in f[ifo].items():
+                offset = dset.id.get_offset()
+                if offset is None:
+                    # Nothing is stored for empty datasets
+                    hist[key][ifo] = dset[()]
+                    continue
+                hist[key][ifo] = numpy.memmap(
+                    filename, dtype=dset.dtype, mode='r',
+                    offset=offset, shape=dset.shape
+                )
+    return hist
+
+
+def get_signal_hist(filename, file_hash, two_det, cache_dir=None):
+    """
+    Get the prepared signal histogram of a phasetd_newsnr file
+
+    The histogram of each file is kept in memory until the file contents
+    change. If a cache directory is given, the prepared histogram is also
+    stored there and memory mapped by any later process using the same file.
+
+    Parameters
+    ----------
+    filename: str
+        The phasetd_newsnr signal histogram file
+    file_hash: str
+        The sha1 hash of the file contents
+    two_det: bool
+        Whether the histogram is for a two-detector statistic
+    cache_dir: str, optional
+        Directory in which to store compiled signal histograms
+
+    Returns
+    -------
+    hist: dict
+        The histogram, as returned by `read_signal_hist`
+    """
+    key = (filename, two_det)
+    cached = _signal_hists.get(key)
+    if cached is not None and cached[0] == file_hash:
+        return cached[1]
+    # Drop the histogram of a file which has been replaced before reading
+    # the new one
+    _signal_hists.pop(key, None)
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(
+            cache_dir,
+            'PHASETD_HIST-%s-%s-v%d.hdf' % (
+                file_hash, 'TWODET' if two_det else 'KEYS',
+                _SIGNAL_HIST_CACHE_VERSION
+            )
+        )
+
+    if cache_file is not None and os.path.exists(cache_file):
+        logger.info("Loading compiled signal histogram %s", cache_file)
+        hist = load_signal_hist_cache(cache_file)
+    else:
+        hist = read_signal_hist(filename, two_det)
+        if cache_file is not None:
+            logger.info("Writing compiled signal histogram %s", cache_file)
+            os.makedirs(cache_dir, exist_ok=True)
+            write_signal_hist_cache(hist, cache_file)
+            hist = load_signal_hist_cache(cache_file)
+
+    _signal_hists[key] = (file_hash, hist)
+    return hist
+
+
 class Stat(object):
     """Base class which should be extended to provide a statistic"""
 
@@ -151,15 +433,30 @@ class Stat(object):
 
         return list(changed_file_hashes.keys())
 
-    def check_update_files(self):
+    def check_update_files(self, lock=None):
         """
         Check whether files associated with the statistic need updated,
         then do so for each file which needs changing
-        """
+
+        Parameters
+        ----------
+        lock: threading.Lock, optional
+            Lock which must be held while the statistic is changed. Files
+            which can be prepared with prepare_update are read without
+            holding the lock, which is then only held while the new values
+            are applied.
+        """
+        if lock is None:
+            lock = contextlib.nullcontext()
         files_changed = self.files_changed()
-        for file_key in files_changed:
-            self.update_file(file_key)
         self.file_hashes = self.get_file_hashes()
+        for file_key in files_changed:
+            update = self.prepare_update(file_key)
+            with lock:
+                if update is None:
+                    self.update_file(file_key)
+                else:
+                    self.apply_update(file_key, update)
 
     def update_file(self, key):
         """
@@ -169,6 +466,28 @@ class Stat(object):
         err_msg += "sub-classes. You shouldn't be seeing this error!"
         raise NotImplementedError(err_msg)
 
+    def prepare_update(self, key):  # pylint:disable=unused-argument
+        """
+        Read the file referenced by key and work out the changes to the
+        statistic, without changing the statistic itself.
+
+        Returns
+        -------
+        update: object or None
+            The changes to pass to apply_update, or None if the file must
+            be updated with update_file.
+        """
+        return None
+
+    def apply_update(self, key, update):  # pylint:disable=unused-argument
+        """
+        Apply the changes to the statistic found by prepare_update for the
+        file referenced by key.
+        """
+        err_msg = "This function is a stub that should be overridden by the "
+        err_msg += "sub-classes. You shouldn't be seeing this error!"
+        raise NotImplementedError(err_msg)
+
     def get_sngl_ranking(self, trigs):
         """
         Returns the ranking for the single detector triggers.
@@ -380,6 +699,9 @@ class PhaseTDStatistic(QuadratureSumStatistic):
 
     The weighting is based on the PDF of time delays, phase differences and
     amplitude ratios between triggers in different ifos.
+
+    The keyword phasetd_cache_dir gives a directory in which the prepared
+    signal histogram is stored, to be memory mapped by later processes.
     """
 
     def __init__(
@@ -429,9 +751,11 @@ class PhaseTDStatistic(QuadratureSumStatistic):
         self.swidth = self.pwidth = self.twidth = None
         self.srbmin = self.srbmax = None
         self.max_penalty = None
-        self.pdtype = []
+        self.hist_max = None
         self.weights = {}
-        self.param_bin = {}
+        self.bin_keys = {}
+        self.bin_min = {}
+        self.bin_range = {}
         self.two_det_flag = len(ifos) == 2
         self.two_det_weights = {}
         # Some memory
@@ -501,125 +825,27 @@ class PhaseTDStatistic(QuadratureSumStatistic):
             return
 
         logger.info("Using signal histogram %s for ifos %s", selected, ifos)
-        weights = {}
-        param = {}
-
-        with h5py.File(self.files[selected], "r") as histfile:
-            self.hist_ifos = histfile.attrs["ifos"]
-
-            # Patch for pre-hdf5=3.0 histogram files
-            try:
-                logger.info("Decoding hist ifos ..")
-                self.hist_ifos = [i.decode("UTF-8") for i in self.hist_ifos]
-            except (UnicodeDecodeError, AttributeError):
-                pass
-
-            # Histogram bin attributes
-            self.twidth = histfile.attrs["twidth"]
-            self.pwidth = histfile.attrs["pwidth"]
-            self.swidth = histfile.attrs["swidth"]
-            self.srbmin = histfile.attrs["srbmin"]
-            self.srbmax = histfile.attrs["srbmax"]
-            relfac = histfile.attrs["sensitivity_ratios"]
-
-            for ifo in self.hist_ifos:
-                weights[ifo] = histfile[ifo]["weights"][:]
-                param[ifo] = histfile[ifo]["param_bin"][:]
-
-        n_ifos = len(self.hist_ifos)
-
-        bin_volume = (self.twidth * self.pwidth * self.swidth) ** (n_ifos - 1)
-        self.hist_max = -1. * numpy.inf
-
-        # Read histogram for each ifo, to use if that ifo has smallest SNR in
-        # the coinc
-        for ifo in self.hist_ifos:
-
-            # renormalise to PDF
-            self.weights[ifo] = \
-                (weights[ifo] / (weights[ifo].sum() * bin_volume))
-            self.weights[ifo] = self.weights[ifo].astype(numpy.float32)
-
-            if param[ifo].dtype == numpy.int8:
-                # Older style, incorrectly sorted histogram file
-                ncol = param[ifo].shape[1]
-                self.pdtype = [
-                    ("c%s" % i, param[ifo].dtype) for i in range(ncol)
-                ]
-                self.param_bin[ifo] = numpy.zeros(
-                    len(self.weights[ifo]), dtype=self.pdtype
-                )
-                for i in range(ncol):
-                    self.param_bin[ifo]["c%s" % i] = param[ifo][:, i]
-
-                lsort = self.param_bin[ifo].argsort()
-                self.param_bin[ifo] = self.param_bin[ifo][lsort]
-                self.weights[ifo] = self.weights[ifo][lsort]
-            else:
-                # New style, efficient histogram file
-                # param bin and weights have already been sorted
-                self.param_bin[ifo] = param[ifo]
-                self.pdtype = self.param_bin[ifo].dtype
-
-            # Max_penalty is a small number to assigned to any bins without
-            # histogram entries. All histograms in a given file have the same
-            # min entry by design, so use the min of the last one read in.
-            self.max_penalty = self.weights[ifo].min()
-            self.hist_max = max(self.hist_max, self.weights[ifo].max())
-
-            if self.two_det_flag:
-                # The density of signals is computed as a function of 3 binned
-                # parameters: time difference (t), phase difference (p) and
-                # SNR ratio (s). These are computed for each combination of
-                # detectors, so for detectors 6 differences are needed. However
-                # many combinations of these parameters are highly unlikely and
-                # no instances of these combinations occurred when generating
-                # the statistic files. Rather than storing a bunch of 0s, these
-                # values are just not stored at all. This reduces the size of
-                # the statistic file, but means we have to identify the correct
-                # value to read for every trigger. For 2 detectors we can
-                # expand the weights lookup table here, basically adding in all
-                # the "0" values. This makes looking up a value in the
-                # "weights" table a O(N) rather than O(NlogN) operation. It
-                # sacrifices RAM to do this, so is a good tradeoff for 2
-                # detectors, but not for 3!
-                if not hasattr(self, "c0_size"):
-                    self.c0_size = {}
-                    self.c1_size = {}
-                    self.c2_size = {}
-
-                self.c0_size[ifo] = numpy.int32(
-                    2 * (abs(self.param_bin[ifo]["c0"]).max() + 1)
-                )
-                self.c1_size[ifo] = numpy.int32(
-                    2 * (abs(self.param_bin[ifo]["c1"]).max() + 1)
-                )
-                self.c2_size[ifo] = numpy.int32(
-                    2 * (abs(self.param_bin[ifo]["c2"]).max() + 1)
-                )
+        hist = get_signal_hist(
+            self.files[selected],
+            self.file_hashes[selected],
+            self.two_det_flag,
+            cache_dir=self.kwargs.get("phasetd_cache_dir"),
+        )
 
-                array_size = [
-                    self.c0_size[ifo],
-                    self.c1_size[ifo],
-                    self.c2_size[ifo],
-                ]
-                dtypec = self.weights[ifo].dtype
-                self.two_det_weights[ifo] = (
-                    numpy.zeros(array_size, dtype=dtypec) + self.max_penalty
-                )
-                id0 = (
-                    self.param_bin[ifo]["c0"].astype(numpy.int32)
-                    + self.c0_size[ifo] // 2
-                )
-                id1 = (
-                    self.param_bin[ifo]["c1"].astype(numpy.int32)
-                    + self.c1_size[ifo] // 2
-                )
-                id2 = (
-                    self.param_bin[ifo]["c2"].astype(numpy.int32)
-                    + self.c2_size[ifo] // 2
-                )
-                self.two_det_weights[ifo][id0, id1, id2] = self.weights[ifo]
+        self.hist_ifos = hist["ifos"]
+        self.twidth = hist["twidth"]
+        self.pwidth = hist["pwidth"]
+        self.swidth = hist["swidth"]
+        self.srbmin = hist["srbmin"]
+        self.srbmax = hist["srbmax"]
+        self.max_penalty = hist["max_penalty"]
+        self.hist_max = hist["hist_max"]
+        self.weights = hist["weights"]
+        self.bin_keys = hist["bin_keys"]
+        self.bin_min = hist["bin_min"]
+        self.bin_range = hist["bin_range"]
+        self.two_det_weights = hist["two_det_weights"]
+        relfac = hist["sensitivity_ratios"]
 
         for ifo, sense in zip(self.hist_ifos, relfac):
             self.relsense[ifo] = sense
@@ -759,13 +985,15 @@ class PhaseTDStatistic(QuadratureSumStatistic):
             # Read signal weight from precalculated histogram
             if self.two_det_flag:
                 # High-RAM, low-CPU option for two-det
+                c0_size, c1_size, c2_size = \
+                    self.two_det_weights[ref_ifo].shape
                 logsignalrateinternals_compute2detrate(
                     binned[0],
                     binned[1],
                     binned[2],
-                    self.c0_size[ref_ifo],
-                    self.c1_size[ref_ifo],
-                    self.c2_size[ref_ifo],
+                    c0_size,
+                    c1_size,
+                    c2_size,
                     rate,
                     rtype,
                     sref,
@@ -777,20 +1005,23 @@ class PhaseTDStatistic(QuadratureSumStatistic):
             else:
                 # Low[er]-RAM, high[er]-CPU option for >two det
 
-                # Convert binned to same dtype as stored in hist
-                nbinned = numpy.zeros(len(binned[1]), dtype=self.pdtype)
-                for i, b in enumerate(binned):
-                    nbinned[f"c{i}"] = b
-
-                loc = numpy.searchsorted(self.param_bin[ref_ifo], nbinned)
-                loc[loc == len(self.weights[ref_ifo])] = 0
+                # Bins outside the range of the histogram can't be packed
+                # into a key, and are certainly not in the histogram
+                bin_min = self.bin_min[ref_ifo]
+                bin_max = bin_min + self.bin_range[ref_ifo] - 1
+                inside = numpy.ones(len(rtype), dtype=bool)
+                for b, bmin, bmax in zip(binned, bin_min, bin_max):
+                    inside &= (b >= bmin) & (b <= bmax)
+                keys = pack_hist_bins(binned, bin_min, self.bin_range[ref_ifo])
+
+                bin_keys = self.bin_keys[ref_ifo]
+                loc = numpy.searchsorted(bin_keys, keys)
+                loc[loc == len(bin_keys)] = 0
                 rate[rtype] = self.weights[ref_ifo][loc]
 
                 # These weren't in our histogram so give them max penalty
                 # instead of random value
-                missed = numpy.where(
-                    self.param_bin[ref_ifo][loc] != nbinned
-                )[0]
+                missed = numpy.where(~inside | (bin_keys[loc] != keys))[0]
                 rate[rtype[missed]] = self.max_penalty
                 # Scale by signal population SNR
                 rate[rtype] *= (sref[rtype] / self.ref_snr) ** -4.
@@ -934,10 +1165,12 @@ class ExpFitStatistic(PhaseTDStatistic):
 
         # Get the single-detector rates fit values
         self.fits_by_tid = {}
+        self.alphamax = {}
         for i in self.bg_ifos:
             self.fits_by_tid[i] = self.assign_fits(i)
             if self.kwargs["normalize_fit_rate"]:
                 self.reassign_rate(i)
+            self.get_ref_vals(i)
 
         # These are important for the coinc_lim_for_thresh method
         # Is the single threshold a < or > limit?
@@ -980,6 +1213,8 @@ class ExpFitStatistic(PhaseTDStatistic):
             # Reweight the noise rate by the dq reweighting factor
             self.dq_rates_by_state = {}
             self.dq_bin_by_tid = {}
+            self.dq_rate_table = {}
+            self.dq_bin_index_by_tid = {}
             self.dq_state_segments = None
             self.low_latency = False
             self.single_dtype.append(('dq_state', int))
@@ -989,6 +1224,7 @@ class ExpFitStatistic(PhaseTDStatistic):
                 if key in self.files.keys():
                     self.dq_rates_by_state[ifo] = self.assign_dq_rates(key)
                     self.dq_bin_by_tid[ifo] = self.assign_template_bins(key)
+                    self.index_dq_rates(ifo)
                     self.check_low_latency(key)
                     if not self.low_latency:
                         if self.dq_state_segments is None:
@@ -1000,6 +1236,9 @@ class ExpFitStatistic(PhaseTDStatistic):
             # This may be stored as a float, so cast just in case
             self.mcm = float(self.kwargs.get("max_chirp_mass", numpy.inf))
             self.curr_mchirp = None
+            # The chirp mass is stored as single-ifo information so that
+            # coincs from many templates can be ranked at once
+            self.single_dtype.append(("mchirp", numpy.float64))
 
         if self.kwargs["kde"]:
             # Reweight the signal rate by a weighting factor from the KDE of
@@ -1010,6 +1249,7 @@ class ExpFitStatistic(PhaseTDStatistic):
             self.kde_by_tid = {}
             for kname in self.kde_names:
                 self.assign_kdes(kname)
+            self.single_dtype.append(("template_id", numpy.int64))
 
     def assign_template_bins(self, key):
         """
@@ -1066,22 +1306,70 @@ class ExpFitStatistic(PhaseTDStatistic):
 
         return dq_dict
 
+    def index_dq_rates(self, ifo):
+        """
+        Arrange the dq rates of an ifo for lookup by template id and state
+
+        The rate for each bin and dq state is stored in
+        `self.dq_rate_table[ifo]`, and the bin of each template id in
+        `self.dq_bin_index_by_tid[ifo]`, with -1 for unknown templates.
+
+        Parameters
+        ----------
+        ifo: str
+            The ifo whose dq rates have been assigned
+        """
+        self.dq_rate_table[ifo] = self.make_dq_rate_table(
+            self.dq_rates_by_state[ifo]
+        )
+        self.dq_bin_index_by_tid[ifo] = self.make_dq_bin_index(
+            self.dq_rates_by_state[ifo],
+            self.dq_bin_by_tid[ifo]
+        )
+
+    @staticmethod
+    def make_dq_rate_table(dq_rates):
+        """
+        Return the dq rates as an array indexed by bin and dq state, with
+        the bins in the order of the `dq_rates` dictionary
+        """
+        return numpy.array(list(dq_rates.values()), dtype=float)
+
+    @staticmethod
+    def make_dq_bin_index(dq_rates, tid_bins):
+        """
+        Return the bin index of each template id for the bins in the order of
+        the `dq_rates` dictionary, with -1 for unknown templates
+        """
+        bin_index = {name: i for i, name in enumerate(dq_rates)}
+        tids = numpy.array(list(tid_bins.keys()), dtype=int)
+        index = numpy.full(tids.max() + 1 if len(tids) else 0, -1)
+        index[tids] = [bin_index[tid_bins[t]] for t in tid_bins]
+        return index
+
     def setup_segments(self, key):
         """
-        Store segments from stat file
+        Store segments from stat file as an index of the dq state
         """
+        from pycbc.events.veto import SegmentIndex
+
         ifo = key.split("-")[0]
+        starts, ends, states = [], [], []
         with h5py.File(self.files[key], "r") as dq_file:
             ifo_grp = dq_file[ifo]
-            dq_state_segs_dict = {}
             for k in ifo_grp["dq_segments"].keys():
-                seg_dict = {}
-                seg_dict["start"] = \
-                    ifo_grp[f"dq_segments/{k}/segment_starts"][:]
-                seg_dict["end"] = ifo_grp[f"dq_segments/{k}/segment_ends"][:]
-                dq_state_segs_dict[k] = seg_dict
+                starts.append(
+                    ifo_grp[f"dq_segments/{k}/segment_starts"][:])
+                ends.append(ifo_grp[f"dq_segments/{k}/segment_ends"][:])
+                # states are named in file as 'dq_state_N', need to extract N
+                states.append(numpy.full(len(starts[-1]), int(k[9:])))
 
-        return dq_state_segs_dict
+        if not starts:
+            return SegmentIndex([], [])
+        # Later states take precedence where segments overlap
+        return SegmentIndex(numpy.concatenate(starts),
+                            numpy.concatenate(ends),
+                            numpy.concatenate(states))
 
     def find_dq_noise_rate(self, trigs, dq_state):
         """Get dq values for a specific ifo and dq states"""
@@ -1089,26 +1377,19 @@ class ExpFitStatistic(PhaseTDStatistic):
         dq_val = numpy.ones(len(dq_state))
 
         if self.curr_ifo in self.dq_rates_by_state:
-            for i, st in enumerate(dq_state):
-                if isinstance(self.curr_tnum, numpy.ndarray):
-                    bin_name = self.dq_bin_by_tid[self.curr_ifo][self.curr_tnum[i]]
-                else:
-                    bin_name = self.dq_bin_by_tid[self.curr_ifo][self.curr_tnum]
-                dq_val[i] = self.dq_rates_by_state[self.curr_ifo][bin_name][st]
+            bins = self.dq_bin_index_by_tid[self.curr_ifo][self.curr_tnum]
+            if numpy.any(bins < 0):
+                raise KeyError(
+                    "No %s dq bin for some template ids" % self.curr_ifo
+                )
+            dq_val[:] = self.dq_rate_table[self.curr_ifo][bins, dq_state]
         return dq_val
 
     def find_dq_state_by_time(self, ifo, times):
         """Get the dq state for an ifo at times"""
         dq_state = numpy.zeros(len(times), dtype=numpy.uint8)
         if ifo in self.dq_state_segments:
-            from pycbc.events.veto import indices_within_times
-
-            for k in self.dq_state_segments[ifo]:
-                starts = self.dq_state_segments[ifo][k]["start"]
-                ends = self.dq_state_segments[ifo][k]["end"]
-                inds = indices_within_times(times, starts, ends)
-                # states are named in file as 'dq_state_N', need to extract N
-                dq_state[inds] = int(k[9:])
+            dq_state[:] = self.dq_state_segments[ifo].state_at(times)
         return dq_state
 
     def check_low_latency(self, key):
@@ -1137,7 +1418,7 @@ class ExpFitStatistic(PhaseTDStatistic):
                     'Either all dq stat files must have segments or none'
                 )
 
-    def reassign_rate(self, ifo):
+    def reassign_rate(self, ifo, fits=None):
         """
         Reassign the rate to be number per time rather than an arbitrarily
         normalised number.
@@ -1146,17 +1427,23 @@ class ExpFitStatistic(PhaseTDStatistic):
         -----------
         ifo: str
             The ifo to consider.
+        fits: dict, optional
+            The fits to change, as returned by assign_fits. Default is
+            the fits used by the statistic, `self.fits_by_tid[ifo]`.
         """
+        if fits is None:
+            fits = self.fits_by_tid[ifo]
+
         with h5py.File(self.files[f'{ifo}-fit_coeffs'], 'r') as coeff_file:
             analysis_time = float(coeff_file.attrs['analysis_time'])
             fbt = 'fit_by_template' in coeff_file
 
-        self.fits_by_tid[ifo]['smoothed_rate_above_thresh'] /= analysis_time
-        self.fits_by_tid[ifo]['smoothed_rate_in_template'] /= analysis_time
+        fits['smoothed_rate_above_thresh'] /= analysis_time
+        fits['smoothed_rate_in_template'] /= analysis_time
         # The by-template fits may have been stored in the smoothed fits file
         if fbt:
-            self.fits_by_tid[ifo]['fit_by_rate_above_thresh'] /= analysis_time
-            self.fits_by_tid[ifo]['fit_by_rate_in_template'] /= analysis_time
+            fits['fit_by_rate_above_thresh'] /= analysis_time
+            fits['fit_by_rate_in_template'] /= analysis_time
 
     def assign_fits(self, ifo):
         """
@@ -1262,10 +1549,124 @@ class ExpFitStatistic(PhaseTDStatistic):
             )
             self.dq_rates_by_state[ifo] = self.assign_dq_rates(key)
             self.dq_bin_by_tid[ifo] = self.assign_template_bins(key)
+            self.index_dq_rates(ifo)
             return True
 
         return False
 
+    def prepare_update(self, key):
+        """
+        Read an updated fit coefficient or dq file and find the templates or
+        dq bins which have changed, without changing the statistic. Other
+        files are updated with update_file.
+
+        Parameters
+        ----------
+        key: str
+            statistic file key string
+
+        Returns
+        -------
+        update: dict or None
+            The new values and which of them have changed, to be passed to
+            apply_update
+        """
+        if key.endswith('-fit_coeffs'):
+            ifo = key[:2]
+            fits = self.assign_fits(ifo)
+            if self.kwargs["normalize_fit_rate"]:
+                self.reassign_rate(ifo, fits=fits)
+            old_fits = self.fits_by_tid[ifo]
+            update = {'ifo': ifo, 'fits': fits, 'changed': None,
+                      'alphamax': fits['smoothed_fit_coeff'].max()}
+            # Only templates whose values have changed are updated, unless
+            # the fitted templates or the threshold have changed
+            if fits.keys() == old_fits.keys() and \
+                    fits['thresh'] == old_fits['thresh'] and \
+                    all(fits[k].shape == old_fits[k].shape
+                        for k in fits if k != 'thresh'):
+                changed = numpy.zeros(len(fits['smoothed_fit_coeff']),
+                                      dtype=bool)
+                for k in fits:
+                    if k == 'thresh':
+                        continue
+                    new, old = fits[k], old_fits[k]
+                    changed |= (new != old) & \
+                        ~(numpy.isnan(new) & numpy.isnan(old))
+                update['changed'] = numpy.flatnonzero(changed)
+            return update
+
+        if key.endswith('dq_stat_info') and self.kwargs["dq"]:
+            ifo = key.split('-')[0]
+            dq_rates = self.assign_dq_rates(key)
+            dq_bins = self.assign_template_bins(key)
+            old_rates = self.dq_rates_by_state[ifo]
+            update = {'ifo': ifo, 'dq_rates': dq_rates, 'dq_bins': dq_bins,
+                      'rate_table': self.make_dq_rate_table(dq_rates)}
+            update['changed'] = [
+                b for b in dq_rates if b not in old_rates
+                or not numpy.array_equal(dq_rates[b], old_rates[b])
+            ]
+            # The template bins only need indexing again if they have changed
+            if list(dq_rates) == list(old_rates) and \
+                    dq_bins == self.dq_bin_by_tid[ifo]:
+                update['dq_bins'] = None
+            else:
+                update['bin_index'] = self.make_dq_bin_index(dq_rates,
+                                                             dq_bins)
+            return update
+
+        return None
+
+    def apply_update(self, key, update):
+        """
+        Apply the changes found by prepare_update. Only the changed values
+        are copied, or the arrays are replaced as a whole, so that this is
+        quick enough to do while ranking is paused.
+
+        Parameters
+        ----------
+        key: str
+            statistic file key string
+        update: dict
+            The output of prepare_update for this file
+        """
+        ifo = update['ifo']
+        if key.endswith('-fit_coeffs'):
+            changed = update['changed']
+            if changed is None:
+                self.fits_by_tid[ifo] = update['fits']
+                logger.info(
+                    "Updating %s statistic %s file",
+                    ''.join(self.ifos),
+                    key
+                )
+            else:
+                fits = self.fits_by_tid[ifo]
+                for k, value in update['fits'].items():
+                    if k != 'thresh':
+                        fits[k][changed] = value[changed]
+                logger.info(
+                    "Updating %s statistic %s file, %d templates changed",
+                    ''.join(self.ifos),
+                    key,
+                    len(changed)
+                )
+            self.alphamax[ifo] = update['alphamax']
+            return
+
+        logger.info(
+            "Updating %s statistic %s file, %d dq bins changed",
+            ifo,
+            key,
+            len(update['changed'])
+        )
+        self.dq_rates_by_state[ifo] = update['dq_rates']
+        self.dq_rate_table[ifo] = update['rate_table']
+        if update['dq_bins'] is not None:
+            self.dq_bin_by_tid[ifo] = update['dq_bins']
+            self.dq_bin_index_by_tid[ifo] = update['bin_index']
+
     def get_ref_vals(self, ifo):
         """
         Get the largest `alpha` value over all templates for given ifo.
@@ -1346,13 +1747,20 @@ class ExpFitStatistic(PhaseTDStatistic):
         with h5py.File(self.files[kname + "-kde_file"], "r") as kde_file:
             self.kde_by_tid[kname + "_kdevals"] = kde_file["data_kde"][:]
 
-    def kde_ratio(self):
+    def kde_ratio(self, template_id=None):
         """
         Calculate the weighting factor according to the ratio of the
         signal and template KDE lookup tables
+
+        Parameters
+        ----------
+        template_id: int or numpy.ndarray, optional
+            The template id(s) to use. Default is the current template.
         """
-        signal_kde = self.kde_by_tid["signal_kdevals"][self.curr_tnum]
-        template_kde = self.kde_by_tid["template_kdevals"][self.curr_tnum]
+        if template_id is None:
+            template_id = self.curr_tnum
+        signal_kde = self.kde_by_tid["signal_kdevals"][template_id]
+        template_kde = self.kde_by_tid["template_kdevals"][template_id]
 
         return numpy.log(signal_kde / template_kde)
 
@@ -1410,6 +1818,11 @@ class ExpFitStatistic(PhaseTDStatistic):
         In this case the ranking rescaled (see the lognoiserate method here).
         with the phase, end time, SNR values added in.
 
+        Triggers from many templates can be given at once, with their
+        'template_id' array, and the template-dependent information is
+        stored with each trigger. Coincs formed from the output can then be
+        ranked together by `rank_stat_coinc`, whatever their template.
+
         Parameters
         ----------
         trigs: dict of numpy.ndarrays, h5py group or similar dict-like object
@@ -1464,6 +1877,10 @@ class ExpFitStatistic(PhaseTDStatistic):
                 mass1 = trigs['mass1']
                 mass2 = trigs['mass2']
             self.curr_mchirp = mchirp_from_mass1_mass2(mass1, mass2)
+            singles["mchirp"] = self.curr_mchirp
+
+        if self.kwargs["kde"]:
+            singles["template_id"] = self.curr_tnum
 
         if self.kwargs["dq"]:
             if self.low_latency:
@@ -1549,18 +1966,16 @@ class ExpFitStatistic(PhaseTDStatistic):
             # assuming a homogeneous universe
             sr_factor += self.sensitive_volume_factor(sngls_info)
 
+        # The template is the same in all ifos, so template-dependent
+        # information is taken from the first ifo
         if self.kwargs["chirp_mass"]:
             # chirp mass reweighting
-            if isinstance(self.curr_mchirp, numpy.ndarray):
-                mchirp = numpy.minimum(self.curr_mchirp, self.mcm)
-            else:
-                # curr_mchirp will be a number
-                mchirp = min(self.curr_mchirp, self.mcm)
+            mchirp = numpy.minimum(sngls_info[0][1]["mchirp"], self.mcm)
             sr_factor += numpy.log((mchirp / 20.) ** (11. / 3.))
 
         if self.kwargs["kde"]:
             # KDE reweighting
-            sr_factor += self.kde_ratio()
+            sr_factor += self.kde_ratio(sngls_info[0][1]["template_id"])
 
         return sr_factor
 
@@ -21,6 +21,10 @@ alpha, sigma_alpha = fit_above_thresh('exponential', snrs)
 thresh = tail_threshold(snrs, N=500)
 alpha, sigma_alpha = fit_above_thresh('exponential', snrs, thresh)
 
+# fit the values in many groups, e.g. templates, at once
+alphas, sigma_alphas, counts = fit_above_thresh_by_group('exponential', snrs,
+                                                         template_ids, 6.25)
+
 # obtain the fitted function directly
 xvals = numpy.xrange(5.5, 10.5, 20)
 exponential_fit = expfit(xvals, alpha, thresh)
@@ -146,6 +150,92 @@ def fit_above_thresh(distr, vals, thresh=None, weights=None):
     return alpha, fitstd_dict[distr](w, alpha)
 
 
+# The max likelihood estimators above are functions of the weighted mean of
+# some quantity over the values above threshold: give that quantity, and
+# alpha in terms of its mean, so that many fits can share the same sums
+fitmean_dict = {
+    'exponential' : lambda vals, thresh : vals,
+    'rayleigh'    : lambda vals, thresh : vals ** 2.,
+    'power'       : lambda vals, thresh : numpy.log(vals / thresh)
+}
+
+alpha_from_mean_dict = {
+    'exponential' : lambda mean, thresh : 1. / (mean - thresh),
+    'rayleigh'    : lambda mean, thresh : 2. / (mean - thresh ** 2.),
+    'power'       : lambda mean, thresh : mean ** -1. + 1.
+}
+
+
+def fit_above_thresh_by_group(distr, vals, groups, thresh, num_groups=None,
+                              weights=None):
+    """
+    Maximum likelihood fits for the coefficient alpha in many groups at once
+
+    Equivalent to calling fit_above_thresh separately on the values in each
+    group, e.g. the triggers of each template, but the sums for all groups
+    are accumulated in a single pass over the values. The values need not
+    be sorted by group.
+
+    Parameters
+    ----------
+    distr : {'exponential', 'rayleigh', 'power'}
+        Name of distribution
+    vals : sequence of floats
+        Values to fit
+    groups : sequence of non-negative ints
+        Index of the group which each value belongs to
+    thresh : float
+        Threshold to apply before fitting
+    num_groups : int
+        Number of groups to return fits for. Default=None - one more than
+        the largest group index
+    weights: sequence of floats
+        Weighting factors to use for the values when fitting.
+        Default=None - all the same
+
+    Returns
+    -------
+    alpha : numpy.ndarray
+        Fitted value for each group, -1 if the group has no values above
+        threshold
+    sigma_alpha : numpy.ndarray
+        Standard error in fitted value for each group, -1 if the group has
+        no values above threshold
+    count : numpy.ndarray
+        Number of values above threshold in each group
+    """
+    vals = numpy.asarray(vals)
+    groups = numpy.asarray(groups)
+    if num_groups is None:
+        num_groups = groups.max() + 1 if len(groups) else 0
+
+    above_thresh = vals >= thresh
+    vals = vals[above_thresh]
+    groups = groups[above_thresh]
+    if weights is not None:
+        w = numpy.asarray(weights, dtype=float)[above_thresh]
+    else:
+        w = None
+
+    count = numpy.bincount(groups, minlength=num_groups)
+    wsum = count.astype(float) if w is None else \
+        numpy.bincount(groups, weights=w, minlength=num_groups)
+    fitvals = fitmean_dict[distr](vals, thresh)
+    if w is not None:
+        fitvals = fitvals * w
+    fitsum = numpy.bincount(groups, weights=fitvals, minlength=num_groups)
+
+    alpha = numpy.full(num_groups, -1.)
+    sigma_alpha = numpy.full(num_groups, -1.)
+    fitted = count > 0
+    alpha[fitted] = alpha_from_mean_dict[distr](
+        fitsum[fitted] / wsum[fitted], thresh)
+    # measurement standard deviations as in fitstd_dict
+    std_numerator = alpha[fitted] - 1. if distr == 'power' else alpha[fitted]
+    sigma_alpha[fitted] = std_numerator / wsum[fitted] ** 0.5
+    return alpha, sigma_alpha, count
+
+
 # Variables:
 # x: the trigger stat value(s) at which to evaluate the function
 # a: slope parameter of the fit
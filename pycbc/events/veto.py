@@ -1,11 +1,16 @@
 """ This module contains utilities to manipulate trigger lists based on
 segment.
 """
+import hashlib
 import logging
+import os
+import tempfile
 import numpy
 from igwn_segments import segment, segmentlist
 from ligo.lw import table, lsctables, utils as ligolw_utils
 
+from .coinc import time_sort_order
+
 logger = logging.getLogger('pycbc.events.veto')
 
 def start_end_to_segments(start, end):
@@ -61,7 +66,7 @@ def indices_within_times(times, start, end):
     # coalesce the start/end segments
     start, end = segments_to_start_end(start_end_to_segments(start, end).coalesce())
 
-    tsort = times.argsort()
+    tsort = time_sort_order(times)
     times_sorted = times[tsort]
     left = numpy.searchsorted(times_sorted, start)
     right = numpy.searchsorted(times_sorted, end)
@@ -93,22 +98,131 @@ def indices_outside_times(times, start, end):
     indices = numpy.arange(0, len(times))
     return numpy.delete(indices, exclude)
 
-def select_segments_by_definer(segment_file, segment_name=None, ifo=None):
-    """ Return the list of segments that match the segment name
+class SegmentIndex(object):
+    """Index of a set of time segments for fast, vectorised time lookups
+
+    The segments are stored as sorted, non-overlapping start and end time
+    arrays, each segment covering times in [start, end), together with an
+    integer state for each segment, e.g. a data quality state. Segments of
+    the same state which touch or overlap are merged. Where segments of
+    different states overlap, the state appearing later in the input takes
+    precedence.
 
     Parameters
     ----------
-    segment_file: str
-        path to segment xml file
-
-    segment_name: str
-        Name of segment
-    ifo: str, optional
-
-    Returns
-    -------
-    seg: list of segments
+    start: numpy.ndarray
+        Array of segment start times
+    end: numpy.ndarray
+        Array of segment end times
+    state: numpy.ndarray, optional
+        Array of the integer state of each segment. Default: all zero
     """
+    dtype = numpy.dtype([('start', numpy.float64), ('end', numpy.float64),
+                         ('state', numpy.int32)])
+
+    def __init__(self, start, end, state=None):
+        start = numpy.asarray(start, dtype=numpy.float64)
+        end = numpy.asarray(end, dtype=numpy.float64)
+        if state is None:
+            state = numpy.zeros(len(start), dtype=numpy.int32)
+        state = numpy.asarray(state, dtype=numpy.int32)
+        valid = end > start
+        start, end, state = start[valid], end[valid], state[valid]
+
+        # Find the state of each interval between consecutive segment
+        # boundaries, -1 meaning that no segment covers it
+        edges = numpy.unique(numpy.concatenate([start, end]))
+        edge_state = numpy.full(len(edges), -1, dtype=numpy.int32)
+        _, first = numpy.unique(state, return_index=True)
+        for st in state[numpy.sort(first)]:
+            sel = state == st
+            cover = numpy.zeros(len(edges), dtype=int)
+            numpy.add.at(cover, numpy.searchsorted(edges, start[sel]), 1)
+            numpy.add.at(cover, numpy.searchsorted(edges, end[sel]), -1)
+            edge_state[cover.cumsum() > 0] = st
+
+        # Merge consecutive intervals of the same state into segments, each
+        # ending where the next one starts. The last edge is never covered.
+        runs = numpy.flatnonzero(numpy.diff(edge_state, prepend=-2))
+        run_start, run_end = runs[:-1], runs[1:]
+        keep = edge_state[run_start] != -1
+        self.data = numpy.zeros(numpy.count_nonzero(keep), dtype=self.dtype)
+        self.data['start'] = edges[run_start[keep]]
+        self.data['end'] = edges[run_end[keep]]
+        self.data['state'] = edge_state[run_start[keep]]
+
+    @classmethod
+    def from_data(cls, data):
+        """Create an index from the segment array of another index"""
+        index = cls.__new__(cls)
+        index.data = data
+        return index
+
+    @property
+    def start(self):
+        return self.data['start']
+
+    @property
+    def end(self):
+        return self.data['end']
+
+    @property
+    def state(self):
+        return self.data['state']
+
+    def __len__(self):
+        return len(self.data)
+
+    def _locate(self, times):
+        """Return the index of the segment containing each time, or -1"""
+        times = numpy.asarray(times)
+        loc = numpy.searchsorted(self.start, times, side='right') - 1
+        inside = loc >= 0
+        inside[inside] = times[inside] < self.end[loc[inside]]
+        loc[~inside] = -1
+        return loc
+
+    def contains(self, times):
+        """Return a boolean array, True for the times within a segment"""
+        return self._locate(times) >= 0
+
+    def state_at(self, times, default=0):
+        """Return the state at each time, default if within no segment"""
+        loc = self._locate(times)
+        if len(self) == 0:
+            return numpy.full(len(loc), default)
+        return numpy.where(loc >= 0, self.state[loc], default)
+
+    def indices_within(self, times):
+        """Return the sorted indices of the times within a segment"""
+        return numpy.flatnonzero(self.contains(times))
+
+    def indices_outside(self, times):
+        """Return the sorted indices of the times within no segment"""
+        return numpy.flatnonzero(~self.contains(times))
+
+    def segments(self, state=None):
+        """Return the coalesced segment list, optionally of a single state"""
+        data = self.data
+        if state is not None:
+            data = data[data['state'] == state]
+        return start_end_to_segments(data['start'], data['end']).coalesce()
+
+    def save(self, filename):
+        """Write the index to a binary .npy file, or open file object"""
+        numpy.save(filename, self.data)
+
+    @classmethod
+    def load(cls, filename, mmap=False):
+        """Read an index written by save, optionally memory mapping it"""
+        data = numpy.load(filename, mmap_mode='r' if mmap else None)
+        if data.dtype != cls.dtype:
+            raise ValueError("%s does not contain a segment index" % filename)
+        return cls.from_data(data)
+
+
+def _read_segments_by_definer(segment_file, segment_name=None, ifo=None):
+    """Read the start and end times of the segments matching the definer"""
     from pycbc.io.ligolw import LIGOLWContentHandler as h
 
     indoc = ligolw_utils.load_filename(segment_file, False, contenthandler=h)
@@ -134,11 +248,86 @@ def select_segments_by_definer(segment_file, segment_name=None, ifo=None):
     start, end = start + 1e-9 * start_ns, end + 1e-9 * end_ns
     did = segment_table.getColumnByName('segment_def_id')
 
-    keep = numpy.array([d in valid_id for d in did])
-    if sum(keep) > 0:
-        return start_end_to_segments(start[keep], end[keep])
-    else:
-        return segmentlist([])
+    keep = numpy.array([d in valid_id for d in did], dtype=bool)
+    return start[keep], end[keep]
+
+
+# Segment indices already built in this process, by file and definer
+_segment_index_cache = {}
+
+
+def segment_index_by_definer(segment_file, segment_name=None, ifo=None):
+    """ Return a SegmentIndex of the segments that match the segment name
+
+    The index of each segment file and definer is only built once per
+    process. If the PYCBC_SEGMENT_INDEX_CACHE environment variable gives a
+    directory, the index is also stored there, and loaded by later
+    processes instead of parsing the segment file again. Indices are
+    rebuilt when the segment file is modified.
+
+    Parameters
+    ----------
+    segment_file: str
+        path to segment xml file
+    segment_name: str, optional
+        Name of segment
+    ifo: str, optional
+
+    Returns
+    -------
+    index: SegmentIndex
+    """
+    path = os.path.abspath(segment_file)
+    file_stat = os.stat(path)
+    key = (path, file_stat.st_mtime_ns, file_stat.st_size, segment_name, ifo)
+    if key in _segment_index_cache:
+        return _segment_index_cache[key]
+
+    cache_dir = os.environ.get('PYCBC_SEGMENT_INDEX_CACHE')
+    cache_file = None
+    index = None
+    if cache_dir:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        cache_file = os.path.join(cache_dir, name + '.npy')
+        if os.path.exists(cache_file):
+            logger.info('Loading segment index of %s from %s',
+                        segment_file, cache_file)
+            index = SegmentIndex.load(cache_file)
+
+    if index is None:
+        index = SegmentIndex(*_read_segments_by_definer(segment_file,
+                                                        segment_name, ifo))
+        if cache_file is not None:
+            # Write to a temporary file first so that concurrent processes
+            # never see a partially written index
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.npy')
+            with os.fdopen(fd, 'wb') as fp:
+                index.save(fp)
+            os.replace(tmp, cache_file)
+
+    _segment_index_cache[key] = index
+    return index
+
+
+def select_segments_by_definer(segment_file, segment_name=None, ifo=None):
+    """ Return the list of segments that match the segment name
+
+    Parameters
+    ----------
+    segment_file: str
+        path to segment xml file
+
+    segment_name: str
+        Name of segment
+    ifo: str, optional
+
+    Returns
+    -------
+    seg: list of segments, coalesced
+    """
+    return segment_index_by_definer(segment_file, segment_name,
+                                    ifo).segments()
 
 def indices_within_segments(times, segment_files, ifo=None, segment_name=None):
     """ Return the list of indices that should be vetoed by the segments in the
@@ -162,18 +351,22 @@ def indices_within_segments(times, segment_files, ifo=None, segment_name=None):
     segmentlist:
         The segment list corresponding to the selected time.
     """
-    veto_segs = segmentlist([])
     indices = numpy.array([], dtype=numpy.uint32)
-    for veto_file in segment_files:
-        veto_segs += select_segments_by_definer(veto_file, segment_name, ifo)
-    veto_segs.coalesce()
+    if isinstance(segment_files, str):
+        segment_files = [segment_files]
+    indices_by_file = [segment_index_by_definer(f, segment_name, ifo)
+                       for f in segment_files]
+    if len(indices_by_file) == 1:
+        index = indices_by_file[0]
+    else:
+        index = SegmentIndex(
+            numpy.concatenate([i.start for i in indices_by_file]),
+            numpy.concatenate([i.end for i in indices_by_file]))
 
-    start, end = segments_to_start_end(veto_segs)
-    if len(start) > 0:
-        idx = indices_within_times(times, start, end)
-        indices = numpy.union1d(indices, idx)
+    if len(index) > 0:
+        indices = index.indices_within(times)
 
-    return indices, veto_segs.coalesce()
+    return indices, index.segments()
 
 def indices_outside_segments(times, segment_files, ifo=None, segment_name=None):
     """ Return the list of indices that are outside the segments in the
@@ -1,4 +1,10 @@
 import os
+import contextlib
+import fcntl
+import hashlib
+import logging
+import platform
+import tempfile
 from pycbc.types import zeros
 import numpy as _np
 import ctypes
@@ -7,6 +13,8 @@ from pycbc.libutils import get_ctypes_library
 from .core import _BaseFFT, _BaseIFFT
 from ..types import check_aligned
 
+logger = logging.getLogger('pycbc.fft.fftw')
+
 # IMPORTANT NOTE TO PYCBC DEVELOPERS:
 # Because this module is loaded automatically when present, and because
 # no FFTW function should be called until the user has had the chance
@@ -235,6 +243,114 @@ def export_single_wisdom_to_filename(filename):
 def export_double_wisdom_to_filename(filename):
     wisdom_io(filename, 'double', 'export')
 
+# Wisdom is cached per host, as it depends on the CPU model and the version of
+# FFTW. Many jobs on hosts of the same model can then share planning done once.
+
+def _cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def _fftw_version(precision):
+    lib, name = {'float': (float_lib, 'fftwf_version'),
+                 'double': (double_lib, 'fftw_version')}[precision]
+    # The version is a char array, not a pointer to one
+    version = ctypes.c_char.in_dll(lib, name)
+    return ctypes.cast(ctypes.addressof(version),
+                       ctypes.c_char_p).value.decode()
+
+def default_wisdom_cache_dir():
+    """Return the directory caching wisdom for each host's CPU model.
+
+    This is given by the PYCBC_FFTW_WISDOM_DIR environment variable, and
+    otherwise is pycbc/fftw_wisdom in the user's cache directory.
+    """
+    if 'PYCBC_FFTW_WISDOM_DIR' in os.environ:
+        return os.environ['PYCBC_FFTW_WISDOM_DIR']
+    cache = os.environ.get('XDG_CACHE_HOME',
+                           os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache, 'pycbc', 'fftw_wisdom')
+
+def host_wisdom_filename(precision, cache_dir=None):
+    """Return the file caching wisdom of the given precision for this host.
+
+    Parameters
+    ----------
+    precision : {'float', 'double'}
+        The precision of the wisdom.
+    cache_dir : {None, str}, optional
+        The wisdom cache directory, by default that given by
+        default_wisdom_cache_dir.
+    """
+    if cache_dir is None:
+        cache_dir = default_wisdom_cache_dir()
+    key = '{}:{}'.format(_cpu_model(), _fftw_version(precision))
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, '{}-{}.wisdom'.format(name, precision))
+
+@contextlib.contextmanager
+def _wisdom_lock(filename, exclusive):
+    # Closing the lock file releases the lock
+    try:
+        lock = open(filename + '.lock', 'a')
+    except OSError as err:
+        if exclusive:
+            raise
+        # The cache may be read only, such as one shared by a site
+        logger.warning('Unable to lock %s, reading it unlocked: %s',
+                       filename, err)
+        yield
+        return
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def import_host_wisdom(precision, cache_dir=None):
+    """Import the cached wisdom of the given precision for this host.
+
+    Returns
+    -------
+    imported : bool
+        Whether there was any wisdom to import.
+    """
+    filename = host_wisdom_filename(precision, cache_dir=cache_dir)
+    if not os.path.exists(filename):
+        logger.info('No %s precision wisdom cached for this host',
+                    precision)
+        return False
+    with _wisdom_lock(filename, exclusive=False):
+        wisdom_io(filename, precision, 'import')
+    logger.info('Imported %s precision wisdom from %s', precision, filename)
+    return True
+
+def export_host_wisdom(precision, cache_dir=None):
+    """Add the wisdom of the given precision to the cache for this host.
+
+    Wisdom already in the cache, which may have been added by other jobs
+    since it was imported, is merged with the current wisdom first. The
+    cache is locked meanwhile, and replaced atomically.
+    """
+    filename = host_wisdom_filename(precision, cache_dir=cache_dir)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with _wisdom_lock(filename, exclusive=True):
+        if os.path.exists(filename):
+            wisdom_io(filename, precision, 'import')
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                       suffix='.tmp')
+        os.close(fd)
+        try:
+            wisdom_io(tmpname, precision, 'export')
+            os.replace(tmpname, filename)
+        except:
+            os.unlink(tmpname)
+            raise
+    logger.info('Exported %s precision wisdom to %s', precision, filename)
+
 def set_planning_limit(time):
     if not _fftw_threaded_set:
         set_threads_backend()
@@ -333,6 +449,21 @@ def plan(size, idtype, odtype, direction, mlvl, aligned, nthreads, inplace):
     return theplan, destroy
 
 
+# Plans are kept for the life of the process, keyed by everything which
+# determines them, so that each is only made once. A plan may be executed on
+# any arrays of the same size, type and alignment as it was made for.
+_plan_cache = {}
+
+def cached_plan(size, idtype, odtype, direction, mlvl, aligned, nthreads,
+                inplace):
+    """Return a plan as made by plan, making it only if it is not cached."""
+    key = ('single', size, 1, str(_np.dtype(idtype)), str(_np.dtype(odtype)),
+           direction, mlvl, aligned, nthreads, inplace)
+    if key not in _plan_cache:
+        _plan_cache[key], _ = plan(size, idtype, odtype, direction, mlvl,
+                                   aligned, nthreads, inplace)
+    return _plan_cache[key]
+
 # Note that we don't need to check whether we've set the threading backend
 # in the following functions, since execute is not called directly and
 # the fft and ifft will call plan first.
@@ -342,18 +473,16 @@ def execute(plan, invec, outvec):
     f(plan, invec.ptr, outvec.ptr)
 
 def fft(invec, outvec, prec, itype, otype):
-    theplan, destroy = plan(len(invec), invec.dtype, outvec.dtype, FFTW_FORWARD,
-                            get_measure_level(),(check_aligned(invec.data) and check_aligned(outvec.data)),
+    theplan = cached_plan(len(invec), invec.dtype, outvec.dtype, FFTW_FORWARD,
+                          get_measure_level(),(check_aligned(invec.data) and check_aligned(outvec.data)),
                    _scheme.mgr.state.num_threads, (invec.ptr == outvec.ptr))
     execute(theplan, invec, outvec)
-    destroy(theplan)
 
 def ifft(invec, outvec, prec, itype, otype):
-    theplan, destroy = plan(len(outvec), invec.dtype, outvec.dtype, FFTW_BACKWARD,
-                            get_measure_level(),(check_aligned(invec.data) and check_aligned(outvec.data)),
+    theplan = cached_plan(len(outvec), invec.dtype, outvec.dtype, FFTW_BACKWARD,
+                          get_measure_level(),(check_aligned(invec.data) and check_aligned(outvec.data)),
                    _scheme.mgr.state.num_threads, (invec.ptr == outvec.ptr))
     execute(theplan, invec, outvec)
-    destroy(theplan)
 
 
 # Class based API
@@ -422,10 +551,16 @@ def _fftw_setup(fftobj):
     nthreads = _scheme.mgr.state.num_threads
     if not _fftw_threaded_set:
         set_threads_backend()
-    if nthreads != _fftw_current_nthreads:
-        _fftw_plan_with_nthreads(nthreads)
     mlvl = get_measure_level()
     aligned = check_aligned(fftobj.invec.data) and check_aligned(fftobj.outvec.data)
+    key = ('many', fftobj.size, fftobj.nbatch, len(fftobj.invec),
+           len(fftobj.outvec), fftobj.idist, fftobj.odist,
+           str(fftobj.invec.dtype), str(fftobj.outvec.dtype),
+           fftobj.forward, mlvl, aligned, nthreads, fftobj.inplace)
+    if key in _plan_cache:
+        return _plan_cache[key]
+    if nthreads != _fftw_current_nthreads:
+        _fftw_plan_with_nthreads(nthreads)
     flags = get_flag(mlvl, aligned)
     plan_func = _plan_funcs_dict[ (str(fftobj.invec.dtype), str(fftobj.outvec.dtype)) ]
     tmpin = zeros(len(fftobj.invec), dtype = fftobj.invec.dtype)
@@ -448,6 +583,7 @@ def _fftw_setup(fftobj):
                          flags)
     del tmpin
     del tmpout
+    _plan_cache[key] = plan
     return plan
 
 class FFT(_BaseFFT):
@@ -505,6 +641,14 @@ def insert_fft_options(optgroup):
     optgroup.add_argument("--fftw-import-system-wisdom",
                           help = "If given, call fftw[f]_import_system_wisdom()",
                           action = "store_true")
+    optgroup.add_argument("--fftw-host-wisdom",
+                          help="If given, read wisdom cached for this host's "
+                               "CPU model and FFTW version before planning, "
+                               "and add any new wisdom to the cache when "
+                               "done. The cache directory is given by "
+                               "PYCBC_FFTW_WISDOM_DIR, by default "
+                               "~/.cache/pycbc/fftw_wisdom.",
+                          action="store_true")
 
 def verify_fft_options(opt,parser):
     """Parses the FFT options and verifies that they are
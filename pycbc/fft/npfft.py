@@ -36,32 +36,36 @@ logger = logging.getLogger('pycbc.events.npfft')
 _INV_FFT_MSG = ("I cannot perform an {} between data with an input type of "
                 "{} and an output type of {}")
 
-def fft(invec, outvec, _, itype, otype):
+def fft(invec, outvec, _, itype, otype, nbatch=1):
     if invec.ptr == outvec.ptr:
         raise NotImplementedError("numpy backend of pycbc.fft does not "
                                   "support in-place transforms")
+    # Batched transforms are stored contiguously, one after another
+    indata = invec.data.reshape(nbatch, -1)
     if itype == 'complex' and otype == 'complex':
-        outvec.data[:] = numpy.asarray(numpy.fft.fft(invec.data),
-                                       dtype=outvec.dtype)
+        outvec.data[:] = numpy.asarray(numpy.fft.fft(indata),
+                                       dtype=outvec.dtype).ravel()
     elif itype == 'real' and otype == 'complex':
-        outvec.data[:] = numpy.asarray(numpy.fft.rfft(invec.data),
-                                       dtype=outvec.dtype)
+        outvec.data[:] = numpy.asarray(numpy.fft.rfft(indata),
+                                       dtype=outvec.dtype).ravel()
     else:
         raise ValueError(_INV_FFT_MSG.format("FFT", itype, otype))
 
 
-def ifft(invec, outvec, _, itype, otype):
+def ifft(invec, outvec, _, itype, otype, nbatch=1):
     if invec.ptr == outvec.ptr:
         raise NotImplementedError("numpy backend of pycbc.fft does not "
                                   "support in-place transforms")
+    indata = invec.data.reshape(nbatch, -1)
+    size = len(outvec) // nbatch
     if itype == 'complex' and otype == 'complex':
-        outvec.data[:] = numpy.asarray(numpy.fft.ifft(invec.data),
-                                       dtype=outvec.dtype)
-        outvec *= len(outvec)
+        outvec.data[:] = numpy.asarray(numpy.fft.ifft(indata),
+                                       dtype=outvec.dtype).ravel()
+        outvec *= size
     elif itype == 'complex' and otype == 'real':
-        outvec.data[:] = numpy.asarray(numpy.fft.irfft(invec.data,len(outvec)),
-                                       dtype=outvec.dtype)
-        outvec *= len(outvec)
+        outvec.data[:] = numpy.asarray(numpy.fft.irfft(indata, size),
+                                       dtype=outvec.dtype).ravel()
+        outvec *= size
     else:
         raise ValueError(_INV_FFT_MSG.format("IFFT", itype, otype))
 
@@ -82,7 +86,8 @@ class FFT(_BaseFFT):
         self.prec, self.itype, self.otype = _check_fft_args(invec, outvec)
 
     def execute(self):
-        fft(self.invec, self.outvec, self.prec, self.itype, self.otype)
+        fft(self.invec, self.outvec, self.prec, self.itype, self.otype,
+            nbatch=self.nbatch)
 
 
 class IFFT(_BaseIFFT):
@@ -95,4 +100,5 @@ class IFFT(_BaseIFFT):
         self.prec, self.itype, self.otype = _check_fft_args(invec, outvec)
 
     def execute(self):
-        ifft(self.invec, self.outvec, self.prec, self.itype, self.otype)
+        ifft(self.invec, self.outvec, self.prec, self.itype, self.otype,
+             nbatch=self.nbatch)
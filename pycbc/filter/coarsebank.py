@@ -0,0 +1,310 @@
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+This module provides a two stage matched filter over a template bank.
+
+A sparse coarse bank is filtered first, at a reduced SNR threshold. Each
+template of the full bank is then only filtered against the data segments
+where one of its neighbours in the coarse bank has a point above that
+threshold. The neighbours come from a graph of the matches between the two
+banks, which is made in advance by pycbc_coarse_bank_graph.
+
+If every template of the full bank which has neighbours matches each of them
+at no less than the graph's minimal match, a signal seen in a full bank
+template with an SNR above threshold is seen in its neighbours with an SNR
+above the minimal match times the threshold. Choosing the coarse SNR
+fraction no greater than the minimal match bounds the sensitivity loss to
+what noise does to the coarse SNR. Templates with no neighbours are always
+filtered.
+"""
+
+import logging
+import numpy
+
+from pycbc.filter.matchedfilter import MatchedFilterControl, match
+from pycbc.io import HFile
+from pycbc.pnutils import mass1_mass2_to_tau0_tau3
+
+logger = logging.getLogger('pycbc.filter.coarsebank')
+
+
+def insert_coarse_bank_option_group(parser):
+    """Add options for filtering a coarse bank first to executable."""
+    coarse_group = parser.add_argument_group(
+        "Options for a two stage filter, where a coarse template bank is "
+        "filtered first and templates of the full bank are only filtered "
+        "against the segments where one of their neighbours in the coarse "
+        "bank has a peak in SNR.")
+    coarse_group.add_argument("--coarse-bank-file",
+                              help="The coarse template bank to filter "
+                                   "first. If not given, all templates are "
+                                   "filtered against all segments.")
+    coarse_group.add_argument("--coarse-bank-graph",
+                              help="File giving the neighbours of the full "
+                                   "bank's templates in the coarse bank, as "
+                                   "made by pycbc_coarse_bank_graph.")
+    coarse_group.add_argument("--coarse-bank-snr-fraction", type=float,
+                              default=0.9,
+                              help="Fraction of the SNR threshold which a "
+                                   "coarse template's SNR must pass for its "
+                                   "neighbours to be filtered. This should "
+                                   "be no greater than the minimal match "
+                                   "of the graph. Default 0.9.")
+
+
+def verify_coarse_bank_options(opt, parser):
+    """Parses the coarse bank options and verifies that they are
+    reasonable.
+
+    Parameters
+    ----------
+    opt : object
+        Result of parsing the CLI with OptionParser, or any object with the
+        required attributes.
+    parser : object
+        OptionParser instance.
+    """
+    if (opt.coarse_bank_file is None) != (opt.coarse_bank_graph is None):
+        parser.error("--coarse-bank-file and --coarse-bank-graph must be "
+                     "given together")
+    if not 0 < opt.coarse_bank_snr_fraction <= 1:
+        parser.error("--coarse-bank-snr-fraction must be in (0, 1]")
+
+
+def bank_match_graph(bank, coarse_bank, psd, min_match,
+                     low_frequency_cutoff, tau0_window=None):
+    """Find the neighbours of each template of a bank in a coarse bank.
+
+    Parameters
+    ----------
+    bank : pycbc.waveform.FilterBank
+        The full template bank.
+    coarse_bank : pycbc.waveform.FilterBank
+        The coarse template bank, generated with the same length and
+        frequency spacing as the full bank. Its templates are kept in
+        memory once generated, so it should not be given output memory.
+    psd : FrequencySeries
+        The PSD to use when calculating matches.
+    min_match : float
+        The minimal match of a template to its neighbours.
+    low_frequency_cutoff : float
+        The frequency to begin the match calculation, and at which chirp
+        times are calculated.
+    tau0_window : {None, float}, optional
+        If given, only calculate matches between templates whose chirp times
+        differ by less than this many seconds.
+
+    Returns
+    -------
+    template_id : numpy.ndarray
+        The index in the full bank of each pair of neighbours.
+    coarse_id : numpy.ndarray
+        The index in the coarse bank of each pair of neighbours.
+    matches : numpy.ndarray
+        The match of each pair of neighbours.
+    """
+    tau0, _ = mass1_mass2_to_tau0_tau3(bank.table['mass1'],
+                                       bank.table['mass2'],
+                                       low_frequency_cutoff)
+    coarse_tau0, _ = mass1_mass2_to_tau0_tau3(coarse_bank.table['mass1'],
+                                              coarse_bank.table['mass2'],
+                                              low_frequency_cutoff)
+    sort = coarse_tau0.argsort()
+    coarse_tau0 = coarse_tau0[sort]
+
+    coarse_templates = {}
+    template_id = []
+    coarse_id = []
+    matches = []
+    for t_num in range(len(bank)):
+        if tau0_window is None:
+            candidates = sort
+        else:
+            lid = numpy.searchsorted(coarse_tau0, tau0[t_num] - tau0_window)
+            rid = numpy.searchsorted(coarse_tau0, tau0[t_num] + tau0_window)
+            candidates = sort[lid:rid]
+
+        template = bank[t_num]
+        norm = template.sigmasq(psd)
+        for c_num in candidates:
+            if c_num not in coarse_templates:
+                coarse_templates[c_num] = coarse_bank[c_num]
+            coarse = coarse_templates[c_num]
+            mval, _ = match(template, coarse, psd=psd,
+                            low_frequency_cutoff=low_frequency_cutoff,
+                            v1_norm=norm, v2_norm=coarse.sigmasq(psd))
+            if mval >= min_match:
+                template_id.append(t_num)
+                coarse_id.append(c_num)
+                matches.append(mval)
+
+    template_id = numpy.array(template_id, dtype=numpy.int64)
+    num = len(numpy.unique(template_id))
+    logger.info("%d of %d templates have neighbours in the coarse bank, "
+                "with %d neighbours in all", num, len(bank), len(template_id))
+    return (template_id, numpy.array(coarse_id, dtype=numpy.int64),
+            numpy.array(matches, dtype=numpy.float32))
+
+
+class CoarseBankFilter(object):
+    """Choose the segments to filter each template against from the peaks
+    of its neighbours in a coarse template bank.
+
+    Parameters
+    ----------
+    bank : pycbc.waveform.FilterBank
+        The full template bank to filter.
+    coarse_bank : {None, pycbc.waveform.FilterBank}
+        The coarse template bank, generating its templates into the memory
+        later given to filter_coarse_bank. If None, all templates are
+        filtered against all segments. This must be the bank the graph was
+        made from, in the same order.
+    graph_file : {None, str}
+        File giving the neighbours of the full bank's templates in the
+        coarse bank. Neighbours are found by template hash, so the full
+        bank may be a subset of the bank the graph was made from.
+    snr_fraction : float
+        Fraction of the SNR threshold which a coarse template's SNR must pass
+        for its neighbours to be filtered.
+    """
+    def __init__(self, bank, coarse_bank=None, graph_file=None,
+                 snr_fraction=0.9):
+        self.enabled = coarse_bank is not None
+        self.coarse_bank = coarse_bank
+        self.snr_fraction = snr_fraction
+        self.peaks = None
+        if not self.enabled:
+            return
+
+        with HFile(graph_file, 'r') as f:
+            graph_hash = f['template_hash'][:]
+            graph_coarse = f['coarse_id'][:]
+            coarse_hash = f['coarse_template_hash'][:]
+            self.min_match = f.attrs['min_match']
+            coarse_file = f.attrs['coarse_bank_file']
+
+        # The graph gives neighbours by their index in the coarse bank, so
+        # it must be the bank the graph was made from
+        if len(coarse_hash) != len(coarse_bank) or \
+                (coarse_hash != coarse_bank.table.template_hash).any():
+            raise ValueError("The coarse bank does not match the coarse "
+                             "bank of the graph %s, which was made from %s"
+                             % (graph_file, coarse_file))
+        if snr_fraction > self.min_match:
+            logger.warning("The coarse SNR fraction %s is greater than the "
+                           "minimal match of the coarse bank graph %s",
+                           snr_fraction, self.min_match)
+
+        # Find the neighbours of each template in this bank, and the coarse
+        # templates which are needed for them
+        order = graph_hash.argsort(kind='stable')
+        graph_hash = graph_hash[order]
+        graph_coarse = graph_coarse[order]
+        hashes = numpy.asarray(bank.table.template_hash)
+        lid = numpy.searchsorted(graph_hash, hashes, side='left')
+        rid = numpy.searchsorted(graph_hash, hashes, side='right')
+        self.coarse_templates = numpy.unique(
+            numpy.concatenate([graph_coarse[l:r] for l, r in zip(lid, rid)]
+                              + [numpy.array([], dtype=int)]).astype(int))
+        local = numpy.searchsorted(self.coarse_templates, graph_coarse)
+        self.neighbours = [local[l:r] for l, r in zip(lid, rid)]
+        logger.info("Filtering %d coarse templates for %d templates, %d of "
+                    "which have no neighbours and are always filtered",
+                    len(self.coarse_templates), len(self.neighbours),
+                    sum(len(n) == 0 for n in self.neighbours))
+
+    @classmethod
+    def from_cli(cls, opt, bank, coarse_bank=None):
+        """Initialize from the command line options.
+
+        Parameters
+        ----------
+        opt : object
+            Result of parsing the CLI with OptionParser.
+        bank : pycbc.waveform.FilterBank
+            The full template bank to filter.
+        coarse_bank : {None, pycbc.waveform.FilterBank}
+            The coarse template bank read from --coarse-bank-file.
+        """
+        return cls(bank, coarse_bank=coarse_bank,
+                   graph_file=opt.coarse_bank_graph,
+                   snr_fraction=opt.coarse_bank_snr_fraction)
+
+    def filter_coarse_bank(self, low_frequency_cutoff, snr_threshold, tlen,
+                           delta_f, dtype, segments, template_mem):
+        """Filter the needed coarse templates against each segment, and
+        record where each has a point above the coarse threshold.
+
+        Parameters
+        ----------
+        low_frequency_cutoff : float
+            The frequency to begin the filter calculation.
+        snr_threshold : float
+            The SNR threshold of the full bank; the coarse threshold is this
+            times the coarse SNR fraction.
+        tlen : int
+            The length of each data segment in the time domain
+        delta_f : float
+            The frequency spacing of the data segments
+        dtype : complex64
+            The type of the template and data memory
+        segments : list
+            List of overwhitened FrequencySeries data segments.
+        template_mem : Array
+            The memory the coarse bank generates its templates into.
+        """
+        if not self.enabled:
+            return
+
+        matched_filter = MatchedFilterControl(
+            low_frequency_cutoff, None, snr_threshold * self.snr_fraction,
+            tlen, delta_f, dtype, segments, template_mem, False)
+        self.peaks = numpy.zeros((len(self.coarse_templates), len(segments)),
+                                 dtype=bool)
+        for i, c_num in enumerate(self.coarse_templates):
+            template = self.coarse_bank[c_num]
+            for s_num, stilde in enumerate(segments):
+                sigmasq = template.sigmasq(stilde.psd)
+                idx = matched_filter.matched_filter_and_cluster(s_num,
+                                                                sigmasq)[3]
+                self.peaks[i, s_num] = len(idx) > 0
+
+        num = sum(self.template_segment_checker(t_num, s_num)
+                  for t_num in range(len(self.neighbours))
+                  for s_num in range(len(segments)))
+        logger.info("Filtering %d of %d template and segment pairs",
+                    num, len(self.neighbours) * len(segments))
+
+    def template_segment_checker(self, t_num, s_num):
+        """Test if a template should be filtered against a segment.
+
+        Parameters
+        ----------
+        t_num : int
+            Index of the template in the full bank.
+        s_num : int
+            Index of the segment.
+
+        Returns
+        -------
+        filter : bool
+            True unless no neighbour of the template in the coarse bank has
+            a point above the coarse threshold in the segment.
+        """
+        if not self.enabled:
+            return True
+        neighbours = self.neighbours[t_num]
+        if len(neighbours) == 0:
+            return True
+        return bool(self.peaks[neighbours, s_num].any())
@@ -27,7 +27,9 @@ utilities.
 """
 
 import logging
+import contextlib
 from math import sqrt
+from time import perf_counter
 import numpy
 
 from pycbc.types import TimeSeries, FrequencySeries, zeros, Array
@@ -472,6 +474,198 @@ class MatchedFilterControl(object):
             raise ValueError("Invalid upsample method")
 
 
+class BatchMatchedFilterControl(object):
+    def __init__(self, low_frequency_cutoff, high_frequency_cutoff,
+                 snr_threshold, tlen, delta_f, dtype, segment_list,
+                 batch_size, use_cluster, cluster_function='symmetric'):
+        """ Create a matched filter engine which filters a batch of templates
+        against each data segment at once.
+
+        The templates are stored one after another in a single block of
+        memory, so the correlation of the whole batch with a segment is done
+        in one pass and the inverse FFTs are done by one batched transform.
+        Thresholding is done on the full batch of SNR time series together,
+        and only the templates with points above threshold are clustered.
+        The results for each template are the same as those given by
+        MatchedFilterControl.
+
+        Parameters
+        ----------
+        low_frequency_cutoff : {None, float}, optional
+            The frequency to begin the filter calculation. If None, begin at the
+            first frequency after DC.
+        high_frequency_cutoff : {None, float}, optional
+            The frequency to stop the filter calculation. If None, continue to the
+            the nyquist frequency.
+        snr_threshold : float
+            The minimum snr to return when filtering
+        tlen : int
+            The length of each data segment in the time domain
+        delta_f : float
+            The frequency spacing of the data segments
+        dtype : complex64
+            The type of the template and data memory
+        segment_list : list
+            List of FrequencySeries that are the Fourier-transformed data segments
+        batch_size : int
+            The maximum number of templates to filter together. The memory
+            for each template is given by the `templates` attribute, and
+            should be given as the 'out' parameter to waveform.FilterBank
+            when generating that template.
+        use_cluster : boolean
+            If true, cluster triggers above threshold using a window; otherwise,
+            only apply a threshold.
+        cluster_function : {symmetric, str}, optional
+            Which method is used to cluster triggers over time. If 'findchirp', a
+            sliding forward window; if 'symmetric', each window's peak is compared
+            to the windows before and after it, and only kept as a trigger if larger
+            than both.
+        """
+        if cluster_function not in ['symmetric', 'findchirp']:
+            raise ValueError("MatchedFilter: 'cluster_function' must be either 'symmetric' or 'findchirp'")
+        if batch_size < 1:
+            raise ValueError("MatchedFilter: 'batch_size' must be at least 1")
+
+        self.tlen = tlen
+        self.delta_f = delta_f
+        self.delta_t = 1.0/(self.delta_f * self.tlen)
+        self.dtype = dtype
+        self.snr_threshold = snr_threshold
+        self.flow = low_frequency_cutoff
+        self.fhigh = high_frequency_cutoff
+        self.segments = segment_list
+        self.batch_size = int(batch_size)
+        self.use_cluster = use_cluster
+        self.cluster_function = cluster_function
+
+        self.kmin, self.kmax = get_cutoff_indices(self.flow, self.fhigh,
+                                                  self.delta_f, self.tlen)
+
+        size = self.tlen * self.batch_size
+        self.template_mem = zeros(size, dtype=self.dtype)
+        self.corr_mem = zeros(size, dtype=self.dtype)
+        self.snr_mem = zeros(size, dtype=self.dtype)
+
+        def split(mem):
+            return [mem[i * self.tlen:(i + 1) * self.tlen]
+                    for i in range(self.batch_size)]
+        self.templates = split(self.template_mem)
+        self.corrs = split(self.corr_mem)
+        self.snrs = split(self.snr_mem)
+
+        # The correlation and ifft engines for a batch of n templates, which
+        # is less than the batch size only for the last batch of a bank
+        self._engines = {}
+        # The threshold and cluster engines for each template in the batch,
+        # keyed by the analysis slice of the segment
+        self._clusterers = {}
+
+    def _get_engines(self, num):
+        if num not in self._engines:
+            corr_slice = slice(self.kmin, self.kmax)
+            correlator = BatchCorrelator(
+                [t[corr_slice] for t in self.templates[:num]],
+                [c[corr_slice] for c in self.corrs[:num]],
+                self.kmax - self.kmin)
+            ifft = IFFT(self.corr_mem[:num * self.tlen],
+                        self.snr_mem[:num * self.tlen],
+                        nbatch=num, size=self.tlen)
+            self._engines[num] = correlator, ifft
+        return self._engines[num]
+
+    def _get_clusterer(self, i, analyze):
+        key = (i, analyze.start, analyze.stop)
+        if key not in self._clusterers:
+            self._clusterers[key] = \
+                events.ThresholdCluster(self.snrs[i][analyze])
+        return self._clusterers[key]
+
+    def matched_filter_and_cluster(self, segnum, template_norms, window,
+                                   epoch=None):
+        """ Returns, for each template in the batch, the complex snr
+        timeseries, normalization of the complex snr, the correlation vector
+        frequency series, the list of indices of the triggers, and the snr
+        values at the trigger locations. Returns empty lists for these for
+        templates with no points above the threshold.
+
+        Calculated the matched filter, threshold, and cluster.
+
+        Parameters
+        ----------
+        segnum : int
+            Index into the list of segments at construction against which to
+            filter.
+        template_norms : list of {float, None}
+            The htilde, template normalization factor of each template in the
+            batch, in the order of the `templates` memory. A template whose
+            norm is None is not filtered against this segment.
+        window : int
+            Size of the window over which to cluster triggers, in samples
+
+        Returns
+        -------
+        results : list of tuples
+            One tuple of (snr, norm, correlation, idx, snrv) for each
+            template, as returned by MatchedFilterControl.
+        """
+        num = len(template_norms)
+        if num > self.batch_size:
+            raise ValueError("MatchedFilter: %d templates is more than the "
+                             "batch size of %d" % (num, self.batch_size))
+
+        empty = [], [], [], [], []
+        active = numpy.array([n is not None for n in template_norms])
+        if not active.any():
+            return [empty] * num
+
+        norms = numpy.ones(num)
+        norms[active] = [(4.0 * self.delta_f) / sqrt(n)
+                         for n in template_norms if n is not None]
+
+        correlator, ifft = self._get_engines(num)
+        seg = self.segments[segnum]
+        correlator.execute(seg[self.kmin:self.kmax])
+        ifft.execute()
+
+        # Threshold all of the snr time series in the batch together
+        analyze = seg.analyze
+        snr = self.snr_mem.data[:num * self.tlen].reshape(num, self.tlen)
+        snr = snr[:, analyze]
+        thresh = (self.snr_threshold / norms) ** 2.
+        above = (snr.real ** 2. + snr.imag ** 2.) > \
+            thresh.astype(numpy.float32)[:, None]
+        above[~active] = False
+        rows, locs = numpy.nonzero(above)
+        bounds = numpy.searchsorted(rows, numpy.arange(num + 1))
+
+        results = []
+        for i in range(num):
+            if bounds[i] == bounds[i + 1]:
+                results.append(empty)
+                continue
+
+            idx = locs[bounds[i]:bounds[i + 1]].astype(numpy.uint32)
+            snrv = snr[i, idx]
+            if self.use_cluster and self.cluster_function == 'symmetric':
+                clusterer = self._get_clusterer(i, analyze)
+                snrv, idx = clusterer.threshold_and_cluster(
+                    self.snr_threshold / norms[i], window)
+            elif self.use_cluster:
+                idx, snrv = events.cluster_reduce(idx, snrv, window)
+
+            if len(idx) == 0:
+                results.append(empty)
+                continue
+
+            logger.info("%d points above threshold", len(idx))
+            snr_ts = TimeSeries(self.snrs[i], epoch=epoch,
+                                delta_t=self.delta_t, copy=False)
+            corr = FrequencySeries(self.corrs[i], delta_f=self.delta_f,
+                                   copy=False)
+            results.append((snr_ts, norms[i], corr, idx, snrv))
+        return results
+
+
 def compute_max_snr_over_sky_loc_stat(hplus, hcross, hphccorr,
                                                       hpnorm=None, hcnorm=None,
                                                       out=None, thresh=0,
@@ -1528,7 +1722,9 @@ class LiveBatchMatchedFilter(object):
                  maxelements=2**27,
                  snr_abort_threshold=None,
                  newsnr_threshold=None,
-                 max_triggers_in_batch=None):
+                 max_triggers_in_batch=None,
+                 timer=None,
+                 num_detectors=1):
         """Create a batched matchedfilter instance
 
         Parameters
@@ -1553,11 +1749,21 @@ class LiveBatchMatchedFilter(object):
             Record X number of the loudest triggers by SNR in each MPI
             process. Signal consistency values will also only be calculated
             for these triggers.
+        timer: {pycbc.live.StageTimer, None}
+            If given, the time spent in the FFT/correlation and in the signal
+            consistency tests is accumulated in this timer.
+        num_detectors: {int, 1}
+            Maximum number of detectors filtered together by
+            `process_multi_data`. The templates are correlated with the data
+            of every detector into a common workspace, so that each batch of
+            templates needs a single inverse FFT for all the detectors.
         """
         self.snr_threshold = snr_threshold
         self.snr_abort_threshold = snr_abort_threshold
         self.newsnr_threshold = newsnr_threshold
         self.max_triggers_in_batch = max_triggers_in_batch
+        self.timer = timer
+        self.num_detectors = num_detectors
 
         from pycbc import vetoes
         self.power_chisq = vetoes.SingleDetPowerChisq(chisq_bins, None)
@@ -1572,7 +1778,7 @@ class LiveBatchMatchedFilter(object):
         # Figure out how to chunk together the templates into groups to process
         _, counts = numpy.unique(durations, return_counts=True)
         tsamples = [(len(t) - 1) * 2 for t in templates]
-        grabs = maxelements / numpy.unique(tsamples)
+        grabs = maxelements / numpy.unique(tsamples) / num_detectors
 
         chunks = numpy.array([])
         num = 0
@@ -1599,11 +1805,15 @@ class LiveBatchMatchedFilter(object):
         self.tgroups, self.mids = [], []
         for i, size in mem_types:
             dur, count = i
-            self.out_mem[i] = zeros(size, dtype=numpy.complex64)
-            self.cout_mem[i] = zeros(size, dtype=numpy.complex64)
+            # The workspace of each detector follows the previous one
+            nbatch = count * num_detectors
+            self.out_mem[i] = zeros(size * num_detectors,
+                                    dtype=numpy.complex64)
+            self.cout_mem[i] = zeros(size * num_detectors,
+                                     dtype=numpy.complex64)
             self.ifts[i] = IFFT(self.cout_mem[i], self.out_mem[i],
-                                nbatch=count,
-                                size=len(self.cout_mem[i]) // count)
+                                nbatch=nbatch,
+                                size=len(self.cout_mem[i]) // nbatch)
 
         # Split the templates into their processing groups
         for dur, count in mem_ids:
@@ -1612,7 +1822,8 @@ class LiveBatchMatchedFilter(object):
             self.mids.append((dur, count))
             templates = templates[count:]
 
-        # Associate the snr and corr memory block to each template
+        # Associate the snr and corr memory block of each detector to each
+        # template. The `out` and `cout` attributes refer to the first one.
         self.corr = []
         for i, tgroup in enumerate(self.tgroups):
             psize = self.chunk_tsamples[i]
@@ -1620,15 +1831,55 @@ class LiveBatchMatchedFilter(object):
             e = psize
             mid = self.mids[i]
             for htilde in tgroup:
-                htilde.out = self.out_mem[mid][s:e]
-                htilde.cout = self.cout_mem[mid][s:e]
-                s += psize
-                e += psize
-            self.corr.append(BatchCorrelator(tgroup, [t.cout for t in tgroup], len(tgroup[0])))
+                htilde.outs = []
+                htilde.couts = []
+            for _ in range(num_detectors):
+                for htilde in tgroup:
+                    htilde.outs.append(self.out_mem[mid][s:e])
+                    htilde.couts.append(self.cout_mem[mid][s:e])
+                    s += psize
+                    e += psize
+            for htilde in tgroup:
+                htilde.out = htilde.outs[0]
+                htilde.cout = htilde.couts[0]
+            self.corr.append([
+                BatchCorrelator(tgroup, [t.couts[k] for t in tgroup],
+                                len(tgroup[0]))
+                for k in range(num_detectors)
+            ])
+
+        # Track the time spent filtering each template, so that the work can
+        # be redistributed among processes
+        group_sizes = [len(tgroup) for tgroup in self.tgroups]
+        self.group_offsets = numpy.cumsum([0] + group_sizes)
+        self.template_ids = numpy.zeros(self.group_offsets[-1],
+                                        dtype=numpy.int64)
+        self.template_costs = numpy.zeros(self.group_offsets[-1])
+        i = 0
+        for tgroup in self.tgroups:
+            for htilde in tgroup:
+                htilde.cost_index = i
+                self.template_ids[i] = htilde.id
+                i += 1
+
+    def pop_template_costs(self):
+        """Return the ids of the templates and the time in seconds spent
+        filtering each of them since the last call
+        """
+        costs = self.template_costs
+        self.template_costs = numpy.zeros(len(costs))
+        return self.template_ids, costs
 
     def set_data(self, data):
         """Set the data reader object to use"""
-        self.data = data
+        self.set_multi_data([data])
+
+    def set_multi_data(self, data_readers):
+        """Set the data reader objects of the detectors to filter together"""
+        if len(data_readers) > self.num_detectors:
+            raise ValueError(f'Cannot filter {len(data_readers)} detectors '
+                             f'together, at most {self.num_detectors}')
+        self.data_readers = list(data_readers)
         self.block_id = 0
 
     def combine_results(self, results):
@@ -1638,34 +1889,82 @@ class LiveBatchMatchedFilter(object):
             result[key] = numpy.concatenate([r[key] for r in results])
         return result
 
+    def _stage(self, name):
+        """Time the enclosed block as the stage `name` if a timer is set"""
+        if self.timer is None:
+            return contextlib.nullcontext()
+        return self.timer.stage(name)
+
     def process_data(self, data_reader):
         """Process the data for all of the templates"""
         self.set_data(data_reader)
         return self.process_all()
 
+    def process_multi_data(self, data_readers):
+        """Process the data of several detectors for all of the templates.
+
+        Parameters
+        ----------
+        data_readers: dict
+            Dictionary of data reader objects keyed by detector.
+
+        Returns
+        -------
+        results: dict
+            Dictionary of results keyed by detector, in the same form as
+            returned by `process_data`.
+        """
+        self.set_multi_data(data_readers.values())
+        return dict(zip(data_readers.keys(), self._process_detectors()))
+
     def process_all(self):
         """Process every batch group and return as single result"""
-        results = []
-        veto_info = []
-        while 1:
-            result, veto = self._process_batch()
-            if result is False: return False
-            if result is None: break
-            results.append(result)
-            veto_info += veto
+        return self._process_detectors()[0]
 
-        result = self.combine_results(results)
+    def _process_detectors(self):
+        """Process every batch group and return a single result for each
+        of the current data readers
+        """
+        ndet = len(self.data_readers)
+        results = [[] for _ in range(ndet)]
+        veto_info = [[] for _ in range(ndet)]
+        aborted = [False] * ndet
+        while not all(aborted):
+            block_id = self.block_id
+            start = perf_counter()
+            batch = self._process_batch(aborted)
+            if batch is None: break
+            # Share the cost of a batch evenly among its templates
+            gslice = slice(self.group_offsets[block_id],
+                           self.group_offsets[block_id + 1])
+            self.template_costs[gslice] += \
+                (perf_counter() - start) / len(self.tgroups[block_id])
+            for k, (result, veto) in enumerate(batch):
+                if result is False:
+                    aborted[k] = True
+                elif not aborted[k]:
+                    results[k].append(result)
+                    veto_info[k] += veto
+
+        out = []
+        for k in range(ndet):
+            if aborted[k]:
+                out.append(False)
+                continue
+            result = self.combine_results(results[k])
+            vinfo = veto_info[k]
 
-        if self.max_triggers_in_batch:
-            sort = result['snr'].argsort()[::-1][:self.max_triggers_in_batch]
-            for key in result:
-                result[key] = result[key][sort]
+            if self.max_triggers_in_batch:
+                sort = result['snr'].argsort()[::-1][:self.max_triggers_in_batch]
+                for key in result:
+                    result[key] = result[key][sort]
 
-            tmp = veto_info
-            veto_info = [tmp[i] for i in sort]
+                vinfo = [vinfo[i] for i in sort]
 
-        result = self._process_vetoes(result, veto_info)
-        return result
+            with self._stage('chisq'):
+                result = self._process_vetoes(result, vinfo)
+            out.append(result)
+        return out
 
     def _process_vetoes(self, results, veto_info):
         """Calculate signal based vetoes"""
@@ -1679,56 +1978,92 @@ class LiveBatchMatchedFilter(object):
 
         keep = []
         for i, (snrv, norm, l, htilde, stilde) in enumerate(veto_info):
+            # The reweighted SNR can not exceed the SNR, so the vetoes of
+            # triggers below the threshold do not need to be computed
+            if (self.newsnr_threshold
+                    and results['snr'][i] < self.newsnr_threshold):
+                continue
+
+            start = perf_counter()
             correlate(htilde, stilde, htilde.cout)
             c, d = self.power_chisq.values(htilde.cout, snrv,
                                            norm, stilde.psd, [l], htilde)
             chisq[i] = c[0] / d[0]
             dof[i] = d[0]
 
+            # The sine-Gaussian chisq does not enter the reweighted SNR, so
+            # only compute it for the triggers which are kept
+            if self.newsnr_threshold:
+                newsnr = ranking.newsnr(results['snr'][i], chisq[i])
+                if newsnr < self.newsnr_threshold:
+                    self.template_costs[htilde.cost_index] += \
+                        perf_counter() - start
+                    continue
+                keep.append(i)
+
             sgv = self.sg_chisq.values(stilde, htilde, stilde.psd,
                                        snrv, norm, c, d, [l])
             if sgv is not None:
                 sg_chisq[i] = sgv[0]
-
-            if self.newsnr_threshold:
-                newsnr = ranking.newsnr(results['snr'][i], chisq[i])
-                if newsnr >= self.newsnr_threshold:
-                    keep.append(i)
+            self.template_costs[htilde.cost_index] += perf_counter() - start
 
         if self.newsnr_threshold:
+            logger.debug('Kept %d of %d triggers after the signal based '
+                         'vetoes', len(keep), len(veto_info))
             keep = numpy.array(keep, dtype=numpy.uint32)
             for key in results:
                 results[key] = results[key][keep]
 
         return results
 
-    def _process_batch(self):
-        """Process only a single batch group of data"""
+    def _process_batch(self, aborted):
+        """Process only a single batch group of data, for each of the
+        current data readers which has not been aborted. Returns None if
+        there are no batches left, otherwise a list with the result and veto
+        information for each data reader.
+        """
         if self.block_id == len(self.tgroups):
-            return None, None
+            return None
 
         tgroup = self.tgroups[self.block_id]
-        psize = self.chunk_tsamples[self.block_id]
         mid = self.mids[self.block_id]
-        stilde = self.data.overwhitened_data(tgroup[0].delta_f)
-        psd = stilde.psd
+        stildes = [None] * len(self.data_readers)
+        with self._stage('fft_correlate'):
+            for k, data in enumerate(self.data_readers):
+                if not aborted[k]:
+                    stildes[k] = data.overwhitened_data(tgroup[0].delta_f)
+                    self.corr[self.block_id][k].execute(stildes[k])
+            self.ifts[mid].execute()
+
+        batch = []
+        for k, data in enumerate(self.data_readers):
+            if aborted[k]:
+                batch.append((None, []))
+            else:
+                batch.append(self._find_peaks(k, data, stildes[k]))
 
-        valid_end = int(psize - self.data.trim_padding)
-        valid_start = int(valid_end - self.data.blocksize * self.data.sample_rate)
+        self.block_id += 1
+        return batch
 
-        seg = slice(valid_start, valid_end)
+    def _find_peaks(self, k, data, stilde):
+        """Find the peaks in the SNR time series of the current batch group
+        for the `k`-th data reader
+        """
+        tgroup = self.tgroups[self.block_id]
+        psize = self.chunk_tsamples[self.block_id]
+        psd = stilde.psd
 
-        self.corr[self.block_id].execute(stilde)
-        self.ifts[mid].execute()
+        valid_end = int(psize - data.trim_padding)
+        valid_start = int(valid_end - data.blocksize * data.sample_rate)
 
-        self.block_id += 1
+        seg = slice(valid_start, valid_end)
 
         snr = numpy.zeros(len(tgroup), dtype=numpy.complex64)
         time = numpy.zeros(len(tgroup), dtype=numpy.float64)
         templates = numpy.zeros(len(tgroup), dtype=numpy.uint64)
         sigmasq = numpy.zeros(len(tgroup), dtype=numpy.float32)
 
-        time[:] = self.data.start_time
+        time[:] = data.start_time
 
         result = {}
         tkeys = tgroup[0].params.dtype.names
@@ -1744,20 +2079,20 @@ class LiveBatchMatchedFilter(object):
                 if 'time_offset' not in result:
                     result['time_offset'] = []
 
-            l = htilde.out[seg].abs_arg_max()
+            l = htilde.outs[k][seg].abs_arg_max()
 
             sgm = htilde.sigmasq(psd)
             norm = 4.0 * htilde.delta_f / (sgm ** 0.5)
 
             l += valid_start
-            snrv = numpy.array([htilde.out[l]])
+            snrv = numpy.array([htilde.outs[k][l]])
 
             # If nothing is above threshold we can exit this template
             s = abs(snrv[0]) * norm
             if s < self.snr_threshold:
                 continue
 
-            time[i] += float(l - valid_start) / self.data.sample_rate
+            time[i] += float(l - valid_start) / data.sample_rate
 
             # We have an SNR so high that we will drop the entire analysis
             # of this chunk of time!
@@ -2204,7 +2539,8 @@ def optimized_match(
 __all__ = ['match', 'optimized_match', 'matched_filter', 'sigmasq', 'sigma', 'get_cutoff_indices',
            'sigmasq_series', 'make_frequency_series', 'overlap',
            'overlap_cplx', 'matched_filter_core', 'correlate',
-           'MatchedFilterControl', 'LiveBatchMatchedFilter',
+           'MatchedFilterControl', 'BatchMatchedFilterControl',
+           'LiveBatchMatchedFilter',
            'MatchedFilterSkyMaxControl', 'MatchedFilterSkyMaxControlNoPhase',
            'compute_max_snr_over_sky_loc_stat_no_phase',
            'compute_max_snr_over_sky_loc_stat',
@@ -1,6 +1,6 @@
 from . frame import (locations_to_cache, read_frame,
                      query_and_read_frame, frame_paths, write_frame,
-                     DataBuffer, StatusBuffer, iDQBuffer)
+                     SlidingTimeSeries, DataBuffer, StatusBuffer, iDQBuffer)
 
 from . store import (read_store)
 
@@ -483,6 +483,76 @@ def write_frame(location, channels, timeseries):
     # write frame
     lalframe.FrameWrite(frame, location)
 
+
+class SlidingTimeSeries(object):
+
+    """Storage for a time series of fixed length which only moves forward
+    in time, such as the buffers of PyCBC Live.
+
+    The data is kept in a preallocated array somewhat longer than the time
+    series, and `series` is a view of the current time span within it. Moving
+    forward only shifts this view, and the data is copied back to the start
+    of the array when the spare room runs out. This makes moving forward cost
+    on average a few times the number of new samples, rather than the full
+    length of the series.
+
+    Note that the memory behind a previous `series` is reused, so it should
+    not be kept across calls to `advance`.
+    """
+
+    def __init__(self, length, delta_t, epoch, dtype=numpy.float64,
+                 spare=0.25):
+        """
+        Parameters
+        ----------
+        length: int
+            Length of the time series in samples.
+        delta_t: float
+            Sample spacing of the time series.
+        epoch: float
+            Initial start time of the time series.
+        dtype: {dtype, numpy.float64}, Optional
+            Data type of the time series.
+        spare: {float, 0.25}, Optional
+            Additional storage to allocate, as a fraction of `length`.
+        """
+        self.length = int(length)
+        self.store = zeros(self.length + max(int(self.length * spare), 1),
+                           dtype=dtype).numpy()
+        self.offset = 0
+        self.series = TimeSeries(self.store[:self.length], copy=False,
+                                 epoch=epoch, delta_t=delta_t)
+
+    def advance(self, num):
+        """Drop the first `num` samples of the time series and append `num`
+        zeros. The start time is not changed, so that the caller can update
+        it exactly.
+
+        Parameters
+        ----------
+        num: int
+            The number of samples to move forward.
+
+        Returns
+        -------
+        series: TimeSeries
+            The new view of the time series.
+        """
+        num = min(int(num), self.length)
+        start = self.offset + num
+        if start + self.length > len(self.store):
+            keep = self.length - num
+            self.store[:keep] = self.store[start:start + keep]
+            start = 0
+        self.offset = start
+        end = start + self.length
+        self.store[end - num:end] = 0
+        self.series = TimeSeries(self.store[start:end], copy=False,
+                                 epoch=self.series.start_time,
+                                 delta_t=self.series.delta_t)
+        return self.series
+
+
 class DataBuffer(object):
 
     """A linear buffer that acts as a FILO for reading in frame data
@@ -522,10 +592,11 @@ class DataBuffer(object):
         self.channel_type, self.raw_sample_rate = self._retrieve_metadata(self.stream, self.channel_name)
 
         raw_size = self.raw_sample_rate * max_buffer
-        self.raw_buffer = TimeSeries(zeros(raw_size, dtype=dtype),
-                                     copy=False,
-                                     epoch=start_time - max_buffer,
-                                     delta_t=1.0/self.raw_sample_rate)
+        self.raw_store = SlidingTimeSeries(raw_size,
+                                           1.0 / self.raw_sample_rate,
+                                           start_time - max_buffer,
+                                           dtype=dtype)
+        self.raw_buffer = self.raw_store.series
 
     def update_cache(self):
         """Reset the lal cache. This can be used to update the cache if the
@@ -600,7 +671,8 @@ class DataBuffer(object):
         blocksize: int
             The number of seconds to attempt to read from the channel
         """
-        self.raw_buffer.roll(-int(blocksize * self.raw_sample_rate))
+        self.raw_buffer = self.raw_store.advance(
+            int(blocksize * self.raw_sample_rate))
         self.read_pos += blocksize
         self.raw_buffer.start_time += blocksize
 
@@ -615,7 +687,7 @@ class DataBuffer(object):
         """
         ts = self._read_frame(blocksize)
 
-        self.raw_buffer.roll(-len(ts))
+        self.raw_buffer = self.raw_store.advance(len(ts))
         self.raw_buffer[-len(ts):] = ts[:]
         self.read_pos += blocksize
         self.raw_buffer.start_time += blocksize
@@ -982,6 +1054,7 @@ __all__ = [
     'query_and_read_frame',
     'frame_paths',
     'write_frame',
+    'SlidingTimeSeries',
     'DataBuffer',
     'StatusBuffer',
     'iDQBuffer'
@@ -2,6 +2,7 @@
 Convenience classes for accessing hdf5 trigger files
 """
 
+import os
 import h5py
 import numpy as np
 import logging
@@ -9,6 +10,7 @@ import inspect
 import pickle
 
 from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from lal import LIGOTimeGPS
 
@@ -334,7 +336,7 @@ class StatmapData(DictArray):
     def _return(self, data):
         return self.__class__(data=data, attrs=self.attrs, seg=self.seg)
 
-    def cluster(self, window):
+    def cluster(self, window, chunk_size=None):
         """ Cluster the dict array, assuming it has the relevant Coinc colums,
         time1, time2, stat, and timeslide_id
         """
@@ -344,7 +346,8 @@ class StatmapData(DictArray):
         from pycbc.events import cluster_coincs
         interval = self.attrs['timeslide_interval']
         cid = cluster_coincs(self.stat, self.time1, self.time2,
-                                 self.timeslide_id, interval, window)
+                                 self.timeslide_id, interval, window,
+                                 chunk_size=chunk_size)
         return self.select(cid)
 
     def save(self, outname):
@@ -372,7 +375,27 @@ class MultiifoStatmapData(StatmapData):
         return self.__class__(data=data, attrs=self.attrs, seg=self.seg,
                               ifos=ifolist)
 
-    def cluster(self, window):
+    def cluster_indices(self, window, chunk_size=None):
+        """ Return the indices of the events kept when clustering the dict
+        array, assuming it has the relevant Coinc colums, time1, time2, stat,
+        and timeslide_id
+        """
+        pivot_ifo = self.attrs['pivot']
+        fixed_ifo = self.attrs['fixed']
+        # If no events, keep everything
+        if len(self.data['%s/time' % pivot_ifo]) == 0 or len(self.data['%s/time' % fixed_ifo]) == 0:
+            return np.arange(len(self.stat))
+        from pycbc.events import cluster_coincs
+        interval = self.attrs['timeslide_interval']
+        return cluster_coincs(self.stat,
+                              self.data['%s/time' % pivot_ifo],
+                              self.data['%s/time' % fixed_ifo],
+                              self.timeslide_id,
+                              interval,
+                              window,
+                              chunk_size=chunk_size)
+
+    def cluster(self, window, chunk_size=None):
         """ Cluster the dict array, assuming it has the relevant Coinc colums,
         time1, time2, stat, and timeslide_id
         """
@@ -381,15 +404,8 @@ class MultiifoStatmapData(StatmapData):
         fixed_ifo = self.attrs['fixed']
         if len(self.data['%s/time' % pivot_ifo]) == 0 or len(self.data['%s/time' % fixed_ifo]) == 0:
             return self
-        from pycbc.events import cluster_coincs
-        interval = self.attrs['timeslide_interval']
-        cid = cluster_coincs(self.stat,
-                             self.data['%s/time' % pivot_ifo],
-                             self.data['%s/time' % fixed_ifo],
-                             self.timeslide_id,
-                             interval,
-                             window)
-        return self.select(cid)
+        return self.select(self.cluster_indices(window,
+                                                chunk_size=chunk_size))
 
 
 class FileData(object):
@@ -1468,21 +1484,28 @@ class ReadByTemplate(object):
             self.keep = np.arange(0, len(times))
 
         if self.bank != {}:
-            self.param = {}
-            if 'parameters' in self.bank.attrs:
-                for col in self.bank.attrs['parameters']:
-                    self.param[col] = self.bank[col][self.template_num]
-            else:
-                for col in self.bank:
-                    self.param[col] = self.bank[col][self.template_num]
+            self.param = self.get_params(num)
 
         # Calculate the trigger id by adding the relative offset in self.keep
         # to the absolute beginning index of this templates triggers stored
         # in 'template_boundaries'
-        trigger_id = self.keep + \
-                         self.file['%s/template_boundaries' % self.ifo][num]
+        trigger_id = self.keep + self.get_template_start(num)
         return trigger_id
 
+    def bank_columns(self):
+        """Return the names of the template parameters in the bank"""
+        if 'parameters' in self.bank.attrs:
+            return list(self.bank.attrs['parameters'])
+        return list(self.bank)
+
+    def get_params(self, num):
+        """Get the bank parameters of template with id 'num'"""
+        return {col: self.bank[col][num] for col in self.bank_columns()}
+
+    def get_template_start(self, num):
+        """Get the index of the first trigger of template with id 'num'"""
+        return self.file['%s/template_boundaries' % self.ifo][num]
+
     def __getitem__(self, col):
         """ Return the column of data for current active template after
         applying vetoes
@@ -1505,6 +1528,143 @@ class ReadByTemplate(object):
         return data
 
 
+class ChunkedReadByTemplate(ReadByTemplate):
+    """Read the triggers of a merged single-detector trigger file template
+    by template, like `ReadByTemplate`, but with bulk reads of the triggers
+    of many templates at once.
+
+    The triggers are stored in the file ordered by template hash, so the
+    templates should be visited in the order given by `file_order` for the
+    reads to be contiguous. While the triggers of a chunk of templates are
+    being used, the following chunk is read in a background thread. At most
+    two chunks are held in memory.
+    """
+    # Default assignment to {} is OK for a variable used only in __init__
+    def __init__(self, filename, bank, segment_name=None, veto_files=None,
+                 gating_veto_windows={}, chunk_size=2**20):
+        """
+        Parameters
+        ----------
+        filename: str
+            Merged single-detector trigger file.
+        bank: str
+            Template bank file, used to locate the triggers of each template.
+        segment_name: {list of str, None}
+            Names of the veto segments to apply.
+        veto_files: {list of str, None}
+            Files containing the veto segments.
+        gating_veto_windows: {dict, {}}
+            Windows around the gates to veto, see `ReadByTemplate`.
+        chunk_size: {int, 2**20}
+            Approximate number of triggers read at once.
+        """
+        super().__init__(filename, bank=bank, segment_name=segment_name,
+                         veto_files=veto_files,
+                         gating_veto_windows=gating_veto_windows)
+        self.chunk_size = chunk_size
+
+        # Triggers of the i-th template in hash order are in the rows
+        # bounds[i]:bounds[i+1] of the file
+        num_triggers = len(self.file['%s/end_time' % self.ifo])
+        starts = self.file['%s/template_boundaries' % self.ifo][:]
+        self.hash_order = self.bank['template_hash'][:].argsort()
+        self.hash_rank = self.hash_order.argsort()
+        self.bounds = np.append(starts[self.hash_order], num_triggers)
+
+        self.params = {col: self.bank[col][:] for col in self.bank_columns()}
+
+        # Columns to read with each chunk. Further columns are added the
+        # first time they are requested.
+        self.columns = {'end_time'}
+        self.chunk = None
+        self._next_chunk = None
+        self._executor = None
+        self._pid = None
+
+    def file_order(self, template_ids):
+        """Return the indices that would sort the given template ids in the
+        order their triggers are stored in the file.
+        """
+        rank = self.hash_rank[np.asarray(template_ids)]
+        return np.argsort(rank, kind='stable')
+
+    def _read_chunk(self, first, columns):
+        """Read the given columns for the chunk of templates starting at the
+        `first` template in hash order.
+        """
+        last = np.searchsorted(self.bounds,
+                               self.bounds[first] + self.chunk_size,
+                               side='right') - 1
+        last = min(max(last, first + 1), len(self.hash_order))
+        rows = slice(self.bounds[first], self.bounds[last])
+        data = {col: self.file['%s/%s' % (self.ifo, col)][rows]
+                for col in columns}
+        return first, last, data
+
+    def _load_chunk(self, num):
+        """Make sure that the triggers of template 'num' are in memory"""
+        rank = self.hash_rank[num]
+        if self.chunk is not None and self.chunk[0] <= rank < self.chunk[1]:
+            return
+
+        # The reading thread does not survive a fork, e.g. when this object
+        # is used by a process pool
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._next_chunk = None
+            self._pid = os.getpid()
+
+        chunk = None
+        if self._next_chunk is not None:
+            chunk = self._next_chunk.result()
+            self._next_chunk = None
+            if not chunk[0] <= rank < chunk[1]:
+                chunk = None
+        if chunk is None:
+            logger.debug('Reading triggers of template %s out of order', num)
+            chunk = self._read_chunk(rank, self.columns)
+        self.chunk = chunk
+
+        if chunk[1] < len(self.hash_order):
+            self._next_chunk = self._executor.submit(
+                self._read_chunk, chunk[1], set(self.columns)
+            )
+
+    def get_data(self, col, num):
+        """Get a column of data for template with id 'num'.
+
+        Parameters
+        ----------
+        col: str
+            Name of column to read
+        num: int
+            The template id to read triggers for
+
+        Returns
+        -------
+        data: numpy.ndarray
+            The requested column of data
+        """
+        self._load_chunk(num)
+        first, last, data = self.chunk
+        offset = self.bounds[first]
+        if col not in data:
+            self.columns.add(col)
+            rows = slice(offset, self.bounds[last])
+            data[col] = self.file['%s/%s' % (self.ifo, col)][rows]
+        rank = self.hash_rank[num]
+        return data[col][self.bounds[rank] - offset:
+                         self.bounds[rank + 1] - offset]
+
+    def get_params(self, num):
+        """Get the bank parameters of template with id 'num'"""
+        return {col: self.params[col][num] for col in self.params}
+
+    def get_template_start(self, num):
+        """Get the index of the first trigger of template with id 'num'"""
+        return self.bounds[self.hash_rank[num]]
+
+
 chisq_choices = ['traditional', 'cont', 'bank', 'max_cont_trad', 'sg',
                  'max_bank_cont', 'max_bank_trad', 'max_bank_cont_trad']
 
@@ -1728,7 +1888,8 @@ def load_state(fp, path=None, dsetname='state'):
 
 __all__ = ('HFile', 'DictArray', 'StatmapData', 'MultiifoStatmapData',
            'FileData', 'DataFromFiles', 'SingleDetTriggers',
-           'ForegroundTriggers', 'ReadByTemplate', 'chisq_choices',
+           'ForegroundTriggers', 'ReadByTemplate', 'ChunkedReadByTemplate',
+           'chisq_choices',
            'get_chisq_from_file_choice', 'save_dict_to_hdf5',
            'recursively_save_dict_contents_to_group', 'load_hdf5_to_dict',
            'combine_and_copy', 'name_all_datasets', 'get_all_subkeys',
@@ -5,3 +5,5 @@ This packages contains modules to help with pycbc live running
 from .snr_optimizer import *
 from .significance_fits import *
 from .supervision import *
+from .latency import *
+from .load_balance import *
@@ -0,0 +1,231 @@
+"""
+Tools for measuring and reporting the time spent in the various stages of
+the PyCBC Live analysis loop
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+from collections import deque
+
+import h5py
+import numpy
+
+logger = logging.getLogger('pycbc.live.latency')
+
+
+class StageTimer(object):
+    """Accumulate the wall time spent in named stages of a processing loop.
+
+    The accumulated times are returned and cleared by `reset`, typically
+    once per analysis stride. Durations may be added from other threads,
+    e.g. the ones uploading candidates.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        """Add `duration` seconds to the stage `name`"""
+        with self._lock:
+            self.times[name] = self.times.get(name, 0.) + duration
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager timing the enclosed block as the stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def reset(self):
+        """Return the accumulated stage times and start from scratch"""
+        with self._lock:
+            times = self.times
+            self.times = {}
+        return times
+
+
+class LiveLatencyLog(object):
+    """Keep a rolling record of the per-stage, per-rank timing of the most
+    recent analysis strides and periodically write it to disk.
+    """
+
+    def __init__(self, output_path=None, prometheus_path=None,
+                 max_strides=1000):
+        """
+        Parameters
+        ----------
+        output_path: {str, None}
+            File to write the rolling log to. The format is HDF if the name
+            ends in '.hdf', '.h5' or '.hdf5', and JSON otherwise.
+        prometheus_path: {str, None}
+            If given, the timing of the latest stride is also written to this
+            file in the Prometheus text exposition format.
+        max_strides: {int, 1000}
+            Number of most recent strides to keep in the log.
+        """
+        self.output_path = output_path
+        self.prometheus_path = prometheus_path
+        self.strides = deque(maxlen=max_strides)
+
+    def add_stride(self, gps_time, rank_times):
+        """Record the timing information of one stride.
+
+        Parameters
+        ----------
+        gps_time: float
+            End time of the data analyzed in this stride.
+        rank_times: list of dicts
+            For each MPI rank, a dictionary mapping stage names to the time in
+            seconds spent in that stage. Ranks which did not report timing
+            should be given as None.
+        """
+        ranks = {r: t for r, t in enumerate(rank_times) if t is not None}
+        self.strides.append((float(gps_time), ranks))
+
+        # Point out the slowest rank in each stage
+        for stage in sorted(self.stages):
+            durations = {r: t[stage] for r, t in ranks.items() if stage in t}
+            if not durations:
+                continue
+            slowest = max(durations, key=durations.get)
+            logger.debug('Stage %s: slowest rank %d took %.3f s',
+                         stage, slowest, durations[slowest])
+
+    @property
+    def stages(self):
+        """Set of all the stage names present in the log"""
+        names = set()
+        for _, ranks in self.strides:
+            for times in ranks.values():
+                names.update(times.keys())
+        return names
+
+    @property
+    def num_ranks(self):
+        """Number of ranks that have reported timing in the log"""
+        nranks = 0
+        for _, ranks in self.strides:
+            if ranks:
+                nranks = max(nranks, max(ranks) + 1)
+        return nranks
+
+    def as_arrays(self):
+        """Return the log as a dictionary of arrays. The `gps_time` entry
+        gives the time of each stride, while every stage is given as an array
+        of shape (number of strides, number of ranks), where ranks that did
+        not run a stage are marked by NaN.
+        """
+        stages = sorted(self.stages)
+        nranks = self.num_ranks
+        out = {'gps_time': numpy.array([s[0] for s in self.strides])}
+        for stage in stages:
+            arr = numpy.full((len(self.strides), nranks), numpy.nan)
+            for i, (_, ranks) in enumerate(self.strides):
+                for rank, times in ranks.items():
+                    if stage in times:
+                        arr[i, rank] = times[stage]
+            out[stage] = arr
+        return out
+
+    def write(self):
+        """Write the log to the configured output files"""
+        if self.output_path is not None:
+            if self.output_path.endswith(('.hdf', '.h5', '.hdf5')):
+                self._atomic_write(self.output_path, self._write_hdf)
+            else:
+                self._atomic_write(self.output_path, self._write_json)
+        if self.prometheus_path is not None and self.strides:
+            self._atomic_write(self.prometheus_path, self._write_prometheus)
+
+    @staticmethod
+    def _atomic_write(path, write_func):
+        """Write a file via a temporary one, so readers never see a partially
+        written file.
+        """
+        dirname, basename = os.path.split(path)
+        tmp_path = os.path.join(dirname, '.' + basename + '.tmp')
+        try:
+            write_func(tmp_path)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            logger.error('I/O error writing latency log %s', path)
+
+    def _write_hdf(self, path):
+        with h5py.File(path, 'w') as f:
+            for key, value in self.as_arrays().items():
+                f[key] = value
+            f.attrs['num_ranks'] = self.num_ranks
+
+    def _write_json(self, path):
+        out = [{'gps_time': gps_time,
+                'ranks': {str(r): times for r, times in ranks.items()}}
+               for gps_time, ranks in self.strides]
+        with open(path, 'w') as f:
+            json.dump({'strides': out}, f)
+
+    def _write_prometheus(self, path):
+        gps_time, ranks = self.strides[-1]
+        lines = [
+            '# HELP pycbc_live_stage_seconds Wall time spent in each stage '
+            'of the latest analysis stride',
+            '# TYPE pycbc_live_stage_seconds gauge'
+        ]
+        for rank in sorted(ranks):
+            for stage in sorted(ranks[rank]):
+                lines.append(
+                    f'pycbc_live_stage_seconds{{rank="{rank}",'
+                    f'stage="{stage}"}} {ranks[rank][stage]:.6f}'
+                )
+        lines += [
+            '# HELP pycbc_live_stride_gps_time End time of the data analyzed '
+            'in the latest stride',
+            '# TYPE pycbc_live_stride_gps_time gauge',
+            f'pycbc_live_stride_gps_time {gps_time:.3f}'
+        ]
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def insert_latency_option_group(parser):
+    """Add options controlling the output of the latency log"""
+    group = parser.add_argument_group('Latency monitoring')
+    group.add_argument('--output-latency', metavar='PATH',
+                       help='Periodically write the time spent in each '
+                            'stage of the analysis, for each MPI rank, to '
+                            'PATH. HDF format is used if PATH ends in .hdf, '
+                            'JSON otherwise.')
+    group.add_argument('--output-latency-prometheus', metavar='PATH',
+                       help='Write the stage timing of the latest stride to '
+                            'PATH in the Prometheus text format.')
+    group.add_argument('--output-latency-length', type=int, default=1000,
+                       metavar='N',
+                       help='Number of most recent strides kept in the '
+                            'latency log. Default 1000.')
+
+
+def latency_log_from_cli(args):
+    """Create a `LiveLatencyLog` from the command line options, or return
+    None if no latency output was requested.
+    """
+    if args.output_latency is None and args.output_latency_prometheus is None:
+        return None
+    return LiveLatencyLog(
+        output_path=args.output_latency,
+        prometheus_path=args.output_latency_prometheus,
+        max_strides=args.output_latency_length
+    )
+
+
+__all__ = [
+    'StageTimer',
+    'LiveLatencyLog',
+    'insert_latency_option_group',
+    'latency_log_from_cli',
+]
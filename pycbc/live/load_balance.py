@@ -0,0 +1,144 @@
+"""
+Redistribution of the template bank among the filtering processes of PyCBC
+Live, based on the measured cost of filtering each template
+"""
+
+import logging
+import numpy
+
+logger = logging.getLogger('pycbc.live.load_balance')
+
+
+class TemplateLoadBalancer(object):
+    """Track the cost of filtering each template and move templates from the
+    most to the least loaded filtering process when their total costs differ
+    too much.
+    """
+
+    def __init__(self, num_templates, threshold=0.1, decay=0.2):
+        """
+        Parameters
+        ----------
+        num_templates: int
+            Total number of templates in the bank.
+        threshold: {float, 0.1}
+            Fractional excess of the most loaded process over the average
+            load which triggers a redistribution of the templates.
+        decay: {float, 0.2}
+            Weight of the latest measurement in the exponential moving
+            average of the cost of each template.
+        """
+        self.threshold = threshold
+        self.decay = decay
+        self.cost = numpy.full(num_templates, numpy.nan)
+        # Template ids currently assigned to each filtering process
+        self.assignment = {}
+
+    def update(self, rank, template_ids, template_costs):
+        """Add the costs measured by a filtering process.
+
+        Parameters
+        ----------
+        rank: int
+            Rank of the process that made the measurement.
+        template_ids: numpy.ndarray
+            Ids of the templates filtered by this process.
+        template_costs: numpy.ndarray
+            Time in seconds spent filtering each template.
+        """
+        template_ids = numpy.asarray(template_ids, dtype=numpy.int64)
+        template_costs = numpy.asarray(template_costs, dtype=numpy.float64)
+        self.assignment[rank] = template_ids
+        old = self.cost[template_ids]
+        self.cost[template_ids] = numpy.where(
+            numpy.isnan(old),
+            template_costs,
+            (1 - self.decay) * old + self.decay * template_costs
+        )
+
+    def loads(self):
+        """Return the ranks and their estimated total filtering cost"""
+        ranks = sorted(self.assignment)
+        loads = numpy.array([self.cost[self.assignment[r]].sum()
+                             for r in ranks])
+        return ranks, loads
+
+    def imbalance(self):
+        """Fractional excess of the most loaded process over the average"""
+        _, loads = self.loads()
+        if len(loads) < 2 or loads.mean() <= 0:
+            return 0.
+        return loads.max() / loads.mean() - 1
+
+    def rebalance(self):
+        """Compute a new assignment of the templates if the load is
+        unbalanced.
+
+        Templates are moved one at a time from the most to the least loaded
+        process, each time choosing the template whose cost is closest to
+        half the difference between the two, until the imbalance drops below
+        half the threshold.
+
+        Returns
+        -------
+        assignment: {dict, None}
+            Dictionary mapping each rank to the array of template ids it
+            should filter, or None if no change is needed.
+        """
+        ranks, loads = self.loads()
+        if len(ranks) < 2 or numpy.isnan(loads).any():
+            return None
+
+        initial = self.imbalance()
+        if initial < self.threshold:
+            return None
+
+        ids = [list(self.assignment[r]) for r in ranks]
+        moved = 0
+        for _ in range(len(self.cost)):
+            hi = loads.argmax()
+            lo = loads.argmin()
+            gap = loads[hi] - loads[lo]
+            if loads[hi] / loads.mean() - 1 < self.threshold / 2:
+                break
+
+            costs = self.cost[ids[hi]]
+            movable = numpy.flatnonzero(costs < gap)
+            if len(movable) == 0:
+                break
+            j = movable[abs(costs[movable] - gap / 2).argmin()]
+
+            tid = ids[hi].pop(j)
+            ids[lo].append(tid)
+            loads[hi] -= self.cost[tid]
+            loads[lo] += self.cost[tid]
+            moved += 1
+
+        if moved == 0:
+            return None
+
+        self.assignment = {r: numpy.array(sorted(i), dtype=numpy.int64)
+                           for r, i in zip(ranks, ids)}
+        logger.info('Moved %d templates between %d processes, imbalance '
+                    '%.2f -> %.2f', moved, len(ranks), initial,
+                    self.imbalance())
+        return self.assignment
+
+
+def insert_load_balance_option_group(parser):
+    """Add options controlling the redistribution of the templates"""
+    group = parser.add_argument_group('Template load balancing')
+    group.add_argument('--load-balance-interval', type=int, metavar='N',
+                       help='Every N strides, move templates between the '
+                            'filtering processes according to the measured '
+                            'filtering cost. Disabled by default.')
+    group.add_argument('--load-balance-threshold', type=float, default=0.1,
+                       help='Only move templates when the most loaded '
+                            'process exceeds the average load by this '
+                            'fraction. Default 0.1.')
+
+
+__all__ = [
+    'TemplateLoadBalancer',
+    'insert_load_balance_option_group',
+]
@@ -156,3 +156,42 @@ class LimitedSizeDict(OrderedDict):
         if self.size_limit is not None:
             while len(self) > self.size_limit:
                 self.popitem(last=False)
+
+
+class LimitedMemoryDict(OrderedDict):
+    """ Dict for LRU caching of arrays, limited by the total number of bytes
+    held by its values
+    """
+
+    def __init__(self, *args, **kwds):
+        self.memory_limit = kwds.pop("memory_limit", None)
+        self.nbytes = 0
+        OrderedDict.__init__(self, *args, **kwds)
+
+    @staticmethod
+    def _sizeof(value):
+        if hasattr(value, 'nbytes'):
+            return value.nbytes
+        return sys.getsizeof(value)
+
+    def __getitem__(self, key):
+        value = OrderedDict.__getitem__(self, key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self:
+            del self[key]
+        OrderedDict.__setitem__(self, key, value)
+        self.nbytes += self._sizeof(value)
+        self._check_memory_limit()
+
+    def __delitem__(self, key):
+        self.nbytes -= self._sizeof(OrderedDict.__getitem__(self, key))
+        OrderedDict.__delitem__(self, key)
+
+    def _check_memory_limit(self):
+        if self.memory_limit is not None:
+            # Always keep the most recent entry
+            while self.nbytes > self.memory_limit and len(self) > 1:
+                del self[next(iter(self))]
@@ -2,11 +2,13 @@
 """
 import multiprocessing.pool
 import functools
+import mmap
 from multiprocessing import TimeoutError, cpu_count, get_context
 import types
 import signal
 import atexit
 import logging
+import numpy
 
 logger = logging.getLogger('pycbc.pool')
 
@@ -127,6 +129,74 @@ class BroadcastPool(multiprocessing.pool.Pool):
         self.join()
         atexit.unregister(_shutdown_pool)
 
+def shared_zeros(length, dtype):
+    """ Return a numpy array of zeros in anonymous shared memory
+
+    Forked worker processes share the private memory of their parent only
+    until a page of it is written to. This memory instead stays shared
+    between the parent and all of the workers forked after its allocation,
+    so no process holds its own copy.
+
+    Parameters
+    ----------
+    length: int
+        Number of elements of the array
+    dtype: numpy.dtype
+        Type of the array
+
+    Returns
+    -------
+    array: numpy.ndarray
+        The zeroed array
+    """
+    dtype = numpy.dtype(dtype)
+    # Anonymous maps are shared by default, and must be at least one byte
+    buf = mmap.mmap(-1, max(int(length) * dtype.itemsize, 1))
+    return numpy.frombuffer(buf, dtype=dtype, count=int(length))
+
+def move_to_shared_memory(arrays):
+    """ Move the data of pycbc Arrays into one block of shared memory
+
+    This should be done before any views of the arrays are taken, as these
+    keep referring to the old memory, and before the worker pool is made.
+
+    Parameters
+    ----------
+    arrays: list of pycbc.types.Array
+        The arrays to move, each array is moved once however often it is
+        given
+
+    Returns
+    -------
+    block: numpy.ndarray
+        The block of shared memory holding the data of all the arrays
+    """
+    from pycbc import PYCBC_ALIGNMENT
+
+    unique = {}
+    for arr in arrays:
+        unique.setdefault(id(arr), arr)
+    arrays = list(unique.values())
+
+    # Keep each array aligned, as it would be if allocated by pycbc
+    offsets = []
+    nbytes = 0
+    for arr in arrays:
+        offsets.append(nbytes)
+        size = arr.data.nbytes
+        nbytes += size + (-size) % PYCBC_ALIGNMENT
+
+    block = shared_zeros(nbytes, numpy.uint8)
+    for arr, offset in zip(arrays, offsets):
+        data = arr.data
+        shared = block[offset:offset + data.nbytes].view(data.dtype)
+        shared[:] = data
+        arr._data = shared
+
+    logger.info('Moved %d arrays to %d bytes of shared memory',
+                len(arrays), nbytes)
+    return block
+
 def _dummy_broadcast(self, f, args):
     self.map(f, [args] * self.size)
 
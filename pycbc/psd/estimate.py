@@ -97,8 +97,6 @@ def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
     -----
     See arXiv:gr-qc/0509116 for details.
     """
-    from pycbc.strain.strain import execute_cached_fft
-
     window_map = {
         'hann': numpy.hanning
     }
@@ -154,6 +152,7 @@ def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
 
     # calculate psd of each segment
     delta_f = 1. / timeseries.delta_t / seg_len
+    segment_tilde = None
     if not USE_CACHING_FOR_WELCH_FFTS:
         segment_tilde = FrequencySeries(
             numpy.zeros(int(seg_len / 2 + 1)),
@@ -167,25 +166,44 @@ def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
         segment_end = segment_start + seg_len
         segment = timeseries[segment_start:segment_end]
         assert len(segment) == seg_len
-        if not USE_CACHING_FOR_WELCH_FFTS:
-            fft(segment * w, segment_tilde)
-        else:
-            segment_tilde = execute_cached_fft(segment * w,
-                                               uid=WELCH_UNIQUE_ID)
-        seg_psd = abs(segment_tilde * segment_tilde.conj()).numpy()
+        segment_psds.append(_segment_psd(segment, w, segment_tilde))
 
-        #halve the DC and Nyquist components to be consistent with TO10095
-        seg_psd[0] /= 2
-        seg_psd[-1] /= 2
+    psd = _average_segment_psds(numpy.array(segment_psds), avg_method)
 
-        segment_psds.append(seg_psd)
+    w = w.numpy()
+    psd *= 2 * delta_f * seg_len / (w*w).sum()
 
-    segment_psds = numpy.array(segment_psds)
+    return FrequencySeries(psd, delta_f=delta_f, dtype=timeseries.dtype,
+                           epoch=timeseries.start_time)
 
+
+def _segment_psd(segment, w, segment_tilde=None):
+    """Return the unnormalized PSD of a single segment for `welch`. The
+    output frequency series `segment_tilde` must be given unless
+    `USE_CACHING_FOR_WELCH_FFTS` is set.
+    """
+    from pycbc.strain.strain import execute_cached_fft
+
+    if not USE_CACHING_FOR_WELCH_FFTS:
+        fft(segment * w, segment_tilde)
+    else:
+        segment_tilde = execute_cached_fft(segment * w,
+                                           uid=WELCH_UNIQUE_ID)
+    seg_psd = abs(segment_tilde * segment_tilde.conj()).numpy()
+
+    #halve the DC and Nyquist components to be consistent with TO10095
+    seg_psd[0] /= 2
+    seg_psd[-1] /= 2
+    return seg_psd
+
+
+def _average_segment_psds(segment_psds, avg_method):
+    """Average the PSDs of the individual segments for `welch`"""
     if avg_method == 'mean':
         psd = numpy.mean(segment_psds, axis=0)
     elif avg_method == 'median':
-        psd = numpy.median(segment_psds, axis=0) / median_bias(num_segments)
+        psd = numpy.median(segment_psds, axis=0) / \
+            median_bias(len(segment_psds))
     elif avg_method == 'median-mean':
         odd_psds = segment_psds[::2]
         even_psds = segment_psds[1::2]
@@ -194,12 +212,100 @@ def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
         even_median = numpy.median(even_psds, axis=0) / \
             median_bias(len(even_psds))
         psd = (odd_median + even_median) / 2
+    return psd
 
-    w = w.numpy()
-    psd *= 2 * delta_f * seg_len / (w*w).sum()
 
-    return FrequencySeries(psd, delta_f=delta_f, dtype=timeseries.dtype,
-                           epoch=timeseries.start_time)
+class SlidingWelch(object):
+    """Welch PSD estimate of a stretch of data that slides forward in time,
+    as in PyCBC Live. The PSDs of the individual segments are kept between
+    calls, so that only the segments containing new or modified data need to
+    be Fourier transformed again. The result is the same as calling `welch`
+    on the whole stretch.
+    """
+
+    def __init__(self, seg_len, seg_stride, avg_method='median'):
+        """
+        Parameters
+        ----------
+        seg_len : int
+            Segment length in samples.
+        seg_stride : int
+            Separation between consecutive segments, in samples.
+        avg_method : {'median', 'mean', 'median-mean'}
+            Method used for averaging individual segment PSDs.
+        """
+        if avg_method not in ('mean', 'median', 'median-mean'):
+            raise ValueError('Invalid averaging method')
+        self.seg_len = seg_len
+        self.seg_stride = seg_stride
+        self.avg_method = avg_method
+        # Segment PSDs, indexed by the absolute index of their first sample
+        self.segment_psds = {}
+        self.recomputed = 0
+
+    def invalidate(self, index):
+        """Forget the segments containing any sample from the absolute
+        index `index` onwards, because that data has changed.
+        """
+        for start in list(self.segment_psds):
+            if start + self.seg_len > index:
+                del self.segment_psds[start]
+
+    def estimate(self, timeseries, start_index):
+        """Estimate the PSD of the given data.
+
+        Parameters
+        ----------
+        timeseries : TimeSeries
+            Data to estimate the PSD of. Its length must be an exact number
+            of segment strides plus one segment length.
+        start_index : int
+            Absolute index of the first sample of `timeseries`, used to
+            recognize the segments already seen in previous calls.
+
+        Returns
+        -------
+        psd : FrequencySeries
+            Frequency series containing the estimated PSD.
+        """
+        seg_len = self.seg_len
+        num_samples = len(timeseries)
+        num_segments = (num_samples - seg_len) // self.seg_stride + 1
+        if num_samples != (num_segments - 1) * self.seg_stride + seg_len:
+            raise ValueError('Incorrect choice of segmentation parameters')
+
+        w = Array(numpy.hanning(seg_len).astype(timeseries.dtype))
+        delta_f = 1. / timeseries.delta_t / seg_len
+        segment_tilde = None
+        if not USE_CACHING_FOR_WELCH_FFTS:
+            segment_tilde = FrequencySeries(
+                numpy.zeros(int(seg_len / 2 + 1)),
+                delta_f=delta_f,
+                dtype=complex_same_precision_as(timeseries),
+            )
+
+        segment_psds = {}
+        for i in range(num_segments):
+            segment_start = i * self.seg_stride
+            key = start_index + segment_start
+            if key not in self.segment_psds:
+                segment = timeseries[segment_start:segment_start + seg_len]
+                self.segment_psds[key] = _segment_psd(segment, w,
+                                                      segment_tilde)
+                self.recomputed += 1
+            segment_psds[key] = self.segment_psds[key]
+        # Segments which slid out of the data are not needed anymore
+        self.segment_psds = segment_psds
+
+        psd = _average_segment_psds(
+            numpy.array([segment_psds[k] for k in sorted(segment_psds)]),
+            self.avg_method
+        )
+        w = w.numpy()
+        psd *= 2 * delta_f * seg_len / (w*w).sum()
+
+        return FrequencySeries(psd, delta_f=delta_f, dtype=timeseries.dtype,
+                               epoch=timeseries.start_time)
 
 def inverse_spectrum_truncation(psd, max_filter_len, low_frequency_cutoff=None, trunc_method=None):
     """Modify a PSD such that the impulse response associated with its inverse
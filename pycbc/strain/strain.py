@@ -1634,10 +1634,20 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         self.psd = None
         self.psds = {}
 
+        # Keeps the PSDs of the individual Welch segments, so that only the
+        # segments with new data need to be recomputed
+        psd_seg_len = int(self.sample_rate * self.psd_segment_length)
+        self.psd_estimator = pycbc.psd.SlidingWelch(psd_seg_len,
+                                                    psd_seg_len // 2)
+
         strain_len = int(max_buffer * self.sample_rate)
-        self.strain = TimeSeries(zeros(strain_len, dtype=numpy.float32),
-                                 delta_t=1.0/self.sample_rate,
-                                 epoch=start_time-max_buffer)
+        self.strain_store = pycbc.frame.SlidingTimeSeries(
+            strain_len,
+            1.0 / self.sample_rate,
+            start_time - max_buffer,
+            dtype=numpy.float32
+        )
+        self.strain = self.strain_store.series
 
         # Determine the total number of corrupted samples for highpass
         # and PSD over whitening
@@ -1676,6 +1686,12 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         """ Return the end time of the current valid segment of data """
         return float(self.strain.start_time + (len(self.strain) - self.total_corruption) / self.sample_rate)
 
+    def absolute_index(self, index):
+        """ Return the absolute index, counted from GPS time zero, of the
+        sample with the given index in the strain buffer """
+        return int(round(float(self.strain.start_time) * self.sample_rate)) \
+            + int(index)
+
     def add_hard_count(self):
         """ Reset the countdown timer, so that we don't analyze data long enough
         to generate a new PSD.
@@ -1696,7 +1712,8 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         seg_len = int(self.sample_rate * self.psd_segment_length)
         e = len(self.strain)
         s = e - (self.psd_samples + 1) * seg_len // 2
-        psd = pycbc.psd.welch(self.strain[s:e], seg_len=seg_len, seg_stride=seg_len//2)
+        psd = self.psd_estimator.estimate(self.strain[s:e],
+                                          self.absolute_index(s))
 
         psd.dist = spa_distance(psd, 1.4, 1.4, self.low_frequency_cutoff) * pycbc.DYN_RANGE_FAC
 
@@ -1838,11 +1855,13 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         """
         sample_step = int(blocksize * self.sample_rate)
         csize = sample_step + self.corruption * 2
-        self.strain.roll(-sample_step)
+        self.strain = self.strain_store.advance(sample_step)
 
         # We should roll this off at some point too...
         self.strain[len(self.strain) - csize + self.corruption:] = 0
         self.strain.start_time += blocksize
+        self.psd_estimator.invalidate(
+            self.absolute_index(len(self.strain) - csize + self.corruption))
 
         # The next time we need strain will need to be tapered
         self.taper_immediate_strain = True
@@ -1932,9 +1951,11 @@ class StrainBuffer(pycbc.frame.DataBuffer):
             self.taper_immediate_strain = False
 
         # Stitch into continuous stream
-        self.strain.roll(-sample_step)
+        self.strain = self.strain_store.advance(sample_step)
         self.strain[len(self.strain) - csize + self.corruption:] = strain[:]
         self.strain.start_time += blocksize
+        self.psd_estimator.invalidate(
+            self.absolute_index(len(self.strain) - csize + self.corruption))
 
         # apply gating if needed
         if self.autogating_threshold is not None:
@@ -1954,6 +1975,10 @@ class StrainBuffer(pycbc.frame.DataBuffer):
                         [(gt, self.autogating_width, self.autogating_taper)
                          for gt in glitch_times]
                 self.strain = gate_data(self.strain, self.gate_params)
+                gate_start = float(min(glitch_times)) \
+                    - self.autogating_width - self.autogating_taper
+                self.psd_estimator.invalidate(
+                    int(numpy.floor(gate_start * self.sample_rate)))
 
         if self.psd is None and self.wait_duration <=0:
             self.recalculate_psd()
@@ -21,7 +21,7 @@
 #
 # =============================================================================
 #
-import numpy, logging, math, pycbc.fft
+import numpy, logging, math, itertools, pycbc.fft
 
 from pycbc.types import zeros, real_same_precision_as, TimeSeries, complex_same_precision_as
 from pycbc.filter import sigmasq_series, make_frequency_series, matched_filter_core, get_cutoff_indices
@@ -30,6 +30,8 @@ import pycbc.pnutils
 
 BACKEND_PREFIX="pycbc.vetoes.chisq_"
 
+_psd_keys = itertools.count()
+
 def power_chisq_bins_from_sigmasq_series(sigmasq_series, num_bins, kmin, kmax):
     """Returns bins of equal power for use with the chisq functions
 
@@ -107,6 +109,15 @@ def shift_sum(v1, shifts, bins):
     err_msg += "scheme. You shouldn't be seeing this error!"
     raise ValueError(err_msg)
 
+@schemed(BACKEND_PREFIX)
+def batch_shift_sum(v1, tnums, shifts, bins):
+    """ Calculate the time shifted sums of the FrequencySeries of many
+    templates
+    """
+    err_msg = "This function is a stub that should be overridden using the "
+    err_msg += "scheme. You shouldn't be seeing this error!"
+    raise ValueError(err_msg)
+
 
 def power_chisq_at_points_from_precomputed(corr, snr, snr_norm, bins, indices):
     """Calculate the chisq timeseries from precomputed values for only select points.
@@ -137,6 +148,59 @@ def power_chisq_at_points_from_precomputed(corr, snr, snr_norm, bins, indices):
     chisq = shift_sum(corr, indices, bins) # pylint:disable=assignment-from-no-return
     return (chisq * num_bins - (snr.conj() * snr).real) * (snr_norm ** 2.0)
 
+def batch_power_chisq_at_points(corrs, snr, snr_norm, bins, indices,
+                                template_ids):
+    """Calculate the chisq at select points of many templates at once.
+
+    On the CPU, the chisq at every point is calculated in a single pass,
+    which is split between threads. Otherwise, the chisq of each template
+    is calculated in turn.
+
+    Parameters
+    ----------
+    corrs: list of FrequencySeries
+        The product of each template and the data in the frequency domain.
+        These must be of equal length, and are not copied if each follows
+        the last in memory, as in a template batch.
+    snr: numpy.ndarray
+        The unnormalized snr at each point.
+    snr_norm: numpy.ndarray
+        The snr normalization of each template. Entries for templates
+        without points are ignored.
+    bins: list
+        The edges of the equal power bins of each template, or None for
+        templates without points.
+    indices: numpy.ndarray
+        The indices where we will calculate the chisq. These must be relative
+        to the given `corrs`.
+    template_ids: numpy.ndarray
+        The template of each point, as an index into `corrs`.
+
+    Returns
+    -------
+    chisq: numpy.ndarray
+        An array containing the chisq at each point.
+    """
+    import pycbc.scheme
+    template_ids = numpy.asarray(template_ids, dtype=int)
+    real_type = real_same_precision_as(corrs[0])
+    num_bins = numpy.array([0 if b is None else len(b) - 1 for b in bins])
+    norm = numpy.array([0 if n is None else n for n in snr_norm],
+                       dtype=numpy.float64) ** 2.0
+
+    if isinstance(pycbc.scheme.mgr.state, pycbc.scheme.CPUScheme):
+        chisq = batch_shift_sum(corrs, template_ids, indices, bins) # pylint:disable=assignment-from-no-return
+        num_bins = num_bins.astype(real_type)[template_ids]
+        norm = norm.astype(real_type)[template_ids]
+        return (chisq * num_bins - (snr.conj() * snr).real) * norm
+
+    chisq = numpy.zeros(len(template_ids), dtype=real_type)
+    for t in numpy.unique(template_ids):
+        sel = template_ids == t
+        chisq[sel] = power_chisq_at_points_from_precomputed(
+            corrs[t], snr[sel], snr_norm[t], bins[t], indices[sel])
+    return chisq
+
 _q_l = None
 _qtilde_l = None
 _chisq_l = None
@@ -307,7 +371,7 @@ class SingleDetPowerChisq(object):
     """Class that handles precomputation and memory management for efficiently
     running the power chisq in a single detector inspiral analysis.
     """
-    def __init__(self, num_bins=0, snr_threshold=None):
+    def __init__(self, num_bins=0, snr_threshold=None, bin_cache_size=2**14):
         if not (num_bins == "0" or num_bins == 0):
             self.do = True
             self.column_name = "chisq"
@@ -317,6 +381,9 @@ class SingleDetPowerChisq(object):
             self.do = False
         self.snr_threshold = snr_threshold
 
+        from pycbc.opt import LimitedSizeDict
+        self._bin_cache = LimitedSizeDict(size_limit=bin_cache_size)
+
     @staticmethod
     def parse_option(row, arg):
         safe_dict = {'max': max, 'min': min}
@@ -326,17 +393,23 @@ class SingleDetPowerChisq(object):
         return eval(arg, {"__builtins__":None}, safe_dict)
 
     def cached_chisq_bins(self, template, psd):
-        from pycbc.opt import LimitedSizeDict
-
-        key = id(psd)
-        if not hasattr(psd, '_chisq_cached_key'):
-            psd._chisq_cached_key = {}
-
-        if not hasattr(template, '_bin_cache'):
-            template._bin_cache = LimitedSizeDict(size_limit=2**2)
-
-        if key not in template._bin_cache or id(template.params) not in psd._chisq_cached_key:
-            psd._chisq_cached_key[id(template.params)] = True
+        """ Obtain the chisq bins for this template and PSD, which are cached
+        for all templates of the bank.
+        """
+        # PSDs are given a key when first seen, as their id may be reused
+        # once they are freed
+        if not hasattr(psd, '_chisq_bin_key'):
+            psd._chisq_bin_key = next(_psd_keys)
+
+        # Without a template hash, the template parameters are identified by
+        # their id, and are kept with the bins so that it is not reused
+        params = template.params
+        tkey = getattr(params, 'template_hash', None)
+        if tkey is None:
+            tkey = ('id', id(params))
+        key = (psd._chisq_bin_key, tkey)
+
+        if key not in self._bin_cache:
             num_bins = int(self.parse_option(template, self.num_bins))
 
             if hasattr(psd, 'sigmasq_vec') and \
@@ -351,9 +424,9 @@ class SingleDetPowerChisq(object):
                 )
             else:
                 bins = power_chisq_bins(template, num_bins, psd, template.f_lower)
-            template._bin_cache[key] = bins
+            self._bin_cache[key] = (params, bins)
 
-        return template._bin_cache[key]
+        return self._bin_cache[key][1]
 
     def values(self, corr, snrv, snr_norm, psd, indices, template):
         """ Calculate the chisq at points given by indices.
@@ -399,6 +472,78 @@ class SingleDetPowerChisq(object):
         else:
             return None, None
 
+    def batch_values(self, corrs, snrvs, snr_norms, psd, indices, templates):
+        """ Calculate the chisq at points given by indices for a batch of
+        templates at once.
+
+        Parameters
+        ----------
+        corrs: list of FrequencySeries
+            The product of each template and the data in the frequency
+            domain, of equal lengths.
+        snrvs: list
+            The unnormalized snr at the points of each template.
+        snr_norms: list
+            The snr normalization of each template.
+        psd: FrequencySeries
+            The psd of the data.
+        indices: list
+            The points of each template, relative to its correlation. An
+            entry may be None or empty if the template has no points.
+        templates: list
+            The templates, or None for those without points.
+
+        Returns
+        -------
+        values: list
+            The chisq and chisq_dof of each template, as given by values.
+        """
+        if not self.do:
+            return [(None, None)] * len(templates)
+
+        bins = [None] * len(templates)
+        dofs = [None] * len(templates)
+        aboves = [None] * len(templates)
+        for i, template in enumerate(templates):
+            if indices[i] is None or len(indices[i]) == 0:
+                continue
+            above = numpy.ones(len(indices[i]), dtype=bool)
+            if self.snr_threshold:
+                above = abs(snrvs[i] * snr_norms[i]) > self.snr_threshold
+            aboves[i] = above
+            dofs[i] = -100
+            if above.any():
+                bins[i] = self.cached_chisq_bins(template, psd)
+                dofs[i] = (len(bins[i]) - 1) * 2 - 2
+        if self.snr_threshold:
+            num_above = sum(a.sum() for a in aboves if a is not None)
+            logging.info('%s above chisq activation threshold', num_above)
+
+        used = [i for i, b in enumerate(bins) if b is not None]
+        if used:
+            _chisq = batch_power_chisq_at_points(
+                corrs,
+                numpy.concatenate([snrvs[i][aboves[i]] for i in used]),
+                [None if b is None else n for n, b in zip(snr_norms, bins)],
+                bins,
+                numpy.concatenate([indices[i][aboves[i]] for i in used]),
+                numpy.concatenate([numpy.repeat(i, aboves[i].sum())
+                                   for i in used]))
+
+        values = []
+        start = 0
+        for i in range(len(templates)):
+            if aboves[i] is None:
+                values.append((None, None))
+                continue
+            chisq_out = numpy.zeros(len(indices[i]), dtype=numpy.float32)
+            if bins[i] is not None:
+                end = start + aboves[i].sum()
+                chisq_out[aboves[i]] = _chisq[start:end]
+                start = end
+            values.append((chisq_out, numpy.repeat(dofs[i], len(indices[i]))))
+        return values
+
 
 class SingleDetSkyMaxPowerChisq(SingleDetPowerChisq):
     """Class that handles precomputation and memory management for efficiently
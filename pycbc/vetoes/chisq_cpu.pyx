@@ -4,6 +4,7 @@ cimport numpy
 from libc.stdlib cimport malloc, free
 from libc.math cimport cos, sin # This imports c's sin and cos function from the math library
 from cython import wraparound, boundscheck, cdivision
+from cython.parallel import parallel, prange
 from pycbc.types import real_same_precision_as
 
 ctypedef fused REALTYPE:
@@ -129,6 +130,93 @@ def point_chisq_code(numpy.ndarray[REALTYPE, ndim=1] chisq,
     free(outr_tmp)
     free(outi_tmp)
 
+# The number of points of a template whose chisq is calculated together. Each
+# chunk of points is calculated by one thread.
+BATCH_CHUNK_SIZE = 128
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+def batch_point_chisq_code(REALTYPE[::1] chisq,
+                           COMPLEXTYPE[:, ::1] v1,
+                           unsigned int[::1] tnums,
+                           REALTYPE[::1] shifts,
+                           unsigned int[::1] bins,
+                           unsigned int[::1] bin_start,
+                           unsigned int[::1] chunk_start,
+                           int chunk_size):
+    # As point_chisq_code, for points of many templates, which are sorted by
+    # template and split into chunks of at most chunk_size points of one
+    # template
+    cdef int nchunks, c, t, r, i, j, n, p, bstart, bend, slen
+    cdef REALTYPE *outr
+    cdef REALTYPE *outi
+    cdef REALTYPE *pr
+    cdef REALTYPE *pi
+    cdef REALTYPE *vsr
+    cdef REALTYPE *vsi
+    cdef REALTYPE vr, vi, t1, t2, k1, k2, k3, vs, va
+
+    nchunks = chunk_start.shape[0] - 1
+    slen = v1.shape[1]
+
+    with nogil, parallel():
+        outr = <REALTYPE *> malloc(chunk_size * sizeof(REALTYPE))
+        outi = <REALTYPE *> malloc(chunk_size * sizeof(REALTYPE))
+        pr = <REALTYPE *> malloc(chunk_size * sizeof(REALTYPE))
+        pi = <REALTYPE *> malloc(chunk_size * sizeof(REALTYPE))
+        vsr = <REALTYPE *> malloc(chunk_size * sizeof(REALTYPE))
+        vsi = <REALTYPE *> malloc(chunk_size * sizeof(REALTYPE))
+
+        for c in prange(nchunks, schedule='dynamic'):
+            p = chunk_start[c]
+            n = chunk_start[c + 1] - p
+            t = tnums[p]
+
+            for r in range(bin_start[t], bin_start[t + 1] - 1):
+                bstart = bins[r]
+                bend = bins[r + 1]
+
+                for i in range(n):
+                    pr[i] = cos(2 * 3.141592653 * shifts[p + i] * (bstart) / slen)
+                    pi[i] = sin(2 * 3.141592653 * shifts[p + i] * (bstart) / slen)
+                    vsr[i] = cos(2 * 3.141592653 * shifts[p + i] / slen)
+                    vsi[i] = sin(2 * 3.141592653 * shifts[p + i] / slen)
+                    outr[i] = 0
+                    outi[i] = 0
+
+                for j in range(bstart, bend):
+                    vr = v1[t, j].real
+                    vi = v1[t, j].imag
+                    vs = vr + vi
+                    va = vi - vr
+
+                    for i in range(n):
+                        t1 = pr[i]
+                        t2 = pi[i]
+
+                        # Complex multiply pr[i] * v
+                        k1 = vr * (t1 + t2)
+                        k2 = t1 * va
+                        k3 = t2 * vs
+
+                        outr[i] = outr[i] + (k1 - k3)
+                        outi[i] = outi[i] + (k1 + k2)
+
+                        # phase shift for the next time point
+                        pr[i] = t1 * vsr[i] - t2 * vsi[i]
+                        pi[i] = t1 * vsi[i] + t2 * vsr[i]
+
+                for i in range(n):
+                    chisq[p + i] = chisq[p + i] + (outr[i] * outr[i] + outi[i] * outi[i])
+
+        free(outr)
+        free(outi)
+        free(pr)
+        free(pi)
+        free(vsr)
+        free(vsi)
+
 def chisq_accum_bin_numpy(chisq, q):
     chisq += q.squared_norm()
 
@@ -155,3 +243,51 @@ def shift_sum(v1, shifts, bins):
 
     return  chisq
 
+def _stack_vectors(vecs):
+    # View vectors of equal length which follow each other in memory, such
+    # as those of a template batch, as one 2D array, otherwise copy them
+    vecs = [numpy.array(v.data, copy=False) for v in vecs]
+    first = vecs[0]
+    step = len(first) * first.itemsize
+    ptr = first.ctypes.data
+    if all(v.dtype == first.dtype and len(v) == len(first)
+           and v.flags.c_contiguous and v.ctypes.data == ptr + i * step
+           for i, v in enumerate(vecs)):
+        return numpy.lib.stride_tricks.as_strided(
+            first, shape=(len(vecs), len(first)),
+            strides=(step, first.itemsize))
+    return numpy.stack(vecs)
+
+def batch_shift_sum(v1, tnums, shifts, bins):
+    real_type = real_same_precision_as(v1[0])
+    v1 = _stack_vectors(v1)
+    tnums = numpy.array(tnums, dtype=numpy.uint32)
+    shifts = numpy.array(shifts, dtype=real_type)
+
+    # Flatten the bin edges of every template
+    edges = [numpy.array([], dtype=numpy.uint32) if b is None else
+             numpy.array(b, dtype=numpy.uint32) for b in bins]
+    bin_start = numpy.zeros(len(edges) + 1, dtype=numpy.uint32)
+    bin_start[1:] = numpy.cumsum([len(e) for e in edges])
+    edges = numpy.concatenate(edges + [numpy.zeros(1, dtype=numpy.uint32)])
+
+    # Sort the points by template, and split those of each template into
+    # chunks
+    order = numpy.argsort(tnums, kind='stable')
+    tnums = tnums[order]
+    shifts = shifts[order]
+    bounds = numpy.flatnonzero(numpy.diff(tnums)) + 1
+    bounds = numpy.concatenate([[0], bounds, [len(tnums)]])
+    chunk_start = numpy.concatenate(
+        [numpy.arange(l, r, BATCH_CHUNK_SIZE)
+         for l, r in zip(bounds[:-1], bounds[1:])] + [[len(tnums)]])
+    chunk_start = chunk_start.astype(numpy.uint32)
+
+    chisq = numpy.zeros(len(tnums), dtype=real_type)
+    if len(tnums):
+        batch_point_chisq_code(chisq, v1, tnums, shifts, edges, bin_start,
+                               chunk_start, BATCH_CHUNK_SIZE)
+
+    out = numpy.zeros(len(tnums), dtype=real_type)
+    out[order] = chisq
+    return out
@@ -50,6 +50,9 @@ class SingleDetSGChisq(SingleDetPowerChisq):
         else:
             self.do = False
 
+        from pycbc.opt import LimitedSizeDict
+        self._bin_cache = LimitedSizeDict(size_limit=2**14)
+
     @staticmethod
     def insert_option_group(parser):
         group = parser.add_argument_group("Sine-Gaussian Chisq")
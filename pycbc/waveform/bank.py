@@ -37,6 +37,7 @@ import pycbc.pnutils
 import pycbc.waveform.compress
 from pycbc import DYN_RANGE_FAC
 from pycbc.types import FrequencySeries, zeros
+from pycbc.opt import LimitedMemoryDict
 import pycbc.io
 from pycbc.io.ligolw import LIGOLWContentHandler
 import hashlib
@@ -520,7 +521,7 @@ class TemplateBank(object):
 class LiveFilterBank(TemplateBank):
     def __init__(self, filename, sample_rate, minimum_buffer,
                        approximant=None, increment=8, parameters=None,
-                       low_frequency_cutoff=None,
+                       low_frequency_cutoff=None, cache_size=None,
                        **kwds):
 
         self.increment = increment
@@ -529,6 +530,13 @@ class LiveFilterBank(TemplateBank):
         self.minimum_buffer = minimum_buffer
         self.f_lower = low_frequency_cutoff
 
+        # Keep up to `cache_size` bytes of generated templates, so that they
+        # are not generated again e.g. for followups. Slices of the bank
+        # share the same cache.
+        self.template_cache = None
+        if cache_size:
+            self.template_cache = LimitedMemoryDict(memory_limit=cache_size)
+
         super(LiveFilterBank, self).__init__(filename, approximant=approximant,
                 parameters=parameters, **kwds)
         self.ensure_standard_filter_columns(low_frequency_cutoff=low_frequency_cutoff)
@@ -629,6 +637,16 @@ class LiveFilterBank(TemplateBank):
         if delta_f is None:
             delta_f = self.freq_resolution_for_template(index)
 
+        row = self.table[index]
+        cache_key = (
+            self.id_from_param((row.mass1, row.mass2, row.spin1z, row.spin2z)),
+            delta_f
+        )
+        if self.template_cache is not None and cache_key in self.template_cache:
+            htilde = self.template_cache[cache_key]
+            row.template_duration = htilde.chirp_length
+            return htilde
+
         flen = int(self.sample_rate / (2 * delta_f) + 1)
 
         if f_end is None or f_end >= (flen * delta_f):
@@ -684,6 +702,9 @@ class LiveFilterBank(TemplateBank):
                                         htilde.params.mass2,
                                         htilde.params.spin1z,
                                         htilde.params.spin2z))
+
+        if self.template_cache is not None:
+            self.template_cache[cache_key] = htilde
         return htilde
 
 
@@ -34,6 +34,7 @@ _scheme, _context = parse_args_all_schemes("correlate")
 from pycbc.vetoes.chisq_cpu import chisq_accum_bin_numpy
 from pycbc.vetoes import chisq_accum_bin, power_chisq_bins, power_chisq
 from pycbc.vetoes import power_chisq_at_points_from_precomputed
+from pycbc.vetoes import batch_power_chisq_at_points, SingleDetPowerChisq
 from pycbc.filter import resample_to_delta_t
 from pycbc.catalog import Merger
 from pycbc.psd import interpolate, inverse_spectrum_truncation
@@ -122,9 +123,82 @@ class TestChisq(unittest.TestCase):
             max_diff = max(abs(chisq_full[ifo] - chisq_quick[ifo]))
             self.assertTrue(max_diff < 1E-5)
 
+class TestBatchChisq(unittest.TestCase):
+    def setUp(self):
+        self.context = _context
+        rng = numpy.random.default_rng(1)
+        self.slen = 4096
+        self.num = 3
+        corr = rng.normal(size=self.num * self.slen) + \
+            1j * rng.normal(size=self.num * self.slen)
+        self.corr_mem = Array(corr, dtype=complex64)
+        self.corrs = [self.corr_mem[i * self.slen:(i + 1) * self.slen]
+                      for i in range(self.num)]
+        self.bins = [numpy.linspace(100, 1800, 17).astype(int),
+                     None,
+                     numpy.linspace(50, 2000, 9).astype(int)]
+        self.norms = [0.3, None, 1.7]
+        self.indices = [rng.integers(0, self.slen, 150), None,
+                        rng.integers(0, self.slen, 30)]
+        self.snrs = [(rng.normal(size=len(i)) + 1j * rng.normal(size=len(i)))
+                     .astype(numpy.complex64) if i is not None else None
+                     for i in self.indices]
+
+    def expected(self, corrs):
+        return [None if b is None else
+                power_chisq_at_points_from_precomputed(
+                    c, s, n, b, i)
+                for c, s, n, b, i in zip(corrs, self.snrs, self.norms,
+                                         self.bins, self.indices)]
+
+    def test_batch_chisq(self):
+        used = [0, 2]
+        tids = numpy.concatenate([numpy.repeat(i, len(self.indices[i]))
+                                  for i in used])
+        with self.context:
+            # Each correlation follows the last in memory, or is copied
+            for corrs in [self.corrs,
+                          [Array(c, copy=True) for c in self.corrs]]:
+                expected = self.expected(corrs)
+                chisq = batch_power_chisq_at_points(
+                    corrs, numpy.concatenate([self.snrs[i] for i in used]),
+                    self.norms, self.bins,
+                    numpy.concatenate([self.indices[i] for i in used]), tids)
+                numpy.testing.assert_allclose(
+                    chisq, numpy.concatenate([expected[i] for i in used]),
+                    rtol=1e-5)
+
+    def test_batch_values(self):
+        psd = Array(numpy.ones(self.slen // 2 + 1))
+        templates = []
+        power_chisq = SingleDetPowerChisq(num_bins=4, snr_threshold=1.0)
+        for i, bins in enumerate(self.bins):
+            template = None
+            if bins is not None:
+                template = Array(numpy.zeros(1))
+                template.params = type('Params', (), {'template_hash': i})
+                power_chisq._bin_cache[(0, i)] = (template.params, bins)
+            templates.append(template)
+        psd._chisq_bin_key = 0
+
+        with self.context:
+            values = power_chisq.batch_values(self.corrs, self.snrs,
+                                              self.norms, psd, self.indices,
+                                              templates)
+            for i in range(self.num):
+                if templates[i] is None:
+                    self.assertEqual(values[i], (None, None))
+                    continue
+                chisq, dof = power_chisq.values(
+                    self.corrs[i], self.snrs[i], self.norms[i], psd,
+                    self.indices[i], templates[i])
+                numpy.testing.assert_allclose(values[i][0], chisq, rtol=1e-5)
+                numpy.testing.assert_equal(values[i][1], dof)
+
 
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestChisq))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestBatchChisq))
 
 if __name__ == '__main__':
     results = unittest.TextTestRunner(verbosity=2).run(suite)
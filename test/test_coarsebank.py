@@ -0,0 +1,167 @@
+"""Unit tests for filtering a template bank after a coarse bank"""
+
+import os
+import shutil
+import tempfile
+import types
+import unittest
+import numpy
+from utils import parse_args_cpu_only, simple_exit
+import pycbc
+from pycbc.filter.coarsebank import CoarseBankFilter, bank_match_graph
+from pycbc.io import HFile
+from pycbc.psd import aLIGOZeroDetHighPower
+from pycbc.types import zeros
+from pycbc.waveform import FilterBank
+from pycbc.waveform.utils import apply_fseries_time_shift
+
+parse_args_cpu_only("Coarse bank")
+
+
+class _Bank(object):
+    """A bank with only template hashes"""
+    def __init__(self, hashes):
+        self.table = types.SimpleNamespace(template_hash=numpy.array(hashes))
+
+    def __len__(self):
+        return len(self.table.template_hash)
+
+
+class TestCoarseBankFilter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.graph_file = os.path.join(self.tmpdir, 'graph.hdf')
+        # Templates 10 to 15 of a bank, as if it had been split
+        self.bank = _Bank(numpy.arange(10, 16))
+        self.coarse_bank = _Bank(numpy.arange(100, 110))
+        with HFile(self.graph_file, 'w') as f:
+            f['template_hash'] = numpy.array([3, 11, 11, 12, 14, 15, 15])
+            f['coarse_id'] = numpy.array([0, 4, 7, 4, 2, 7, 9])
+            f['match'] = numpy.ones(7)
+            f['coarse_template_hash'] = numpy.arange(100, 110)
+            f.attrs['min_match'] = 0.95
+            f.attrs['coarse_bank_file'] = 'coarse.hdf'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_disabled(self):
+        coarse = CoarseBankFilter(self.bank)
+        self.assertFalse(coarse.enabled)
+        self.assertTrue(coarse.template_segment_checker(3, 0))
+
+    def test_mismatched_coarse_bank(self):
+        for hashes in [numpy.arange(100, 109),
+                       numpy.arange(100, 110)[::-1]]:
+            with self.assertRaises(ValueError):
+                CoarseBankFilter(self.bank, coarse_bank=_Bank(hashes),
+                                 graph_file=self.graph_file)
+
+    def test_template_segment_checker(self):
+        coarse = CoarseBankFilter(self.bank, coarse_bank=self.coarse_bank,
+                                  graph_file=self.graph_file,
+                                  snr_fraction=0.9)
+        # Coarse template 0 is only a neighbour of a template not in the bank
+        numpy.testing.assert_equal(coarse.coarse_templates, [2, 4, 7, 9])
+        coarse.peaks = numpy.array([[False, True],
+                                    [True, False],
+                                    [False, False],
+                                    [False, True]])
+        expected = [[True, True],    # template 10 has no neighbours
+                    [True, False],   # 11: coarse 4 and 7
+                    [True, False],   # 12: coarse 4
+                    [True, True],    # 13 has no neighbours
+                    [False, True],   # 14: coarse 2
+                    [False, True]]   # 15: coarse 7 and 9
+        for t_num in range(6):
+            for s_num in range(2):
+                self.assertEqual(
+                    coarse.template_segment_checker(t_num, s_num),
+                    expected[t_num][s_num])
+
+
+class TestCoarseBankFiltering(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.flow = 30.
+        self.tlen = 8 * 1024
+        self.flen = self.tlen // 2 + 1
+        self.delta_f = 1. / 8
+
+        self.files = {}
+        masses = {'bank': ([10., 10.05, 10.1], [10., 10., 10.]),
+                  'coarse': ([10.05, 3.], [10., 3.])}
+        for name, (mass1, mass2) in masses.items():
+            self.files[name] = os.path.join(self.tmpdir, name + '.hdf')
+            with HFile(self.files[name], 'w') as f:
+                f['mass1'] = numpy.array(mass1)
+                f['mass2'] = numpy.array(mass2)
+                f['spin1z'] = numpy.zeros(len(mass1))
+                f['spin2z'] = numpy.zeros(len(mass1))
+
+        self.psd = aLIGOZeroDetHighPower(self.flen, self.delta_f, self.flow)
+        self.psd *= pycbc.DYN_RANGE_FAC ** 2.0
+        self.psd = self.psd.astype(numpy.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def filter_bank(self, name, out=None):
+        return FilterBank(self.files[name], self.flen, self.delta_f,
+                          numpy.complex64, out=out,
+                          low_frequency_cutoff=self.flow,
+                          approximant='SPAtmplt',
+                          enable_compressed_waveforms=False)
+
+    def test_filter_coarse_bank(self):
+        bank = self.filter_bank('bank')
+        coarse_bank = self.filter_bank('coarse')
+        template_id, coarse_id, matches = bank_match_graph(
+            bank, coarse_bank, self.psd, 0.9, self.flow)
+        # Every template neighbours the first coarse template only
+        numpy.testing.assert_equal(template_id, [0, 1, 2])
+        numpy.testing.assert_equal(coarse_id, [0, 0, 0])
+        self.assertTrue((matches >= 0.9).all())
+
+        graph_file = os.path.join(self.tmpdir, 'graph.hdf')
+        with HFile(graph_file, 'w') as f:
+            f['template_hash'] = bank.table.template_hash[template_id]
+            f['coarse_id'] = coarse_id
+            f['match'] = matches
+            f['coarse_template_hash'] = coarse_bank.table.template_hash
+            f.attrs['min_match'] = 0.9
+            f.attrs['coarse_bank_file'] = self.files['coarse']
+
+        # A signal in the first of two overwhitened segments
+        signal = bank[1]
+        amplitude = 20. / signal.sigmasq(self.psd) ** 0.5
+        signal = apply_fseries_time_shift(signal, 4.) * amplitude
+        segments = []
+        for data in [signal, zeros(self.flen, dtype=numpy.complex64)]:
+            stilde = (data / self.psd).astype(numpy.complex64)
+            stilde.psd = self.psd
+            stilde.analyze = slice(1024, self.tlen - 1024)
+            segments.append(stilde)
+
+        coarse_mem = zeros(self.tlen, dtype=numpy.complex64)
+        coarse_bank = self.filter_bank('coarse', out=coarse_mem)
+        coarse = CoarseBankFilter(bank, coarse_bank=coarse_bank,
+                                  graph_file=graph_file, snr_fraction=0.9)
+        numpy.testing.assert_equal(coarse.coarse_templates, [0])
+        coarse.filter_coarse_bank(self.flow, 5.5, self.tlen, self.delta_f,
+                                  numpy.complex64, segments, coarse_mem)
+        numpy.testing.assert_equal(coarse.peaks, [[True, False]])
+        for t_num in range(len(bank)):
+            self.assertTrue(coarse.template_segment_checker(t_num, 0))
+            self.assertFalse(coarse.template_segment_checker(t_num, 1))
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestCoarseBankFilter))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestCoarseBankFiltering))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -0,0 +1,75 @@
+"""Unit tests for clustering coincident events over time"""
+
+import unittest
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events.coinc import (cluster_coincs, cluster_coincs_multiifo,
+                                cluster_over_time, mean_if_greater_than_zero)
+
+parse_args_cpu_only("Coinc clustering")
+
+
+class TestCoincCluster(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        num = 5000
+        self.time1 = rng.uniform(1e9, 1e9 + 2000, num)
+        self.time2 = self.time1 + rng.normal(0, 0.005, num)
+        self.time3 = np.where(rng.random(num) < 0.3, -1, self.time2 + 0.001)
+        self.timeslide_id = rng.integers(-10, 10, num)
+        self.timeslide_id[:1000] = 0
+        self.stat = rng.normal(5, 1, num).astype(np.float32)
+
+    def brute_force(self, time, window):
+        # An event survives if it is the loudest within a window of it
+        keep = [i for i in range(len(time))
+                if self.stat[abs(time - time[i]) < window].max()
+                == self.stat[i]]
+        return np.sort(keep)
+
+    def test_over_time(self):
+        expected = self.brute_force(self.time1, 1.)
+        for method in ['python', 'cython']:
+            full = cluster_over_time(self.stat, self.time1, 1., method=method)
+            np.testing.assert_equal(np.sort(full), expected)
+            for chunk_size in [1, 100, 1000]:
+                np.testing.assert_equal(
+                    cluster_over_time(self.stat, self.time1, 1.,
+                                      method=method, chunk_size=chunk_size),
+                    full)
+
+    def test_chunked_coincs(self):
+        full = cluster_coincs(self.stat, self.time1, self.time2,
+                              self.timeslide_id, 0.1, 1.)
+        for chunk_size in [1, 100, 1000]:
+            np.testing.assert_equal(
+                cluster_coincs(self.stat, self.time1, self.time2,
+                               self.timeslide_id, 0.1, 1.,
+                               chunk_size=chunk_size),
+                full)
+
+    def test_multiifo(self):
+        times = (self.time1, self.time2, self.time3)
+        # The mean coinc times are the same as from mean_if_greater_than_zero
+        mean_times = np.array([mean_if_greater_than_zero(tc)[0]
+                               for tc in zip(*times)])
+        zeros = np.zeros(len(self.stat))
+        np.testing.assert_equal(
+            np.sort(cluster_coincs_multiifo(self.stat, times, zeros, 0, 1.)),
+            self.brute_force(mean_times, 1.))
+
+        full = cluster_coincs_multiifo(self.stat, times, self.timeslide_id,
+                                       0.1, 1.)
+        for chunk_size in [1, 100, 1000]:
+            np.testing.assert_equal(
+                cluster_coincs_multiifo(self.stat, times, self.timeslide_id,
+                                        0.1, 1., chunk_size=chunk_size),
+                full)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestCoincCluster))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
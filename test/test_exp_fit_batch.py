@@ -0,0 +1,198 @@
+"""Unit tests for ranking triggers from many templates at once with the
+ExpFitStatistic, and for updating its files"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import h5py
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events import stat
+
+parse_args_cpu_only("ExpFitStatistic batches")
+
+
+class TestExpFitBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ifos = ['H1', 'L1']
+        self.num_templates = 10
+        rng = np.random.default_rng(0)
+        nt = self.num_templates
+        files = []
+
+        for ifo in self.ifos:
+            fname = os.path.join(self.tmpdir, ifo + '-fits.hdf')
+            with h5py.File(fname, 'w') as f:
+                f.attrs['stat'] = ifo + '-fit_coeffs'
+                f.attrs['stat_threshold'] = 6.
+                f.attrs['analysis_time'] = 1000.
+                f['template_id'] = rng.permutation(nt)
+                f['fit_coeff'] = rng.uniform(4, 6, nt)
+                f['count_above_thresh'] = rng.integers(10, 100, nt)
+                f['count_in_template'] = rng.integers(100, 1000, nt)
+                f['median_sigma'] = rng.uniform(100, 200, nt)
+            files.append(fname)
+
+            fname = os.path.join(self.tmpdir, ifo + '-dq.hdf')
+            with h5py.File(fname, 'w') as f:
+                f.attrs['stat'] = ifo + '-dq_stat_info'
+                for i, tids in enumerate(np.array_split(np.arange(nt), 3)):
+                    f['%s/bins/bin%d/tids' % (ifo, i)] = tids
+                    f['%s/bins/bin%d/dq_rates' % (ifo, i)] = \
+                        rng.uniform(0.5, 3, 4)
+            files.append(fname)
+
+        for kname in ['signal', 'template']:
+            fname = os.path.join(self.tmpdir, kname + '-kde.hdf')
+            with h5py.File(fname, 'w') as f:
+                f.attrs['stat'] = kname + '-kde_file'
+                f['data_kde'] = rng.uniform(0.1, 1, nt)
+            files.append(fname)
+
+        fname = os.path.join(self.tmpdir, 'phasetd.hdf')
+        with h5py.File(fname, 'w') as f:
+            for ifo in self.ifos:
+                bins = np.unique(rng.integers(-4, 5, (500, 3)), axis=0)
+                param_bin = np.zeros(len(bins), dtype=[
+                    ('c%s' % i, np.int32) for i in range(3)
+                ])
+                for i in range(3):
+                    param_bin['c%s' % i] = bins[:, i]
+                f[ifo + '/param_bin'] = np.sort(param_bin)
+                f[ifo + '/weights'] = rng.uniform(1, 10, len(bins))
+            f.attrs['sensitivity_ratios'] = [1., 1.2]
+            f.attrs['srbmin'] = -5
+            f.attrs['srbmax'] = 5
+            f.attrs['twidth'] = 0.002
+            f.attrs['pwidth'] = 0.5
+            f.attrs['swidth'] = 0.2
+            f.attrs['ifos'] = self.ifos
+            f.attrs['stat'] = 'phasetd_newsnr_H1L1'
+        files.append(fname)
+
+        self.files = files
+        self.kwargs = stat.parse_statistic_feature_options(
+            ['phasetd', 'dq', 'kde', 'chirp_mass', 'sensitive_volume'],
+            ['benchmark_lograte:-14.6']
+        )
+        self.stat = self.make_stat()
+
+        # Triggers from many templates, in random template order
+        num = 300
+        masses = rng.uniform(1, 20, (2, nt))
+        self.trigs = {}
+        for ifo in self.ifos:
+            tids = rng.integers(0, nt, num)
+            self.trigs[ifo] = {
+                'ifo': ifo,
+                'template_id': tids,
+                'snr': rng.uniform(5, 10, num),
+                'coa_phase': rng.uniform(0, 2 * np.pi, num),
+                'end_time': 1e9 + rng.uniform(-0.01, 0.01, num),
+                'sigmasq': rng.uniform(1e4, 4e4, num),
+                'dq_state': rng.integers(0, 4, num),
+                'mass1': masses[0][tids],
+                'mass2': masses[1][tids],
+            }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        stat._signal_hists.clear()
+
+    def make_stat(self):
+        return stat.ExpFitStatistic('snr', files=self.files, ifos=self.ifos,
+                                    **self.kwargs)
+
+    def coincs(self):
+        # Pair up all triggers in the same template
+        ids = {ifo: [] for ifo in self.ifos}
+        for tid in range(self.num_templates):
+            h1 = np.flatnonzero(self.trigs['H1']['template_id'] == tid)
+            l1 = np.flatnonzero(self.trigs['L1']['template_id'] == tid)
+            ids['H1'] += list(np.repeat(h1, len(l1)))
+            ids['L1'] += list(np.tile(l1, len(h1)))
+        return {ifo: np.array(i, dtype=int) for ifo, i in ids.items()}
+
+    def rank(self, sngls, slide):
+        return self.stat.rank_stat_coinc(sngls, slide, 0.001, [0, 1],
+                                         time_addition=0.002)
+
+    def test_batch(self):
+        ids = self.coincs()
+        slide = (ids['H1'] + ids['L1']) % 5 - 2
+        # Singles of all templates are calculated at once
+        singles = {ifo: self.stat.single(self.trigs[ifo])
+                   for ifo in self.ifos}
+        batch = self.rank([(ifo, singles[ifo][ids[ifo]])
+                           for ifo in self.ifos], slide)
+
+        tids = self.trigs['H1']['template_id'][ids['H1']]
+        for tid in range(self.num_templates):
+            keep = tids == tid
+            # Singles of one template at a time
+            sngls = []
+            for ifo in self.ifos:
+                trigs = {k: v if k == 'ifo' else v[ids[ifo][keep]]
+                         for k, v in self.trigs[ifo].items()}
+                sngls.append((ifo, self.stat.single(trigs)))
+            np.testing.assert_allclose(batch[keep],
+                                       self.rank(sngls, slide[keep]),
+                                       rtol=1e-6)
+
+    def test_dq_rate(self):
+        trigs = self.trigs['L1']
+        self.stat.curr_ifo = 'L1'
+        self.stat.curr_tnum = trigs['template_id']
+        dq_rate = self.stat.find_dq_noise_rate(trigs, trigs['dq_state'])
+        bins = self.stat.dq_bin_by_tid['L1']
+        rates = self.stat.dq_rates_by_state['L1']
+        expected = [rates[bins[t]][s]
+                    for t, s in zip(trigs['template_id'], trigs['dq_state'])]
+        np.testing.assert_equal(dq_rate, expected)
+
+    def test_update_files(self):
+        ids = self.coincs()
+        slide = (ids['H1'] + ids['L1']) % 5 - 2
+        # Change the fits of some templates, and the dq rates of one bin
+        with h5py.File(os.path.join(self.tmpdir, 'H1-fits.hdf'), 'a') as f:
+            f['fit_coeff'][[2, 5]] = [7., 3.]
+        with h5py.File(os.path.join(self.tmpdir, 'L1-dq.hdf'), 'a') as f:
+            f['L1/bins/bin1/dq_rates'][:] = [1., 2., 3., 4.]
+        self.stat.check_update_files(lock=threading.Lock())
+        # Change which bins the templates are in
+        with h5py.File(os.path.join(self.tmpdir, 'H1-dq.hdf'), 'a') as f:
+            f['H1/bins/bin0/tids'][0] = 9
+            f['H1/bins/bin2/tids'][-1] = 0
+        self.stat.check_update_files()
+
+        reloaded = self.make_stat()
+        self.assertEqual(self.stat.alphamax, reloaded.alphamax)
+        for ifo in self.ifos:
+            for key, value in reloaded.fits_by_tid[ifo].items():
+                np.testing.assert_equal(self.stat.fits_by_tid[ifo][key],
+                                        value)
+            np.testing.assert_equal(self.stat.dq_rate_table[ifo],
+                                    reloaded.dq_rate_table[ifo])
+            np.testing.assert_equal(self.stat.dq_bin_index_by_tid[ifo],
+                                    reloaded.dq_bin_index_by_tid[ifo])
+
+        ranks = []
+        for stat_class in [self.stat, reloaded]:
+            singles = {ifo: stat_class.single(self.trigs[ifo])
+                       for ifo in self.ifos}
+            ranks.append(stat_class.rank_stat_coinc(
+                [(ifo, singles[ifo][ids[ifo]]) for ifo in self.ifos],
+                slide, 0.001, [0, 1], time_addition=0.002
+            ))
+        np.testing.assert_equal(ranks[0], ranks[1])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestExpFitBatch))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
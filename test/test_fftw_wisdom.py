@@ -0,0 +1,79 @@
+"""Unit tests for the FFTW plan cache and the wisdom cached for each host"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from sys import exit as _exit
+import numpy
+import pycbc.fft
+from pycbc.types import zeros
+from utils import parse_args_cpu_only, simple_exit
+
+parse_args_cpu_only("FFTW wisdom")
+
+if 'fftw' in pycbc.fft.get_backend_names():
+    from pycbc.fft import fftw
+else:
+    print("FFTW does not seem to be an available CPU backend; skipping "
+          "wisdom tests")
+    _exit(0)
+
+
+class TestFFTWWisdom(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_plan_cache(self):
+        invec = zeros(256, dtype=numpy.complex64)
+        outvec = zeros(256, dtype=numpy.complex64)
+        first = fftw.IFFT(invec, outvec)
+        other = fftw.IFFT(zeros(256, dtype=numpy.complex64),
+                          zeros(256, dtype=numpy.complex64))
+        batched = fftw.IFFT(zeros(512, dtype=numpy.complex64),
+                            zeros(512, dtype=numpy.complex64),
+                            nbatch=2, size=256)
+        self.assertEqual(first.plan, other.plan)
+        self.assertNotEqual(first.plan, batched.plan)
+
+    def test_host_wisdom(self):
+        fname = fftw.host_wisdom_filename('float', cache_dir=self.cache_dir)
+        self.assertEqual(os.path.dirname(fname), self.cache_dir)
+        self.assertNotEqual(
+            fname, fftw.host_wisdom_filename('double',
+                                             cache_dir=self.cache_dir))
+        self.assertFalse(fftw.import_host_wisdom('float',
+                                                 cache_dir=self.cache_dir))
+
+        fftw.FFT(zeros(384, dtype=numpy.float32),
+                 zeros(193, dtype=numpy.complex64))
+        fftw.export_host_wisdom('float', cache_dir=self.cache_dir)
+        self.assertTrue(os.path.getsize(fname) > 0)
+        # Exporting again merges with the existing wisdom
+        fftw.export_host_wisdom('float', cache_dir=self.cache_dir)
+        self.assertTrue(fftw.import_host_wisdom('float',
+                                                cache_dir=self.cache_dir))
+        self.assertEqual(
+            [f for f in os.listdir(self.cache_dir) if f.endswith('.tmp')], [])
+
+    def test_unlockable_host_wisdom(self):
+        # Wisdom is still read from a cache where the lock can't be made,
+        # as if it were read only
+        fname = fftw.host_wisdom_filename('float', cache_dir=self.cache_dir)
+        fftw.export_single_wisdom_to_filename(fname)
+        os.mkdir(fname + '.lock')
+        self.assertTrue(fftw.import_host_wisdom('float',
+                                                cache_dir=self.cache_dir))
+        with self.assertRaises(OSError):
+            fftw.export_host_wisdom('float', cache_dir=self.cache_dir)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestFFTWWisdom))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -134,6 +134,25 @@ class FrameTestBase(unittest.TestCase):
                           'channel1', start_time=self.epoch+1,
                           end_time=self.epoch)
 
+class SlidingTimeSeriesTest(unittest.TestCase):
+    def test_advance(self):
+        """Check that moving forward matches rolling a plain array,
+        including when the storage wraps around"""
+        store = pycbc.frame.SlidingTimeSeries(100, 0.5, 1000, spare=0.25)
+        expected = numpy.zeros(100)
+        for i in range(20):
+            num = 7 + i % 5
+            series = store.advance(num)
+            series.start_time += num * 0.5
+            series.numpy()[-num:] = numpy.arange(num) + i
+            expected = numpy.roll(expected, -num)
+            expected[-num:] = numpy.arange(num) + i
+            self.assertTrue(numpy.array_equal(series.numpy(), expected))
+        self.assertEqual(len(store.series), 100)
+        self.assertEqual(float(store.series.start_time),
+                         1000 + 0.5 * sum(7 + i % 5 for i in range(20)))
+
+
 # We take a factory approach so we can test all possible dtypes we support
 TestClasses = []
 types = [numpy.float32, numpy.float64, numpy.complex64, numpy.complex128]
@@ -149,5 +168,7 @@ if __name__ == '__main__':
     suite = unittest.TestSuite()
     for klass in TestClasses:
         suite.addTest(unittest.TestLoader().loadTestsFromTestCase(klass))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+        SlidingTimeSeriesTest))
     results = unittest.TextTestRunner(verbosity=2).run(suite)
     simple_exit(results)
@@ -0,0 +1,113 @@
+"""Unit tests for saving and restoring the PyCBC Live background state"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events.coinc import LiveCoincTimeslideBackgroundEstimator
+
+parse_args_cpu_only("PyCBC Live background state")
+
+
+class TestLiveBackgroundState(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.tmpdir, 'state.hdf')
+        self.rng = np.random.default_rng(0)
+        self.start_time = 1000000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_estimator(self, **kwargs):
+        return LiveCoincTimeslideBackgroundEstimator(
+            10, 8, 'quadsum', 'snr', [], ['H1', 'L1'],
+            ifar_limit=100, timeslide_interval=0.1, **kwargs
+        )
+
+    def get_trigs(self, num=20):
+        trigs = {}
+        for ifo in ['H1', 'L1']:
+            trigs[ifo] = {
+                'snr': self.rng.uniform(4.5, 10, num).astype(np.float32),
+                'end_time': self.start_time + self.rng.uniform(0, 8, num),
+                'chisq': np.ones(num, dtype=np.float32),
+                'chisq_dof': np.full(num, 10, dtype=np.int32),
+                'coa_phase': np.zeros(num, dtype=np.float32),
+                'sigmasq': np.ones(num, dtype=np.float32),
+                'template_id': self.rng.integers(0, 10, num).astype(np.int32),
+                'mass1': np.full(num, 1.4, dtype=np.float32),
+                'mass2': np.full(num, 1.4, dtype=np.float32)
+            }
+        self.start_time += 8
+        return trigs
+
+    def assert_same_state(self, est1, est2):
+        np.testing.assert_equal(est1.coincs.data, est2.coincs.data)
+        self.assertEqual(est1.background_time, est2.background_time)
+        for ifo in est1.singles:
+            for i in range(est1.num_templates):
+                np.testing.assert_equal(est1.singles[ifo].data(i),
+                                        est2.singles[ifo].data(i))
+
+    def test_roundtrip(self):
+        est = self.make_estimator()
+        for _ in range(5):
+            est.add_singles(self.get_trigs())
+        self.assertGreater(est.coincs.index, 0)
+        est.save_state(self.state_file, gps_time=self.start_time)
+        self.assertEqual(os.listdir(self.tmpdir), ['state.hdf'])
+
+        restored = self.make_estimator()
+        self.assertTrue(restored.restore_state(self.state_file))
+        self.assert_same_state(est, restored)
+
+        # Both estimators keep evolving in the same way
+        for _ in range(3):
+            trigs = self.get_trigs()
+            res1 = est.add_singles({k: v.copy() for k, v in trigs.items()})
+            res2 = restored.add_singles({k: v.copy() for k, v in trigs.items()})
+            self.assertEqual(sorted(res1), sorted(res2))
+        self.assert_same_state(est, restored)
+
+    def test_too_old(self):
+        est = self.make_estimator()
+        est.add_singles(self.get_trigs())
+        est.save_state(self.state_file, gps_time=self.start_time)
+        restored = self.make_estimator()
+        self.assertFalse(restored.restore_state(
+            self.state_file, min_gps_time=self.start_time + 1
+        ))
+        self.assertEqual(restored.coincs.index, 0)
+
+    def test_incompatible(self):
+        est = self.make_estimator()
+        est.add_singles(self.get_trigs())
+        est.save_state(self.state_file)
+        with h5py.File(self.state_file, 'a') as f:
+            f.attrs['num_templates'] = 20
+        with self.assertRaises(ValueError):
+            self.make_estimator().restore_state(self.state_file)
+
+    def test_save_failure(self):
+        est = self.make_estimator()
+        est.add_singles(self.get_trigs())
+        # A missing directory, and a state which can't be replaced
+        missing = os.path.join(self.tmpdir, 'missing', 'state.hdf')
+        self.assertFalse(est.save_state(missing))
+        os.makedirs(os.path.join(self.state_file, 'taken'))
+        self.assertFalse(est.save_state(self.state_file))
+        self.assertEqual(os.listdir(self.tmpdir), ['state.hdf'])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestLiveBackgroundState
+))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
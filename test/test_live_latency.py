@@ -0,0 +1,84 @@
+"""Unit tests for the PyCBC Live latency monitoring"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.live import StageTimer, LiveLatencyLog
+
+parse_args_cpu_only("PyCBC Live latency monitoring")
+
+
+class TestLiveLatency(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_stage_timer(self):
+        timer = StageTimer()
+        with timer.stage('a'):
+            pass
+        timer.add('a', 1.)
+        timer.add('b', 2.)
+        times = timer.reset()
+        self.assertEqual(set(times), {'a', 'b'})
+        self.assertGreaterEqual(times['a'], 1.)
+        self.assertEqual(times['b'], 2.)
+        self.assertEqual(timer.reset(), {})
+
+    def make_log(self, ext):
+        log = LiveLatencyLog(
+            output_path=os.path.join(self.output_dir, 'latency' + ext),
+            prometheus_path=os.path.join(self.output_dir, 'latency.prom'),
+            max_strides=2
+        )
+        log.add_stride(100, [{'total': 1.}, {'data_read': 0.5}])
+        log.add_stride(108, [{'total': 2.}, None, {'chisq': 0.25}])
+        log.add_stride(116, [{'total': 3.}, {'data_read': 0.75}, None])
+        log.write()
+        return log
+
+    def test_arrays(self):
+        log = self.make_log('.json')
+        arrays = log.as_arrays()
+        np.testing.assert_equal(arrays['gps_time'], [108, 116])
+        self.assertEqual(arrays['data_read'].shape, (2, 3))
+        np.testing.assert_equal(arrays['total'][:, 0], [2., 3.])
+        np.testing.assert_equal(arrays['chisq'][:, 2], [0.25, np.nan])
+
+    def test_json(self):
+        log = self.make_log('.json')
+        with open(log.output_path) as f:
+            strides = json.load(f)['strides']
+        self.assertEqual(len(strides), 2)
+        self.assertEqual(strides[1]['ranks']['1']['data_read'], 0.75)
+
+    def test_hdf(self):
+        log = self.make_log('.hdf')
+        with h5py.File(log.output_path, 'r') as f:
+            np.testing.assert_equal(f['gps_time'][:], [108, 116])
+            np.testing.assert_equal(f['data_read'][:, 1], [np.nan, 0.75])
+
+    def test_prometheus(self):
+        log = self.make_log('.json')
+        with open(log.prometheus_path) as f:
+            text = f.read()
+        self.assertIn(
+            'pycbc_live_stage_seconds{rank="1",stage="data_read"} 0.750000',
+            text
+        )
+        self.assertIn('pycbc_live_stride_gps_time 116.000', text)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestLiveLatency))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -0,0 +1,48 @@
+"""Unit tests for the redistribution of templates in PyCBC Live"""
+
+import unittest
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.live import TemplateLoadBalancer
+
+parse_args_cpu_only("PyCBC Live template load balancing")
+
+
+class TestTemplateLoadBalancer(unittest.TestCase):
+    def setUp(self):
+        # Two processes with the same number of templates, but the first
+        # one has all the expensive templates
+        self.balancer = TemplateLoadBalancer(20, threshold=0.1, decay=0.5)
+        self.balancer.update(1, np.arange(10), np.full(10, 3.))
+        self.balancer.update(2, np.arange(10, 20), np.full(10, 1.))
+
+    def test_balanced(self):
+        balancer = TemplateLoadBalancer(4)
+        balancer.update(1, [0, 1], [1., 1.])
+        balancer.update(2, [2, 3], [1., 1.05])
+        self.assertLess(balancer.imbalance(), 0.1)
+        self.assertIsNone(balancer.rebalance())
+
+    def test_rebalance(self):
+        self.assertAlmostEqual(self.balancer.imbalance(), 0.5)
+        assignment = self.balancer.rebalance()
+        self.assertEqual(set(assignment), {1, 2})
+        # Every template is still assigned exactly once
+        all_ids = np.sort(np.concatenate(list(assignment.values())))
+        np.testing.assert_equal(all_ids, np.arange(20))
+        self.assertLess(self.balancer.imbalance(), 0.1)
+
+    def test_moving_average(self):
+        self.balancer.update(1, np.arange(10), np.full(10, 1.))
+        np.testing.assert_allclose(self.balancer.cost[:10], 2.)
+        self.assertAlmostEqual(self.balancer.imbalance(), 1 / 3)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestTemplateLoadBalancer
+))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
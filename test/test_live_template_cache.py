@@ -0,0 +1,87 @@
+"""Unit tests for the caching of generated templates in LiveFilterBank"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.opt import LimitedMemoryDict
+from pycbc.waveform import LiveFilterBank
+
+parse_args_cpu_only("LiveFilterBank template cache")
+
+
+class TestLimitedMemoryDict(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LimitedMemoryDict(memory_limit=2000)
+        cache['a'] = np.zeros(100)
+        cache['b'] = np.zeros(100)
+        self.assertEqual(cache.nbytes, 1600)
+        # Using 'a' makes 'b' the least recently used entry
+        cache['a']
+        cache['c'] = np.zeros(100)
+        self.assertEqual(list(cache), ['a', 'c'])
+        self.assertEqual(cache.nbytes, 1600)
+        del cache['a']
+        self.assertEqual(cache.nbytes, 800)
+
+
+class TestLiveFilterBankCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bank_file = os.path.join(self.tmpdir, 'bank.hdf')
+        with h5py.File(self.bank_file, 'w') as bankf:
+            bankf.attrs['parameters'] = ['mass1', 'mass2', 'spin1z', 'spin2z']
+            bankf['mass1'] = np.array([10., 20., 30.])
+            bankf['mass2'] = np.array([10., 15., 25.])
+            bankf['spin1z'] = np.zeros(3)
+            bankf['spin2z'] = np.zeros(3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_bank(self, cache_size):
+        return LiveFilterBank(self.bank_file, 2048, 8,
+                              low_frequency_cutoff=20.,
+                              approximant='SPAtmplt',
+                              cache_size=cache_size)
+
+    def test_no_cache(self):
+        bank = self.make_bank(None)
+        self.assertIsNone(bank.template_cache)
+        self.assertIsNot(bank[0], bank[0])
+
+    def test_cache(self):
+        bank = self.make_bank(2 ** 30)
+        htilde = bank[1]
+        self.assertIs(bank[1], htilde)
+        # Templates are cached by id, so reordering the bank does not matter
+        sub = bank[::-1]
+        self.assertIs(sub[1], htilde)
+        self.assertEqual(len(bank.template_cache), 1)
+        # A different frequency resolution is a different entry
+        other = bank.get_template(1, delta_f=htilde.delta_f / 2)
+        self.assertIsNot(other, htilde)
+        self.assertEqual(len(other), 2 * len(htilde) - 1)
+        self.assertEqual(len(bank.template_cache), 2)
+
+    def test_memory_limit(self):
+        bank = self.make_bank(1)
+        bank[0]
+        bank[1]
+        self.assertEqual(len(bank.template_cache), 1)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestLimitedMemoryDict
+))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestLiveFilterBankCache
+))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
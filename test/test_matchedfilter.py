@@ -236,8 +236,91 @@ class TestMatchedFilter(unittest.TestCase):
             self.assertRaises(ValueError,match,self.filt,self.filt[0:len(self.filt)-1])
 
 
+@unittest.skipIf(_scheme != 'cpu', "Batched correlation is only on the CPU")
+class TestBatchMatchedFilterControl(unittest.TestCase):
+    def setUp(self):
+        self.context = _context
+        rng = numpy.random.default_rng(2)
+        self.tlen = 4096
+        flen = self.tlen // 2 + 1
+        self.delta_f = 0.25
+        self.templates = []
+        for _ in range(3):
+            htilde = zeros(self.tlen, dtype=complex64)
+            htilde[:flen] = Array(rng.normal(size=flen)
+                                  + 1j * rng.normal(size=flen),
+                                  dtype=complex64)
+            self.templates.append(htilde)
+        self.norms = [float(4 * self.delta_f * (abs(h) ** 2).sum())
+                      for h in self.templates]
+
+        # Segments with signals at a few times, analysing different ranges
+        self.segments = []
+        for analyze in [slice(512, 3584), slice(1024, 3584)]:
+            stilde = (rng.normal(size=flen)
+                      + 1j * rng.normal(size=flen)) * 40
+            freqs = numpy.arange(flen) / float(self.tlen)
+            for htilde, tc in zip(self.templates, [700, 1500, 3000]):
+                stilde += htilde[:flen].numpy() \
+                    * numpy.exp(-2j * numpy.pi * freqs * tc)
+            stilde = FrequencySeries(stilde, delta_f=self.delta_f,
+                                     dtype=complex64)
+            stilde.analyze = analyze
+            self.segments.append(stilde)
+
+    def test_matches_single_template(self):
+        from pycbc.filter import (MatchedFilterControl,
+                                  BatchMatchedFilterControl)
+        for use_cluster, cluster_function in [(True, 'symmetric'),
+                                              (True, 'findchirp'),
+                                              (False, 'symmetric')]:
+            with self.context:
+                template_mem = zeros(self.tlen, dtype=complex64)
+                single = MatchedFilterControl(
+                    20, None, 4., self.tlen, self.delta_f, complex64,
+                    self.segments, template_mem, use_cluster,
+                    cluster_function=cluster_function)
+                batch = BatchMatchedFilterControl(
+                    20, None, 4., self.tlen, self.delta_f, complex64,
+                    self.segments, 4, use_cluster,
+                    cluster_function=cluster_function)
+                for i, htilde in enumerate(self.templates):
+                    batch.templates[i][:] = htilde
+
+                for snum in range(len(self.segments)):
+                    # The second template is not filtered on the second
+                    # segment
+                    norms = list(self.norms)
+                    if snum == 1:
+                        norms[1] = None
+                    results = batch.matched_filter_and_cluster(
+                        snum, norms, 16, epoch=10)
+                    self.assertEqual(len(results), len(self.templates))
+                    for htilde, norm, res in zip(self.templates, norms,
+                                                 results):
+                        if norm is None:
+                            self.assertEqual(len(res[3]), 0)
+                            continue
+                        template_mem[:] = htilde
+                        expected = single.matched_filter_and_cluster(
+                            snum, norm, 16, epoch=10)
+                        self.assertTrue(len(expected[3]) > 0)
+                        self.assertAlmostEqual(res[1], expected[1])
+                        numpy.testing.assert_equal(res[3], expected[3])
+                        numpy.testing.assert_allclose(res[4], expected[4],
+                                                      rtol=1e-4)
+                        numpy.testing.assert_allclose(
+                            res[0].numpy(), expected[0].numpy(), rtol=1e-4,
+                            atol=1e-3)
+                        numpy.testing.assert_allclose(
+                            res[2].numpy(), expected[2].numpy(), rtol=1e-6)
+                        self.assertEqual(res[0].start_time, 10)
+
+
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestMatchedFilter))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestBatchMatchedFilterControl))
 
 if __name__ == '__main__':
     results = unittest.TextTestRunner(verbosity=2).run(suite)
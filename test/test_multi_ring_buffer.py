@@ -0,0 +1,86 @@
+"""Unit tests for the MultiRingBuffer used by the PyCBC Live coincidence"""
+
+import unittest
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events.coinc import MultiRingBuffer
+
+parse_args_cpu_only("MultiRingBuffer")
+
+
+class TestMultiRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.dtype = [('end_time', np.float64), ('stat', np.float32)]
+
+    def values(self, times):
+        vals = np.zeros(len(times), dtype=self.dtype)
+        vals['end_time'] = times
+        return vals
+
+    def test_add_expire(self):
+        buf = MultiRingBuffer(3, 2, self.dtype, min_buffer_size=1,
+                              buffer_increment=1)
+        buf.add([0, 2, 0], self.values([1., 2., 3.]))
+        buf.add([1], self.values([4.]))
+        np.testing.assert_equal(buf.data(0)['end_time'], [1., 3.])
+        np.testing.assert_equal(buf.expire_vector(0), [0, 0])
+        np.testing.assert_equal(buf.data(1)['end_time'], [4.])
+        self.assertEqual(buf.num_elements(), 4)
+        # The elements of the first update are now too old
+        buf.add([0], self.values([5.]))
+        np.testing.assert_equal(buf.data(0)['end_time'], [5.])
+        self.assertEqual(len(buf.data(2)), 0)
+        self.assertEqual(buf.num_elements(), 2)
+        self.assertEqual(buf.filled_time, 2)
+
+    def test_discard_last(self):
+        buf = MultiRingBuffer(2, 10, self.dtype)
+        buf.add([0, 1], self.values([1., 2.]))
+        buf.add([0, 0, 1], self.values([3., 4., 5.]))
+        buf.discard_last([0, 1])
+        np.testing.assert_equal(buf.data(0)['end_time'], [1., 3.])
+        np.testing.assert_equal(buf.data(1)['end_time'], [2.])
+
+    def test_random(self):
+        # Compare against a simple list-based implementation
+        rng = np.random.default_rng(0)
+        num_rings, max_time = 20, 5
+        buf = MultiRingBuffer(num_rings, max_time, self.dtype,
+                              min_buffer_size=1, buffer_increment=1)
+        rings = [[] for _ in range(num_rings)]
+        for time in range(100):
+            num = rng.integers(0, 3 * num_rings)
+            indices = rng.integers(0, num_rings, num)
+            times = rng.random(num)
+            buf.add(indices, self.values(times))
+            for i, t in zip(indices, times):
+                rings[i].append((time, t))
+            for i in range(num_rings):
+                rings[i] = [e for e in rings[i] if e[0] >= time + 1 - max_time]
+                np.testing.assert_equal(buf.data(i)['end_time'],
+                                        [e[1] for e in rings[i]])
+                np.testing.assert_equal(buf.expire_vector(i),
+                                        [e[0] for e in rings[i]])
+
+    def test_memory_release(self):
+        buf = MultiRingBuffer(2, 2, self.dtype)
+        initial_size = len(buf.buffer)
+        buf.add(np.zeros(100, dtype=int), self.values(np.zeros(100)))
+        grown_size = len(buf.buffer)
+        self.assertGreater(grown_size, initial_size)
+        # Once the elements have expired, the storage is shrunk when it
+        # needs to be reorganized
+        buf.add([], self.values([]))
+        buf.add([], self.values([]))
+        num = grown_size - buf.end + 1
+        buf.add(np.ones(num, dtype=int), self.values(np.ones(num)))
+        self.assertLess(len(buf.buffer), grown_size)
+        self.assertEqual(len(buf.data(1)), num)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestMultiRingBuffer))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
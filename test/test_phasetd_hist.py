@@ -0,0 +1,102 @@
+"""Unit tests for the compiled PhaseTD signal histogram"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events import stat
+
+parse_args_cpu_only("PhaseTD signal histogram")
+
+
+class TestPhaseTDHist(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        stat._signal_hists.clear()
+
+    def make_hist(self, ifos):
+        filename = os.path.join(self.tmpdir, ''.join(ifos) + '.hdf')
+        ncol = 3 * (len(ifos) - 1)
+        with h5py.File(filename, 'w') as f:
+            for ifo in ifos:
+                bins = np.unique(self.rng.integers(-4, 5, (2000, ncol)),
+                                 axis=0)
+                param_bin = np.zeros(len(bins), dtype=[
+                    ('c%s' % i, np.int32) for i in range(ncol)
+                ])
+                for i in range(ncol):
+                    param_bin['c%s' % i] = bins[:, i]
+                f[ifo + '/param_bin'] = np.sort(param_bin)
+                f[ifo + '/weights'] = self.rng.uniform(1, 10, len(bins))
+            f.attrs['sensitivity_ratios'] = np.linspace(1, 1.5, len(ifos))
+            f.attrs['srbmin'] = -5
+            f.attrs['srbmax'] = 5
+            f.attrs['twidth'] = 0.002
+            f.attrs['pwidth'] = 0.5
+            f.attrs['swidth'] = 0.2
+            f.attrs['ifos'] = ifos
+            f.attrs['stat'] = 'phasetd_newsnr_%s' % ''.join(ifos)
+        return filename
+
+    def logsignalrate(self, filename, ifos, **kwargs):
+        ptd = stat.PhaseTDStatistic('snr', files=[filename], ifos=ifos,
+                                    phasetd=True, **kwargs)
+        rng = np.random.default_rng(1)
+        num = 1000
+        stats = {ifo: {'snr': rng.uniform(4, 10, num).astype(np.float32),
+                       'coa_phase': rng.uniform(0, 2 * np.pi, num),
+                       'end_time': 1e9 + rng.uniform(-0.01, 0.01, num),
+                       'sigmasq': rng.uniform(1, 2, num)}
+                 for ifo in ifos}
+        shift = rng.integers(-2, 3, num) * 0.001
+        return ptd.logsignalrate(stats, shift, list(range(len(ifos))))
+
+    def test_pack_bins(self):
+        bins = [self.rng.integers(-3, 4, 500) for _ in range(3)]
+        bin_min = np.array([-3, -3, -3])
+        bin_range = np.array([7, 7, 7])
+        keys = stat.pack_hist_bins(bins, bin_min, bin_range)
+        # Keys sort in the same order as the tuples of bins
+        np.testing.assert_equal(np.argsort(keys, kind='stable'),
+                                np.lexsort(bins[::-1]))
+
+    def test_cache(self):
+        for ifos in [['H1', 'L1'], ['H1', 'L1', 'V1']]:
+            filename = self.make_hist(ifos)
+            rate = self.logsignalrate(filename, ifos)
+            stat._signal_hists.clear()
+            # The first use compiles the histogram, the second maps it
+            for _ in range(2):
+                cached = self.logsignalrate(filename, ifos,
+                                            phasetd_cache_dir=self.cache_dir)
+                np.testing.assert_equal(rate, cached)
+                stat._signal_hists.clear()
+            self.assertEqual(np.isfinite(rate).sum(), len(rate))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_replaced_file(self):
+        ifos = ['H1', 'L1']
+        filename = self.make_hist(ifos)
+        first = self.logsignalrate(filename, ifos)
+        self.assertEqual(len(stat._signal_hists), 1)
+        # Only the histogram of the new file contents is kept
+        self.make_hist(ifos)
+        second = self.logsignalrate(filename, ifos)
+        self.assertEqual(len(stat._signal_hists), 1)
+        self.assertFalse(np.array_equal(first, second))
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestPhaseTDHist))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -0,0 +1,68 @@
+"""Unit tests for the memory shared with worker processes"""
+
+import unittest
+import numpy
+from utils import parse_args_cpu_only, simple_exit
+import pycbc
+from pycbc.pool import BroadcastPool, move_to_shared_memory, shared_zeros
+from pycbc.types import FrequencySeries, zeros
+
+parse_args_cpu_only("Pool")
+
+_shared = None
+
+
+def _set_value(i):
+    _shared[i] = i + 1
+    return i
+
+
+class TestSharedMemory(unittest.TestCase):
+    def test_written_by_workers(self):
+        global _shared
+        _shared = shared_zeros(8, numpy.float64)
+        pool = BroadcastPool(2)
+        try:
+            self.assertEqual(pool.map(_set_value, range(8)), list(range(8)))
+        finally:
+            pool.close_pool()
+        numpy.testing.assert_equal(_shared, numpy.arange(1, 9))
+
+    def test_move_arrays(self):
+        rng = numpy.random.default_rng(0)
+        psd = FrequencySeries(rng.uniform(1, 2, 33), delta_f=0.5,
+                              dtype=numpy.float32)
+        segs = []
+        for _ in range(3):
+            seg = FrequencySeries(rng.normal(size=33) + 1j, delta_f=0.5,
+                                  epoch=10, dtype=numpy.complex64)
+            seg.psd = psd
+            segs.append(seg)
+        odd = zeros(7, dtype=numpy.float32)
+        expected = [s.numpy().copy() for s in segs]
+
+        block = move_to_shared_memory(segs + [s.psd for s in segs] + [odd])
+        # The psd is only moved once, and each array is padded to keep the
+        # next aligned
+        self.assertEqual(len(block), 3 * 288 + 160 + 32)
+        for seg, exp in zip(segs, expected):
+            numpy.testing.assert_equal(seg.numpy(), exp)
+            self.assertEqual(seg.delta_f, 0.5)
+            self.assertEqual(seg.start_time, 10)
+            self.assertEqual(seg.ptr % pycbc.PYCBC_ALIGNMENT, 0)
+            self.assertTrue(numpy.shares_memory(seg.data, block))
+        self.assertTrue(numpy.shares_memory(psd.data, block))
+
+        # Operations in place keep using the shared memory
+        segs[0] /= psd
+        numpy.testing.assert_allclose(segs[0].numpy(),
+                                      expected[0] / psd.numpy(), rtol=1e-6)
+        self.assertTrue(numpy.shares_memory(segs[0].data, block))
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSharedMemory))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
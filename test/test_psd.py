@@ -106,6 +106,25 @@ class TestPSD(unittest.TestCase):
                         msg='seg_len=%d seg_stride=%d method=%s -> rms=%.3f' % \
                         (seg_len, seg_stride, method, err_rms))
 
+    def test_sliding_welch(self):
+        """Test that the sliding Welch estimate matches Welch's method"""
+        seg_len = 4096
+        seg_stride = seg_len // 2
+        data_len = 16 * seg_stride + seg_len
+        for method in ('mean', 'median', 'median-mean'):
+            estimator = pycbc.psd.SlidingWelch(seg_len, seg_stride,
+                                               avg_method=method)
+            with self.context:
+                for start in range(0, 4 * seg_stride, seg_stride):
+                    data = self.noise[start:start + data_len]
+                    psd = estimator.estimate(data, start)
+                    ref = pycbc.psd.welch(data, seg_len=seg_len,
+                                          seg_stride=seg_stride,
+                                          avg_method=method)
+                    self.assertTrue(numpy.allclose(psd.numpy(), ref.numpy()))
+            # only the segments with new data were computed again
+            self.assertEqual(estimator.recomputed, 17 + 3)
+
     def test_truncation(self):
         """Test inverse PSD truncation"""
         for seg_len in (2048, 4096, 8192):
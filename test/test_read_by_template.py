@@ -0,0 +1,74 @@
+"""Unit tests for reading merged single-detector triggers by template"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.io.hdf import ReadByTemplate, ChunkedReadByTemplate
+
+parse_args_cpu_only("ReadByTemplate")
+
+
+class TestReadByTemplate(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bank_file = os.path.join(self.tmpdir, 'bank.hdf')
+        self.trig_file = os.path.join(self.tmpdir, 'H1-merged.hdf')
+        rng = np.random.default_rng(1)
+
+        num_templates = 50
+        hashes = rng.permutation(num_templates * 10)[:num_templates]
+        with h5py.File(self.bank_file, 'w') as f:
+            f.attrs['parameters'] = ['mass1']
+            f['mass1'] = rng.uniform(1, 10, num_templates)
+            f['template_hash'] = hashes
+
+        # Write the triggers ordered by template hash, in the same way as
+        # pycbc_coinc_mergetrigs, leaving a few templates without triggers
+        tids = rng.integers(0, num_templates - 5, 2000)
+        tids = tids[np.argsort(hashes[tids], kind='stable')]
+        hash_order = hashes.argsort()
+        bounds = np.searchsorted(hashes[tids], hashes[hash_order])
+        bounds = np.append(bounds, len(tids))
+        with h5py.File(self.trig_file, 'w') as f:
+            f['H1/search/start_time'] = np.array([0.])
+            f['H1/search/end_time'] = np.array([500.])
+            f['H1/template_id'] = tids
+            f['H1/template_boundaries'] = bounds[hash_order.argsort()]
+            for col in ['end_time', 'snr']:
+                dset = f.create_dataset('H1/' + col,
+                                        data=rng.uniform(0, 1000, len(tids)))
+                refs = [dset.regionref[bounds[i]:bounds[i + 1]]
+                        for i in hash_order.argsort()]
+                f.create_dataset('H1/%s_template' % col, data=refs,
+                                 dtype=h5py.special_dtype(
+                                     ref=h5py.RegionReference))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_chunked(self):
+        reader = ReadByTemplate(self.trig_file, self.bank_file)
+        chunked = ChunkedReadByTemplate(self.trig_file, self.bank_file,
+                                        chunk_size=100)
+        template_ids = np.arange(50)
+        # Both file order and an arbitrary order give the same triggers
+        for order in [chunked.file_order(template_ids), template_ids[::-1]]:
+            for tid in template_ids[order]:
+                np.testing.assert_equal(reader.set_template(tid),
+                                        chunked.set_template(tid))
+                for col in ['end_time', 'snr']:
+                    np.testing.assert_equal(reader[col], chunked[col])
+                self.assertEqual(reader.param, chunked.param)
+        self.assertEqual(chunked.columns, {'end_time', 'snr'})
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestReadByTemplate))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
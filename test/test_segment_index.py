@@ -0,0 +1,120 @@
+"""Unit tests for the segment index used to look up veto and DQ times"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import lal
+import numpy as np
+from ligo.lw import ligolw
+from ligo.lw import utils as ligolw_utils
+from ligo.lw.utils import segments as ligolw_segments
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events import veto
+from pycbc.events.veto import SegmentIndex
+from pycbc.io.ligolw import create_process_table
+
+parse_args_cpu_only("Segment index")
+
+
+class TestSegmentIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        # Overlapping and touching segments, including some of zero length
+        self.start = np.round(rng.uniform(0, 1000, 200), 1)
+        self.end = self.start + np.round(rng.exponential(2, 200), 1)
+        self.times = np.concatenate([rng.uniform(-10, 1010, 5000),
+                                     self.start, self.end])
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_contains(self):
+        index = SegmentIndex(self.start, self.end)
+        expected = veto.indices_within_times(self.times, self.start, self.end)
+        np.testing.assert_equal(index.indices_within(self.times),
+                                np.sort(expected))
+        np.testing.assert_equal(index.indices_outside(self.times),
+                                veto.indices_outside_times(self.times,
+                                                           self.start,
+                                                           self.end))
+        self.assertEqual(index.segments(),
+                         veto.start_end_to_segments(self.start,
+                                                    self.end).coalesce())
+        self.assertEqual(len(index), len(index.segments()))
+        empty = SegmentIndex([], [])
+        self.assertFalse(empty.contains(self.times).any())
+        np.testing.assert_equal(empty.state_at(self.times, default=3), 3)
+
+    def test_state_at(self):
+        state = np.arange(200) % 3 + 1
+        index = SegmentIndex(self.start, self.end, state)
+        # Later states take precedence, as when setting them in turn
+        expected = np.zeros(len(self.times), dtype=int)
+        for st in [1, 2, 3]:
+            sel = state == st
+            idx = veto.indices_within_times(self.times, self.start[sel],
+                                            self.end[sel])
+            expected[idx] = st
+        np.testing.assert_equal(index.state_at(self.times), expected)
+        for st in [1, 2, 3]:
+            self.assertEqual(index.segments(st),
+                             veto.start_end_to_segments(
+                                 index.start[index.state == st],
+                                 index.end[index.state == st]))
+
+        fname = os.path.join(self.tmpdir, 'index.npy')
+        index.save(fname)
+        for mmap in [False, True]:
+            loaded = SegmentIndex.load(fname, mmap=mmap)
+            np.testing.assert_equal(loaded.state_at(self.times), expected)
+
+    def write_segment_file(self, fname, segs_by_name):
+        outdoc = ligolw.Document()
+        outdoc.appendChild(ligolw.LIGO_LW())
+        process = create_process_table(outdoc)
+        for (ifo, name), segs in segs_by_name.items():
+            segs = [(lal.LIGOTimeGPS(s), lal.LIGOTimeGPS(e)) for s, e in segs]
+            with ligolw_segments.LigolwSegments(outdoc, process) as x:
+                x.add(ligolw_segments.LigolwSegmentList(
+                    active=segs, instruments=set([ifo]), name=name,
+                    version=1))
+        ligolw_utils.write_filename(outdoc, fname)
+
+    def test_segment_file(self):
+        fname = os.path.join(self.tmpdir, 'veto.xml')
+        segs = list(zip(self.start, self.end))
+        self.write_segment_file(fname, {('H1', 'VETO'): segs[:100],
+                                        ('L1', 'VETO'): segs[100:150],
+                                        ('H1', 'OTHER'): segs[150:]})
+        # Times are read back as seconds plus nanoseconds
+        def gps(times):
+            gps_times = [lal.LIGOTimeGPS(t) for t in times]
+            return np.array([t.gpsSeconds + 1e-9 * t.gpsNanoSeconds
+                             for t in gps_times])
+        expected = veto.start_end_to_segments(gps(self.start[:100]),
+                                              gps(self.end[:100])).coalesce()
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        for env in [{}, {'PYCBC_SEGMENT_INDEX_CACHE': cache_dir}]:
+            with mock.patch.dict(os.environ, env):
+                # The second time round the index is loaded from the cache
+                for _ in range(2):
+                    veto._segment_index_cache.clear()
+                    idx, vsegs = veto.indices_within_segments(
+                        self.times, [fname], ifo='H1', segment_name='VETO')
+                    self.assertEqual(vsegs, expected)
+                    within = np.array([t in expected for t in self.times])
+                    np.testing.assert_equal(idx, np.flatnonzero(within))
+                    self.assertEqual(veto.select_segments_by_definer(
+                        fname, 'VETO', 'H1'), expected)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSegmentIndex))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -214,11 +214,59 @@ for method in significance._significance_meth_dict:
                 'test_%s_%s' % (method, function),
                 meth_test)
 
+class BackgroundDistributionTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.bg_stat = rng.normal(loc=5, scale=2, size=500)
+        self.fg_stat = rng.normal(loc=5, scale=2, size=50)
+        self.dec_facs = rng.choice([1., 10., 100.], size=500)
+
+    def assert_same_counts(self, dist, bg_stat, dec_facs):
+        # Brute force count of louder background events
+        fg_n_louder = [dec_facs[bg_stat > fs].sum() for fs in self.fg_stat]
+        bg_n_louder = [dec_facs[bg_stat > bs].sum() for bs in bg_stat]
+        np.testing.assert_allclose(dist.count_louder(self.fg_stat),
+                                   fg_n_louder)
+        np.testing.assert_allclose(dist.background_count_louder(),
+                                   bg_n_louder)
+
+    def test_counts(self):
+        dist = significance.BackgroundDistribution(self.bg_stat,
+                                                   self.dec_facs)
+        self.assert_same_counts(dist, self.bg_stat, self.dec_facs)
+        bg_n_louder, fg_n_louder, _ = significance.count_n_louder(
+            self.bg_stat, self.fg_stat, self.dec_facs, background=dist)
+        np.testing.assert_equal(bg_n_louder, dist.background_count_louder())
+        np.testing.assert_equal(fg_n_louder,
+                                dist.count_louder(self.fg_stat))
+
+    def test_remove_select(self):
+        dist = significance.BackgroundDistribution(self.bg_stat,
+                                                   self.dec_facs)
+        rm_idx = [3, 7, 7, 100, 499]
+        dist.remove(rm_idx)
+        bg_stat = np.delete(self.bg_stat, rm_idx)
+        dec_facs = np.delete(self.dec_facs, rm_idx)
+        self.assert_same_counts(dist, bg_stat, dec_facs)
+
+        idx = np.random.default_rng(1).permutation(len(bg_stat))[:300]
+        dist.select(idx)
+        self.assert_same_counts(dist, bg_stat[idx], dec_facs[idx])
+
+    def test_merge(self):
+        dists = [significance.BackgroundDistribution(self.bg_stat[sl],
+                                                     self.dec_facs[sl])
+                 for sl in [slice(0, 100), slice(100, 350), slice(350, 500)]]
+        dist = significance.BackgroundDistribution.merge(dists)
+        self.assert_same_counts(dist, self.bg_stat, self.dec_facs)
+
+
 # create and populate unittest's test suite
 suite = unittest.TestSuite()
 test_loader = unittest.TestLoader()
 suite.addTest(test_loader.loadTestsFromTestCase(SignificanceMethodTest))
 suite.addTest(test_loader.loadTestsFromTestCase(SignificanceParserTest))
+suite.addTest(test_loader.loadTestsFromTestCase(BackgroundDistributionTest))
 
 if __name__ == '__main__':
     results = unittest.TextTestRunner(verbosity=2).run(suite)
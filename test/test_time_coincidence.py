@@ -0,0 +1,56 @@
+"""Unit tests for the time coincidence of single-detector triggers"""
+
+import unittest
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events.coinc import (time_sort_order, time_coincidence,
+                                time_multi_coincidence)
+
+parse_args_cpu_only("Time coincidence")
+
+
+class TestTimeCoincidence(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.times = {ifo: np.sort(rng.uniform(0, 100, 500))
+                      for ifo in ['H1', 'L1', 'V1']}
+        self.shuffle = {ifo: rng.permutation(500) for ifo in self.times}
+
+    def test_sort_order(self):
+        times = self.times['H1']
+        np.testing.assert_equal(time_sort_order(times), np.arange(500))
+        shuffled = times[self.shuffle['H1']]
+        np.testing.assert_equal(shuffled[time_sort_order(shuffled)], times)
+
+    def coinc_set(self, times, order):
+        ids, slide = time_multi_coincidence(times, slide_step=0.2, slop=0.01,
+                                            pivot='H1', fixed='L1')
+        # Map back to the indices of the time-sorted triggers
+        return sorted(zip(slide, *[order[ifo][ids[ifo]]
+                                   for ifo in ['H1', 'L1', 'V1']]))
+
+    def test_sorted_input(self):
+        identity = {ifo: np.arange(500) for ifo in self.times}
+        shuffled = {ifo: self.times[ifo][self.shuffle[ifo]]
+                    for ifo in self.times}
+        coincs = self.coinc_set(self.times, identity)
+        self.assertGreater(len(coincs), 0)
+        self.assertEqual(coincs, self.coinc_set(shuffled, self.shuffle))
+
+    def test_threads(self):
+        t1, t2 = self.times['H1'], self.times['L1'][self.shuffle['L1']]
+        for slide_step in [0, 0.2]:
+            serial = time_coincidence(t1, t2, 0.01, slide_step=slide_step)
+            threaded = time_coincidence(t1, t2, 0.01, slide_step=slide_step,
+                                        nthreads=4)
+            self.assertGreater(len(serial[0]), 0)
+            for a, b in zip(serial, threaded):
+                np.testing.assert_equal(a, b)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestTimeCoincidence))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
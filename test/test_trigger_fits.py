@@ -0,0 +1,56 @@
+"""Unit tests for fitting single trigger statistic distributions"""
+
+import unittest
+import numpy as np
+from utils import parse_args_cpu_only, simple_exit
+from pycbc.events.trigger_fits import (fit_above_thresh,
+                                       fit_above_thresh_by_group)
+
+parse_args_cpu_only("Trigger fits")
+
+
+class TestFitByGroup(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        num = 5000
+        self.vals = rng.exponential(1., num) + 5.5
+        self.groups = rng.integers(0, 50, num)
+        # Leave one group empty, and one with nothing above threshold
+        self.groups[self.groups == 3] = 4
+        self.vals[self.groups == 7] = 5.7
+        self.weights = rng.uniform(0.5, 2., num)
+
+    def test_matches_fit_above_thresh(self):
+        for distr in ['exponential', 'rayleigh', 'power']:
+            for weights in [None, self.weights]:
+                alpha, sigma, count = fit_above_thresh_by_group(
+                    distr, self.vals, self.groups, 6., num_groups=52,
+                    weights=weights)
+                self.assertEqual(len(alpha), 52)
+                for group in range(52):
+                    sel = self.groups == group
+                    above = sel & (self.vals >= 6.)
+                    self.assertEqual(count[group], np.count_nonzero(above))
+                    if not above.any():
+                        self.assertEqual((alpha[group], sigma[group]),
+                                         (-1., -1.))
+                        continue
+                    expected = fit_above_thresh(
+                        distr, self.vals[sel], 6.,
+                        weights=None if weights is None else weights[sel])
+                    np.testing.assert_allclose((alpha[group], sigma[group]),
+                                               expected, rtol=1e-12)
+
+    def test_num_groups(self):
+        alpha, _, count = fit_above_thresh_by_group(
+            'exponential', self.vals, self.groups, 6.)
+        self.assertEqual(len(alpha), self.groups.max() + 1)
+        self.assertEqual(count.sum(), np.count_nonzero(self.vals >= 6.))
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestFitByGroup))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+"""Benchmark the per-stride cost of the PyCBC Live analysis.
+
+This drives `StrainBuffer`, `LiveFilterBank`, `LiveBatchMatchedFilter` and
+`LiveCoincTimeslideBackgroundEstimator` the same way `pycbc_live` does, but in
+a single process and on synthetic Gaussian noise frames together with a small
+generated template bank. For every stride the wall time of each stage, the
+peak resident memory and the matched-filter throughput are recorded and
+written out as JSON.
+
+A previous JSON output can be given with `--reference-file`; the program then
+exits with a non-zero status if the median cost of any stage grew by more than
+`--max-slowdown`, so it can be used to catch latency regressions before
+deploying a new release.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy
+
+import pycbc
+import pycbc.frame
+import pycbc.noise
+import pycbc.waveform
+from pycbc import version, scheme, fft
+from pycbc.filter import LiveBatchMatchedFilter
+from pycbc.strain import StrainBuffer
+from pycbc.vetoes.sgchisq import SingleDetSGChisq
+from pycbc.events.coinc import LiveCoincTimeslideBackgroundEstimator as Coincer
+
+
+STAGES = ['data_read', 'psd_recalculation', 'matched_filter', 'coincidence']
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+
+def make_bank(path, num_templates, min_mass, max_mass, seed):
+    """Write a random aligned-spin template bank to an HDF file."""
+    rng = numpy.random.default_rng(seed)
+    mass1 = rng.uniform(min_mass, max_mass, size=num_templates)
+    mass2 = rng.uniform(min_mass, max_mass, size=num_templates)
+    mass1, mass2 = numpy.maximum(mass1, mass2), numpy.minimum(mass1, mass2)
+    params = {
+        'mass1': mass1,
+        'mass2': mass2,
+        'spin1z': rng.uniform(-0.5, 0.5, size=num_templates),
+        'spin2z': rng.uniform(-0.5, 0.5, size=num_templates),
+    }
+    with h5py.File(path, 'w') as bankf:
+        bankf.attrs['parameters'] = list(params.keys())
+        for key, value in params.items():
+            bankf[key] = value
+
+
+def make_frames(directory, ifo, channel, start, duration, frame_length,
+                sample_rate, psd_model, seed):
+    """Write colored Gaussian noise to a set of frame files and return the
+    list of file names.
+    """
+    prefix = f'{ifo[0]}-{ifo}_LIVE_PERF'
+    fnames = []
+    nframes = int(numpy.ceil(duration / frame_length))
+    for i in range(nframes):
+        fstart = start + i * frame_length
+        noise = pycbc.noise.noise_from_string(
+            psd_model,
+            frame_length * sample_rate,
+            1.0 / sample_rate,
+            seed=seed + i,
+            low_frequency_cutoff=10.0
+        )
+        noise.start_time = fstart
+        fname = os.path.join(
+            directory, f'{prefix}-{fstart}-{frame_length}.gwf'
+        )
+        pycbc.frame.write_frame(fname, channel, noise)
+        fnames.append(fname)
+    # Each location is given separately, as the buffer only keeps the most
+    # recent file matching each location
+    return fnames
+
+
+def summarize(strides):
+    """Compute the median and maximum cost of each stage over the analyzed
+    strides.
+    """
+    analyzed = [s for s in strides if s['analyzed']]
+    summary = {}
+    for stage in STAGES + ['total']:
+        values = numpy.array([s['stage_time'][stage] for s in analyzed])
+        if len(values) == 0:
+            continue
+        summary[stage] = {
+            'median': float(numpy.median(values)),
+            'max': float(values.max()),
+        }
+    throughput = [s['templates_per_second'] for s in analyzed
+                  if s['templates_per_second'] is not None]
+    if throughput:
+        summary['templates_per_second'] = float(numpy.median(throughput))
+    summary['peak_rss'] = max(s['peak_rss'] for s in strides)
+    return summary
+
+
+def compare(summary, reference, max_slowdown, min_time):
+    """Compare a benchmark summary against a reference one. Return a list of
+    messages describing the stages that got slower than allowed.
+    """
+    regressions = []
+    for stage in STAGES + ['total']:
+        if stage not in summary or stage not in reference:
+            continue
+        new = summary[stage]['median']
+        old = reference[stage]['median']
+        if new < min_time:
+            continue
+        if new > old * (1 + max_slowdown):
+            regressions.append(
+                f'{stage}: median {new:.4f} s vs reference {old:.4f} s'
+            )
+    return regressions
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--verbose', action='count')
+parser.add_argument('--version', action='version',
+                    version=version.git_verbose_msg)
+parser.add_argument('--output-file', required=True,
+                    help='JSON file to write the benchmark results to')
+parser.add_argument('--reference-file',
+                    help='JSON output of a previous run to compare against')
+parser.add_argument('--max-slowdown', type=float, default=0.2,
+                    help='Allowed fractional increase of the median cost of '
+                         'each stage with respect to the reference run')
+parser.add_argument('--min-stage-time', type=float, default=1e-3,
+                    help='Ignore stages cheaper than this many seconds when '
+                         'comparing against the reference run')
+parser.add_argument('--ifos', nargs='+', default=['H1', 'L1'])
+parser.add_argument('--bank-file',
+                    help='Use this template bank instead of a random one')
+parser.add_argument('--approximant', default='SPAtmplt')
+parser.add_argument('--num-templates', type=int, default=64)
+parser.add_argument('--min-mass', type=float, default=5.0)
+parser.add_argument('--max-mass', type=float, default=30.0)
+parser.add_argument('--psd-model', default='aLIGOZeroDetHighPower')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--num-strides', type=int, default=8,
+                    help='Number of strides to time after the buffers are '
+                         'filled')
+parser.add_argument('--start-time', type=int, default=1000000000)
+parser.add_argument('--raw-sample-rate', type=int, default=4096)
+parser.add_argument('--sample-rate', type=int, default=2048)
+parser.add_argument('--low-frequency-cutoff', type=float, default=20.0)
+parser.add_argument('--analysis-chunk', type=int, default=8)
+parser.add_argument('--trim-padding', type=float, default=0.25)
+parser.add_argument('--psd-samples', type=int, default=9)
+parser.add_argument('--psd-segment-length', type=int, default=4)
+parser.add_argument('--psd-inverse-length', type=float, default=3.5)
+parser.add_argument('--psd-recompute-length', type=int, default=1)
+parser.add_argument('--increment', type=int, default=8)
+parser.add_argument('--chisq-bins', default='16')
+parser.add_argument('--snr-threshold', type=float, default=4.5)
+parser.add_argument('--newsnr-threshold', type=float, default=4.5)
+parser.add_argument('--max-batch-size', type=int, default=2**27)
+parser.add_argument('--ranking-statistic', default='quadsum')
+parser.add_argument('--sngl-ranking', default='newsnr')
+parser.add_argument('--timeslide-interval', type=float, default=0.1)
+parser.add_argument('--background-ifar-limit', type=float, default=100.)
+parser.add_argument('--work-dir',
+                    help='Directory for the synthetic frames and bank. '
+                         'A temporary directory is used if not given.')
+scheme.insert_processing_option_group(parser)
+fft.insert_fft_option_group(parser)
+args = parser.parse_args()
+
+scheme.verify_processing_options(args, parser)
+fft.verify_fft_options(args, parser)
+pycbc.init_logging(args.verbose)
+
+ctx = scheme.from_cli(args)
+fft.from_cli(args)
+
+work_dir = args.work_dir or tempfile.mkdtemp(prefix='pycbc_live_perf_')
+os.makedirs(work_dir, exist_ok=True)
+
+setup_time = {}
+
+bank_file = args.bank_file
+if bank_file is None:
+    bank_file = os.path.join(work_dir, 'bank.hdf')
+    make_bank(bank_file, args.num_templates, args.min_mass, args.max_mass,
+              args.seed)
+
+with ctx:
+    t0 = time.perf_counter()
+    total_pad = args.trim_padding * 2 + args.analysis_chunk
+    bank = pycbc.waveform.LiveFilterBank(
+        bank_file,
+        args.sample_rate,
+        total_pad,
+        low_frequency_cutoff=args.low_frequency_cutoff,
+        approximant=args.approximant,
+        increment=args.increment
+    )
+    bank.table.sort(order='mchirp')
+    waveforms = list(bank[0:len(bank)])
+    setup_time['template_generation'] = time.perf_counter() - t0
+
+    # The data buffer must hold the longest template and the PSD estimate
+    lengths = numpy.array([1.0 / wf.delta_f for wf in waveforms])
+    psd_len = args.psd_segment_length * (args.psd_samples // 2 + 1)
+    max_length = int(numpy.ceil(max(lengths.max(), psd_len))) + \
+        args.analysis_chunk
+
+    t0 = time.perf_counter()
+    sg_chisq = SingleDetSGChisq(bank, args.chisq_bins)
+    mf = LiveBatchMatchedFilter(
+        waveforms,
+        args.snr_threshold,
+        args.chisq_bins,
+        sg_chisq,
+        newsnr_threshold=args.newsnr_threshold,
+        maxelements=args.max_batch_size
+    )
+    setup_time['filter_setup'] = time.perf_counter() - t0
+
+    # Enough data to fill the PSD estimate and analyze the requested strides
+    psd_duration = (args.psd_samples - 1) // 2 * args.psd_segment_length
+    num_warmup = int(numpy.ceil((psd_duration + args.psd_inverse_length + 1)
+                                / args.analysis_chunk)) + 1
+    total_strides = num_warmup + args.num_strides
+    duration = (total_strides + 1) * args.analysis_chunk
+
+    t0 = time.perf_counter()
+    frame_src = {}
+    for i, ifo in enumerate(args.ifos):
+        channel = f'{ifo}:LIVE-PERF_STRAIN'
+        frame_src[ifo] = make_frames(
+            work_dir, ifo, channel, args.start_time, duration,
+            args.analysis_chunk, args.raw_sample_rate, args.psd_model,
+            args.seed + 1000 * (i + 1)
+        )
+    setup_time['frame_generation'] = time.perf_counter() - t0
+
+    data_reader = {}
+    for ifo in args.ifos:
+        data_reader[ifo] = StrainBuffer(
+            frame_src[ifo],
+            f'{ifo}:LIVE-PERF_STRAIN',
+            args.start_time,
+            max_buffer=max_length,
+            sample_rate=args.sample_rate,
+            low_frequency_cutoff=args.low_frequency_cutoff,
+            psd_samples=args.psd_samples,
+            psd_segment_length=args.psd_segment_length,
+            psd_inverse_length=args.psd_inverse_length,
+            trim_padding=args.trim_padding,
+            autogating_taper=0.25,
+            force_update_cache=False
+        )
+
+    coincers = []
+    if len(args.ifos) > 1:
+        for i, ifo0 in enumerate(args.ifos):
+            for ifo1 in args.ifos[i+1:]:
+                coincers.append(Coincer(
+                    len(bank),
+                    args.analysis_chunk,
+                    args.ranking_statistic,
+                    args.sngl_ranking,
+                    [],
+                    [ifo0, ifo1],
+                    ifar_limit=args.background_ifar_limit,
+                    timeslide_interval=args.timeslide_interval
+                ))
+
+    strides = []
+    psd_count = {ifo: 0 for ifo in args.ifos}
+    for stride in range(total_strides):
+        stage_time = {stage: 0. for stage in STAGES}
+        results = {}
+        live = []
+        for ifo in args.ifos:
+            results[ifo] = False
+            t0 = time.perf_counter()
+            status = data_reader[ifo].advance(args.analysis_chunk,
+                                              timeout=0)
+            stage_time['data_read'] += time.perf_counter() - t0
+
+            if status and psd_count[ifo] == 0:
+                t0 = time.perf_counter()
+                status = data_reader[ifo].recalculate_psd()
+                stage_time['psd_recalculation'] += time.perf_counter() - t0
+                psd_count[ifo] = args.psd_recompute_length - 1
+            elif not status:
+                psd_count[ifo] = 0
+            else:
+                psd_count[ifo] -= 1
+
+            if status:
+                t0 = time.perf_counter()
+                results[ifo] = mf.process_data(data_reader[ifo])
+                stage_time['matched_filter'] += time.perf_counter() - t0
+                live.append(ifo)
+
+        num_triggers = {ifo: len(results[ifo]['snr']) for ifo in live}
+        if len(live) > 1:
+            t0 = time.perf_counter()
+            for coincer in coincers:
+                coincer.add_singles(results)
+            stage_time['coincidence'] += time.perf_counter() - t0
+
+        stage_time['total'] = sum(stage_time[s] for s in STAGES)
+        throughput = None
+        if live and stage_time['matched_filter'] > 0:
+            throughput = len(bank) * len(live) / stage_time['matched_filter']
+
+        strides.append({
+            'stride': stride,
+            'end_time': data_reader[args.ifos[0]].end_time,
+            'analyzed': len(live) == len(args.ifos),
+            'live_detectors': live,
+            'num_triggers': num_triggers,
+            'stage_time': stage_time,
+            'templates_per_second': throughput,
+            'peak_rss': peak_rss(),
+        })
+        logging.info(
+            'Stride %d: %.3f s total, %s live detectors, peak RSS %.1f MB',
+            stride, stage_time['total'], ','.join(live) or 'no',
+            strides[-1]['peak_rss'] / 2**20
+        )
+
+summary = summarize(strides)
+output = {
+    'pycbc_version': version.git_verbose_msg,
+    'command_line': sys.argv,
+    'host': platform.node(),
+    'num_templates': len(bank),
+    'ifos': args.ifos,
+    'analysis_chunk': args.analysis_chunk,
+    'setup_time': setup_time,
+    'strides': strides,
+    'summary': summary,
+}
+with open(args.output_file, 'w') as outf:
+    json.dump(output, outf, indent=2)
+logging.info('Benchmark results written to %s', args.output_file)
+
+if args.work_dir is None:
+    shutil.rmtree(work_dir)
+
+if args.reference_file is not None:
+    with open(args.reference_file, 'r') as reff:
+        reference = json.load(reff)['summary']
+    regressions = compare(summary, reference, args.max_slowdown,
+                          args.min_stage_time)
+    for reg in regressions:
+        logging.error('Latency regression in %s', reg)
+    if regressions:
+        sys.exit(1)
+    logging.info('No latency regression with respect to %s',
+                 args.reference_file)